@@ -1,21 +1,17 @@
 import os
-import requests
-import pandas as pd
-from datetime import datetime
 import fnmatch
-import tkinter as tk
-from tkinter import messagebox
-from openpyxl import load_workbook, Workbook
-from office365.runtime.auth.client_credential import ClientCredential
-from office365.sharepoint.client_context import ClientContext
-from office365.sharepoint.files.file import File
 import sys
-
-def show_popup(title, message):
-    root = tk.Tk()
-    root.withdraw()
-    messagebox.showinfo(title, message)
-    root.destroy()
+import time
+from headless import add_file, fail, finish, new_summary, parse_args, show_popup
+from token_cache import cached_token_provider, get_token_cache_path, is_token_cache_enabled
+from chunk_reader import use_memory_map
+from chunk_tuning import create_chunk_tuner
+from content_hash import get_hash_algorithm, pop_hash
+from sharepoint_upload import upload_file_in_chunks, upload_single_file
+from upload_pool import get_large_file_threshold_mb
+from run_log import close_run_logs, open_run_log
+from transfer_metrics import get_metrics, write_run_metrics
+from run_trace import configure_tracing
 
 def read_config_file(file_path):
     config_values = {}
@@ -33,44 +29,38 @@ def read_config_file(file_path):
         error_msg = f"Config file '{file_path}' not found."
         print(error_msg)
         show_popup("Error", error_msg)
-        sys.exit(1)
+        fail(error_msg)
     except Exception as e:
         error_msg = f"Error reading config file: {str(e)}"
         print(error_msg)
         show_popup("Error", error_msg)
-        sys.exit(1)
+        fail(error_msg)
     return config_values
 
-def update_log_sheet(log_sheet, file_name, status):
-    log_sheet.insert_rows(2)
-    log_sheet['A2'] = file_name
-    log_sheet['B2'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_sheet['C2'] = status
-
 def log_result(log_file_path, file_name, status):
-    if os.path.exists(log_file_path):
-        workbook = load_workbook(log_file_path)
-        log_sheet = workbook.active
-    else:
-        workbook = Workbook()
-        log_sheet = workbook.active
-        log_sheet.append(['File Name', 'Timestamp', 'Status'])
-    
-    update_log_sheet(log_sheet, file_name, status)
-    workbook.save(log_file_path)
+    run_log = open_run_log({'LogFilePath': log_file_path}, create=True)
+    run_log.append(file_name, status)
 
 def is_file_large(file_path, max_size_mb=250):
-    
+    """Check if a file is larger than the specified size in MB."""
     file_size_mb = os.path.getsize(file_path) / (1024 * 1024)  # Convert bytes to MB
     return file_size_mb > max_size_mb
 
 def get_sharepoint_context_using_app(config_values):
+    # office365 is slow to import, so it is only loaded once a run actually connects
+    from office365.runtime.auth.client_credential import ClientCredential
+    from office365.sharepoint.client_context import ClientContext
+
     sharepoint_url = config_values.get('DestinationSiteURL')
     client_credentials = ClientCredential(
         config_values.get('Client Id'), 
         config_values.get('Client Secret')
     )
-    ctx = ClientContext(sharepoint_url).with_credentials(client_credentials)
+    if not is_token_cache_enabled(config_values):
+        return ClientContext(sharepoint_url).with_credentials(client_credentials)
+    # Reuse the token from earlier runs while it is fresh instead of a cold credential exchange
+    token_provider = cached_token_provider(sharepoint_url, client_credentials, get_token_cache_path(config_values))
+    ctx = ClientContext(sharepoint_url).with_access_token(token_provider)
     return ctx
 
 def get_config_values(file_path=None):
@@ -82,9 +72,11 @@ def get_config_values(file_path=None):
         error_msg = f"ERROR: Config file not found at {config_file_path}"
         print(error_msg)
         show_popup("Config File Error", error_msg)
-        sys.exit(1)
+        fail(error_msg)
 
     config_values = read_config_file(config_file_path)
+
+    configure_tracing(config_values)
     
     if file_path:
         config_values['SourceFolderPath'] = os.path.dirname(file_path)
@@ -94,159 +86,154 @@ def get_config_values(file_path=None):
             error_msg = "Source folder path or file name pattern is missing in the config file."
             print(error_msg)
             show_popup("Config File Error", error_msg)
-            sys.exit(1)
+            fail(error_msg)
 
     config_values['TargetFolderURL'] = config_values.get('DestinationFolderURL')
     config_values['LogFilePath'] = config_values.get('LogFilePath')
 
     return config_values
 
-def upload_small_files(file_path, config_values):
-    ctx = get_sharepoint_context_using_app(config_values)
+def upload_small_files(file_path, config_values, ctx=None):
+    if ctx is None:
+        ctx = get_sharepoint_context_using_app(config_values)
     target_folder_url = config_values['TargetFolderURL']
     target_folder = ctx.web.get_folder_by_server_relative_url(target_folder_url)
 
-    log_file_path = config_values['LogFilePath']
-    log_workbook = load_workbook(log_file_path) if log_file_path and os.path.exists(log_file_path) else None
-    log_sheet = log_workbook.active if log_workbook else None
+    run_log = open_run_log(config_values)
 
     print(f"Target folder URL: {target_folder_url}")
 
+    started_at = time.monotonic()
     try:
         file_name = os.path.basename(file_path)
         print(f"\nProcessing file: {file_name}")
-        with open(file_path, 'rb') as file_content:
-            target_folder.upload_file(file_name, file_content).execute_query()
-            print(f"File '{file_name}' uploaded successfully.")
-            if log_sheet:
-                update_log_sheet(log_sheet, file_name, "Successful")
-                log_workbook.save(log_file_path)
+        file_size = os.path.getsize(file_path)
+        # Files too big to send whole in one request go through an upload session
+        upload_single_file(ctx, target_folder, file_path, file_name, file_size, config_values)
+        hashes = pop_hash(file_path)
+        print(f"File '{file_name}' uploaded successfully.")
+        get_metrics().record_file(file_name, file_size, time.monotonic() - started_at)
+        if run_log:
+            run_log.append(file_name, "Successful", **hashes)
     except Exception as e:
         error_msg = f"Failed to upload {file_name}: {str(e)}"
         print(error_msg)
-        if log_sheet:
-            update_log_sheet(log_sheet, file_name, "Failed")
-            log_workbook.save(log_file_path)
+        get_metrics().record_file(file_name, 0, time.monotonic() - started_at, ok=False)
+        if run_log:
+            run_log.append(file_name, "Failed")
+        raise
 
-def upload_large_files(file_path, config_values):
+def upload_large_files(file_path, config_values, ctx=None):
     """
-    Uploads large files to SharePoint in chunks of 50MB.
+    Uploads large files to SharePoint in chunks of 50MB, or of an adaptively
+    tuned size when ChunkSizeMB=auto is set in the config.
 
     Args:
         file_path (str): Path to the file to upload.
         config_values (dict): Configuration values for SharePoint and logging.
+        ctx (ClientContext): Shared context; a new one is created if omitted.
     """
-    ctx = get_sharepoint_context_using_app(config_values)
+    if ctx is None:
+        ctx = get_sharepoint_context_using_app(config_values)
     target_folder_url = config_values['TargetFolderURL']
     target_folder = ctx.web.get_folder_by_server_relative_url(target_folder_url)
 
-    log_file_path = config_values['LogFilePath']
-    log_workbook = load_workbook(log_file_path) if log_file_path and os.path.exists(log_file_path) else None
-    log_sheet = log_workbook.active if log_workbook else None
+    run_log = open_run_log(config_values)
 
     print(f"Target folder URL: {target_folder_url}")
 
+    started_at = time.monotonic()
+    file_size = 0
     try:
         file_name = os.path.basename(file_path)
         print(f"\nProcessing large file: {file_name}")
 
-        # Open the file and upload in chunks
         file_size = os.path.getsize(file_path)
-        chunk_size = 50 * 1024 * 1024  # 50MB
-        offset = 0  # Initialize offset to track progress
-
-        with open(file_path, 'rb') as file_content:
-            # Start the upload session
-            first_chunk = file_content.read(chunk_size)
-            uploaded_file = target_folder.files.add(file_name, first_chunk, overwrite=True).execute_query()
-            upload_id = uploaded_file.unique_id
-
-            offset += len(first_chunk)
-            print(f"Uploaded first chunk: {offset}/{file_size} bytes")
-
-            # Continue uploading chunks
-            while offset < file_size:
-                chunk_data = file_content.read(chunk_size)
-                if not chunk_data:
-                    break
-
-                if offset + len(chunk_data) < file_size:
-                    # Continue uploading intermediate chunks
-                    uploaded_file = uploaded_file.continue_upload(upload_id, offset, chunk_data).execute_query()
-                else:
-                    # Finalize the upload with the last chunk
-                    uploaded_file = uploaded_file.finish_upload(upload_id, offset, chunk_data).execute_query()
-
-                offset += len(chunk_data)
-                print(f"Uploaded chunk: {offset}/{file_size} bytes")
-
+        chunk_tuner = create_chunk_tuner(config_values, ctx.base_url, 50)  # 50MB default
+        # One upload session for the whole file; chunks are zero-copy slices of a memory map
+        upload_file_in_chunks(ctx, target_folder, file_path, file_name, chunk_tuner=chunk_tuner,
+                              use_mapped=use_memory_map(config_values), file_size=file_size,
+                              content_hash=get_hash_algorithm(config_values))
+        hashes = pop_hash(file_path)
         print(f"Large file '{file_name}' uploaded successfully.")
-        if log_sheet:
-            update_log_sheet(log_sheet, file_name, "Successful")
-            log_workbook.save(log_file_path)
+        get_metrics().record_file(file_name, file_size, time.monotonic() - started_at)
+        if run_log:
+            run_log.append(file_name, "Successful", **hashes)
     except Exception as e:
         error_msg = f"Failed to upload large file '{file_name}': {str(e)}"
         print(error_msg)
-        if log_sheet:
-            update_log_sheet(log_sheet, file_name, "Failed")
-            log_workbook.save(log_file_path)
+        get_metrics().record_file(file_name, file_size, time.monotonic() - started_at, ok=False)
+        if run_log:
+            run_log.append(file_name, "Failed")
         raise
 
 if __name__ == "__main__":
+    args = parse_args("Upload a file, or every matching file in the source folder, to SharePoint.")
     success_count = 0
     failure_count = 0
     processed_files = []
+    summary = new_summary()
 
-    if len(sys.argv) > 1:
+    if args.file_path:
         # Process a single file provided as an argument
-        file_path = sys.argv[1]
+        file_path = args.file_path
         config_values = get_config_values(file_path)
-        if is_file_large(file_path):
+        ctx = get_sharepoint_context_using_app(config_values)
+        if is_file_large(file_path, get_large_file_threshold_mb(config_values)):
             print(f"The file '{file_path}' is large. Executing 'upload_large_files'.")
             try:
-                upload_large_files(file_path, config_values)
+                upload_large_files(file_path, config_values, ctx)
                 success_count += 1  # Increment only if no exception occurs
                 processed_files.append(f"Success (Large): {file_path}")
+                add_file(summary, file_path, 'Successful')
             except Exception as e:
                 failure_count += 1
                 processed_files.append(f"Failed (Large): {file_path} - {str(e)}")
+                add_file(summary, file_path, 'Failed', str(e))
         else:
             print(f"The file '{file_path}' is small. Executing 'upload_small_files'.")
             try:
-                upload_small_files(file_path, config_values)
+                upload_small_files(file_path, config_values, ctx)
                 success_count += 1  # Increment only if no exception occurs
                 processed_files.append(f"Success: {file_path}")
+                add_file(summary, file_path, 'Successful')
             except Exception as e:
                 failure_count += 1
                 processed_files.append(f"Failed: {file_path} - {str(e)}")
+                add_file(summary, file_path, 'Failed', str(e))
     else:
         # Process all files in the source folder
         print("No file path provided. Processing all files in the source folder.")
         config_values = get_config_values()
+        ctx = get_sharepoint_context_using_app(config_values)  # One context for every file
         source_folder_path = config_values['SourceFolderPath']
         wildcard_pattern = config_values['FileName']
         
         for file_name in os.listdir(source_folder_path):
             if fnmatch.fnmatch(file_name, wildcard_pattern):
                 file_path = os.path.join(source_folder_path, file_name)
-                if is_file_large(file_path):
+                if is_file_large(file_path, get_large_file_threshold_mb(config_values)):
                     print(f"The file '{file_name}' is large. Executing 'upload_large_files'.")
                     try:
-                        upload_large_files(file_path, config_values)
+                        upload_large_files(file_path, config_values, ctx)
                         success_count += 1  # Increment only if no exception occurs
                         processed_files.append(f"Success (Large): {file_name}")
+                        add_file(summary, file_name, 'Successful')
                     except Exception as e:
                         failure_count += 1
                         processed_files.append(f"Failed (Large): {file_name} - {str(e)}")
+                        add_file(summary, file_name, 'Failed', str(e))
                 else:
                     print(f"The file '{file_name}' is small. Executing 'upload_small_files'.")
                     try:
-                        upload_small_files(file_path, config_values)
+                        upload_small_files(file_path, config_values, ctx)
                         success_count += 1  # Increment only if no exception occurs
                         processed_files.append(f"Success: {file_name}")
+                        add_file(summary, file_name, 'Successful')
                     except Exception as e:
                         failure_count += 1
                         processed_files.append(f"Failed: {file_name} - {str(e)}")
+                        add_file(summary, file_name, 'Failed', str(e))
 
     # Show summary popup
     summary_message = (
@@ -256,5 +243,9 @@ if __name__ == "__main__":
         f"Failed: {failure_count}\n\n"
         f"Details:\n" + "\n".join(processed_files)
     )
+    close_run_logs()  # Flush the run log and export it to the xlsx log once
+    write_run_metrics(config_values)
     print(summary_message)  # Print summary to console
     show_popup("Execution Summary", summary_message)
+    summary.update(success=success_count, failed=failure_count)
+    finish(summary)
@@ -0,0 +1,464 @@
+import asyncio
+import json
+import ssl
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from urllib.parse import quote, urlsplit
+
+from bandwidth_limit import configure_bandwidth_limit, get_bandwidth_limiter
+from chunk_tuning import create_chunk_tuner
+from content_hash import check_remote_hash, get_hash_algorithm, new_hash, remember
+from sharepoint_upload import get_single_request_max_size
+from throttling import get_throttle_controller
+from transfer_metrics import get_metrics
+from upload_journal import get_staging_url
+from upload_pool import ensure_folder, get_worker_folder
+
+DEFAULT_MAX_CONNECTIONS = 16
+DEFAULT_MAX_IN_FLIGHT = 100
+MAX_HEADER_LINE = 64 * 1024
+# Seconds to open a connection, and to wait on any single send or read before giving up on it
+CONNECT_TIMEOUT_SECONDS = 30
+IO_TIMEOUT_SECONDS = 120
+
+def _get_count(config_values, key, default):
+    value = config_values.get(key)
+    if not value:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        print(f"Invalid {key} '{value}', using {default}")
+        return default
+
+def get_max_connections(config_values):
+    return _get_count(config_values, 'MaxConnectionsPerSite', DEFAULT_MAX_CONNECTIONS)
+
+def get_max_in_flight(config_values):
+    return _get_count(config_values, 'MaxInFlightUploads', DEFAULT_MAX_IN_FLIGHT)
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _odata_string(value):
+    """A value for a quoted OData argument, percent-encoded for the request path."""
+    return quote(value.replace("'", "''"), safe="/")
+
+class SharePointRequestError(Exception):
+    """An HTTP error from SharePoint. response mimics requests' Response for get_throttle_details."""
+
+    def __init__(self, status_code, headers, body):
+        self.response = SimpleNamespace(status_code=status_code,
+                                        headers={'Retry-After': headers.get('retry-after')})
+        try:
+            message = json.loads(body)['error']['message']['value']
+        except (ValueError, KeyError, TypeError):
+            message = body[:200].decode('utf-8', 'replace')
+        super().__init__(f"HTTP {status_code}: {message}")
+
+class ConnectionPool:
+    """Keep-alive HTTP/1.1 connections to one host, at most max_connections at a time.
+
+    A request borrows an idle connection (or opens one while under the cap),
+    and gives it back when the response has been read in full; on any error
+    or timeout the connection is closed instead. A reused connection the
+    server has meanwhile closed is retried once on a new one.
+    """
+
+    def __init__(self, base_url, max_connections, connect_timeout=CONNECT_TIMEOUT_SECONDS,
+                 io_timeout=IO_TIMEOUT_SECONDS):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.host_header = parts.netloc
+        self.ssl_context = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.connect_timeout = connect_timeout
+        self.io_timeout = io_timeout
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle = []
+        self.opened = 0
+        self.requests = 0
+
+    async def _connect(self):
+        self.opened += 1
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.ssl_context, limit=MAX_HEADER_LINE),
+            self.connect_timeout)
+
+    def _io(self, awaitable):
+        return asyncio.wait_for(awaitable, self.io_timeout)
+
+    async def request(self, method, target, headers, body=b''):
+        async with self._slots:
+            for attempt in range(2):
+                reused = bool(self._idle)
+                reader, writer = self._idle.pop() if reused else await self._connect()
+                keep = False
+                try:
+                    status, response_headers, data = await self._exchange(reader, writer, method, target,
+                                                                          headers, body)
+                    keep = response_headers.get('connection', '').lower() != 'close'
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                finally:
+                    if keep:
+                        self._idle.append((reader, writer))
+                    else:
+                        writer.close()
+                self.requests += 1
+                return status, response_headers, data
+
+    async def _read_headers(self, reader):
+        headers = {}
+        while True:
+            line = await self._io(reader.readline())
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def _read_chunked(self, reader):
+        parts = []
+        while True:
+            size_line = await self._io(reader.readline())
+            if not size_line:
+                raise asyncio.IncompleteReadError(b''.join(parts), None)
+            size = int(size_line.split(b';')[0].strip(), 16)
+            if size == 0:
+                # Trailer fields, if any, up to the blank line that ends the message
+                await self._read_headers(reader)
+                return b''.join(parts)
+            parts.append(await self._io(reader.readexactly(size)))
+            await self._io(reader.readline())
+
+    async def _exchange(self, reader, writer, method, target, headers, body):
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host_header}",
+                 f"Content-Length: {len(body)}", "Connection: keep-alive"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        if body:
+            writer.write(body)
+        await self._io(writer.drain())
+
+        while True:
+            status_line = await self._io(reader.readline())
+            if not status_line:
+                raise ConnectionResetError("connection closed before the response")
+            status = int(status_line.split()[1])
+            response_headers = await self._read_headers(reader)
+            # Interim 1xx responses (100 Continue) come before the real one
+            if status >= 200:
+                break
+
+        transfer_encoding = response_headers.get('transfer-encoding', '').lower()
+        if method == 'HEAD' or status in (204, 304):
+            data = b''
+        elif transfer_encoding:
+            # Transfer-Encoding wins over Content-Length; only a final chunked coding frames the body
+            if transfer_encoding.split(',')[-1].strip() != 'chunked':
+                raise ValueError(f"unsupported Transfer-Encoding: {transfer_encoding}")
+            data = await self._read_chunked(reader)
+        elif 'content-length' in response_headers:
+            data = await self._io(reader.readexactly(int(response_headers['content-length'])))
+        else:
+            data = await self._io(reader.read())
+            response_headers['connection'] = 'close'
+        return status, response_headers, data
+
+    async def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+class AsyncSharePointClient:
+    """The SharePoint REST calls of the upload paths, on a connection pool.
+
+    Covers Files/add (small uploads and the empty file a session starts
+    from), StartUpload, ContinueUpload, FinishUpload, CancelUpload, moving
+    and deleting a file. Authentication
+    headers come from ctx, so the signed-in context (and its token cache)
+    is reused rather than signing in again. Every call goes through the
+    shared throttle controller's retry policy.
+    """
+
+    def __init__(self, ctx, max_connections):
+        self.ctx = ctx
+        self.site_url = ctx.base_url.rstrip('/')
+        self.site_path = urlsplit(self.site_url).path
+        self.pool = ConnectionPool(self.site_url, max_connections)
+
+    def _auth_headers(self):
+        from office365.runtime.http.request_options import RequestOptions
+
+        request = RequestOptions(f"{self.site_url}/_api/web")
+        self.ctx.authentication_context.authenticate_request(request)
+        return dict(request.headers)
+
+    async def _call(self, method, api_path, body=b'', description="request", extra_headers=None):
+        target = f"{self.site_path}/_api/{api_path}"
+        loop = asyncio.get_running_loop()
+
+        async def attempt():
+            # Signing may fetch a new token over the network, so it runs off the event loop
+            headers = await loop.run_in_executor(None, self._auth_headers)
+            headers['Accept'] = 'application/json;odata=nometadata'
+            headers.update(extra_headers or {})
+            status, response_headers, data = await self.pool.request(method, target, headers, body)
+            if status >= 400:
+                raise SharePointRequestError(status, response_headers, data)
+            return json.loads(data) if data else {}
+
+        return await get_throttle_controller().call_async(attempt, description)
+
+    async def upload_file(self, folder_url, file_name, content):
+        return await self._call(
+            'POST',
+            f"web/GetFolderByServerRelativeUrl('{_odata_string(folder_url)}')"
+            f"/Files/add(url='{_odata_string(file_name)}',overwrite=true)",
+            content, "upload")
+
+    async def start_upload(self, file_url, upload_id, first_chunk):
+        """Start an upload session on the (empty) file at file_url with the first chunk."""
+        return await self._call(
+            'POST',
+            f"web/GetFileByServerRelativeUrl('{_odata_string(file_url)}')/StartUpload(uploadId=guid'{upload_id}')",
+            first_chunk, "upload session")
+
+    async def continue_upload(self, file_url, upload_id, offset, chunk):
+        return await self._call(
+            'POST',
+            f"web/GetFileByServerRelativeUrl('{_odata_string(file_url)}')"
+            f"/ContinueUpload(uploadId=guid'{upload_id}',fileOffset={offset})",
+            chunk, "chunk")
+
+    async def finish_upload(self, file_url, upload_id, offset, chunk):
+        return await self._call(
+            'POST',
+            f"web/GetFileByServerRelativeUrl('{_odata_string(file_url)}')"
+            f"/FinishUpload(uploadId=guid'{upload_id}',fileOffset={offset})",
+            chunk, "chunk")
+
+    async def move_file(self, file_url, new_url):
+        """Move file_url to new_url, replacing a file already there."""
+        return await self._call(
+            'POST',
+            f"web/GetFileByServerRelativeUrl('{_odata_string(file_url)}')"
+            f"/moveto(newurl='{_odata_string(new_url)}',flags=1)",
+            description="move")
+
+    async def cancel_upload(self, file_url, upload_id):
+        return await self._call(
+            'POST',
+            f"web/GetFileByServerRelativeUrl('{_odata_string(file_url)}')/CancelUpload(uploadId=guid'{upload_id}')",
+            description="cancel upload")
+
+    async def delete_file(self, file_url):
+        return await self._call(
+            'POST', f"web/GetFileByServerRelativeUrl('{_odata_string(file_url)}')",
+            description="delete", extra_headers={'X-HTTP-Method': 'DELETE', 'IF-MATCH': '*'})
+
+    async def close(self):
+        await self.pool.close()
+
+class AsyncUploader:
+    """Uploads files with AsyncSharePointClient, one task per file.
+
+    Files up to SingleRequestMaxMB are sent in one request; larger ones go
+    through an upload session, reading the next chunk on a helper thread
+    while the current one is sent. Disk reads and hashing never run on the
+    event loop thread. A session uploads to a staging file that replaces
+    the destination when complete; a failed session is cancelled and its
+    staging file removed.
+    Content hashing, the bandwidth limit and chunk tuning apply as on the
+    threaded paths.
+    """
+
+    def __init__(self, client, config_values):
+        self.client = client
+        self.config_values = config_values
+        self.single_request_max_size = get_single_request_max_size(config_values)
+        self.content_hash = get_hash_algorithm(config_values)
+        configure_bandwidth_limit(config_values)
+        self._ensured = set()
+
+    async def _wait_for_bandwidth(self, byte_count):
+        if not get_bandwidth_limiter().schedule.is_unlimited():
+            await asyncio.get_running_loop().run_in_executor(None, get_bandwidth_limiter().acquire, byte_count)
+
+    async def _ensure_folder(self, folder_url):
+        # Folder creation is rare, so it reuses the office365 path on a helper thread
+        if folder_url in self._ensured:
+            return
+        ctx = self.client.ctx
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: ensure_folder(get_worker_folder(ctx, folder_url)[0], folder_url))
+        self._ensured.add(folder_url)
+
+    async def upload(self, target_folder_url, file_name, full_path, file_size):
+        sub_folder, _, base_name = file_name.rpartition('/')
+        folder_url = f"{target_folder_url}/{sub_folder}" if sub_folder else target_folder_url
+        if sub_folder:
+            await self._ensure_folder(folder_url)
+        started_at = time.monotonic()
+        try:
+            if file_size > self.single_request_max_size:
+                await self._upload_chunked(folder_url, base_name, full_path, file_size)
+            else:
+                await self._upload_small(folder_url, base_name, full_path, file_size)
+        except Exception:
+            get_metrics().record_file(file_name, file_size, time.monotonic() - started_at, ok=False)
+            raise
+        get_metrics().record_file(file_name, file_size, time.monotonic() - started_at)
+
+    async def _upload_small(self, folder_url, file_name, full_path, file_size):
+        loop = asyncio.get_running_loop()
+        content = await loop.run_in_executor(None, _read_file, full_path)
+        await self._wait_for_bandwidth(len(content))
+        result = await self.client.upload_file(folder_url, file_name, content)
+        await loop.run_in_executor(None, self._finish_hash, full_path, [content], result)
+
+    def _finish_hash(self, full_path, parts, result, hasher=None):
+        if not self.content_hash:
+            return
+        if hasher is None:
+            hasher = new_hash(self.content_hash)
+            for part in parts:
+                hasher.update(part)
+        digest = hasher.hexdigest()
+        check_remote_hash(SimpleNamespace(properties=result), self.content_hash, digest)
+        remember(full_path, self.content_hash, digest)
+
+    async def _upload_chunked(self, folder_url, file_name, full_path, file_size):
+        loop = asyncio.get_running_loop()
+        chunk_tuner = create_chunk_tuner(self.config_values, self.client.site_url, 10)
+        hasher = new_hash(self.content_hash) if self.content_hash else None
+        print(f"Starting chunked upload for '{file_name}' ({file_size / 1024 / 1024:.2f} MB)")
+        file_url = f"{folder_url}/{file_name}"
+        # The session writes to a staging file that replaces file_url only once it is complete
+        upload_id = str(uuid.uuid4())
+        staging_url = get_staging_url(file_url, upload_id)
+        created = False
+        try:
+            with open(full_path, 'rb') as f:
+                next_read = loop.run_in_executor(None, f.read, chunk_tuner.next_size())
+                offset = 0
+                result = None
+                while True:
+                    chunk = await next_read
+                    if not chunk:
+                        raise OSError(f"{full_path} shrank to {offset} bytes during upload")
+                    is_last = offset + len(chunk) >= file_size
+                    if not is_last:
+                        # Read the next chunk while this one is on the wire
+                        next_read = loop.run_in_executor(None, f.read, chunk_tuner.next_size())
+                    # ...and hash it on another helper thread at the same time
+                    hashing = loop.run_in_executor(None, hasher.update, chunk) if hasher else None
+                    await self._wait_for_bandwidth(len(chunk))
+                    started_at = time.monotonic()
+                    if not created and is_last:
+                        result = await self.client.upload_file(folder_url, file_name, chunk)
+                    elif not created:
+                        await self.client.upload_file(folder_url, staging_url.rsplit('/', 1)[1], b'')
+                        created = True
+                        await self.client.start_upload(staging_url, upload_id, chunk)
+                    elif is_last:
+                        result = await self.client.finish_upload(staging_url, upload_id, offset, chunk)
+                        await self.client.move_file(staging_url, file_url)
+                    else:
+                        await self.client.continue_upload(staging_url, upload_id, offset, chunk)
+                    elapsed = time.monotonic() - started_at
+                    if hashing:
+                        await hashing
+                    chunk_tuner.record(len(chunk), elapsed)
+                    get_metrics().record_chunk(len(chunk), elapsed)
+                    offset += len(chunk)
+                    if is_last:
+                        break
+        except Exception:
+            if created:
+                await self._cancel(staging_url, upload_id)
+            raise
+        chunk_tuner.save()
+        self._finish_hash(full_path, (), result or {}, hasher)
+        print(f"Successfully uploaded '{file_name}'")
+
+    async def _cancel(self, file_url, upload_id):
+        """Cancel a failed session and remove the file it was started on."""
+        try:
+            await self.client.cancel_upload(file_url, upload_id)
+        except Exception as cleanup_error:
+            print(f"Could not cancel the upload session: {str(cleanup_error)}")
+        try:
+            await self.client.delete_file(file_url)
+        except Exception as cleanup_error:
+            print(f"Could not remove '{file_url}': {str(cleanup_error)}")
+
+def _produce(pending_files, loop, queue, stopped):
+    """Feed pending_files into queue from a helper thread, then None, or the error that ended the scan."""
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    try:
+        for item in pending_files:
+            if stopped.is_set():
+                return
+            put(item)
+        put(None)
+    except Exception as e:
+        # Also how a put ends when the run has stopped and the loop cancelled it
+        if not stopped.is_set():
+            put(e)
+
+async def _run_uploads(ctx, config_values, target_folder_url, pending_files, on_result):
+    client = AsyncSharePointClient(ctx, get_max_connections(config_values))
+    uploader = AsyncUploader(client, config_values)
+    max_in_flight = get_max_in_flight(config_values)
+    tasks = {}
+    # Scanning, manifest checks and index lookups block, so they run on a producer thread
+    queue = asyncio.Queue(max_in_flight)
+    stopped = threading.Event()
+    threading.Thread(target=_produce, args=(pending_files, asyncio.get_running_loop(), queue, stopped),
+                     daemon=True).start()
+
+    def report(done):
+        for task in done:
+            file_name = tasks.pop(task)
+            error = task.exception()
+            on_result(file_name, error)
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            file_name, full_path, file_size = item
+            if len(tasks) >= max_in_flight:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                report(done)
+            task = asyncio.ensure_future(uploader.upload(target_folder_url, file_name, full_path, file_size))
+            tasks[task] = file_name
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            report(done)
+    finally:
+        stopped.set()
+        await client.close()
+    print(f"Async engine: {client.pool.requests} request(s) over {client.pool.opened} connection(s)")
+
+def run_async_uploads(ctx, config_values, target_folder_url, pending_files, on_result):
+    """Drop-in for run_upload_pool that runs every upload on one event loop thread.
+
+    Up to MaxInFlightUploads files are in flight at once, sharing at most
+    MaxConnectionsPerSite keep-alive connections. pending_files is consumed
+    on a producer thread, so a slow scan never stalls the event loop; any
+    callbacks it makes run on that thread. on_result(file_name, error) is
+    called on the calling thread as each file finishes, as with the pool.
+    """
+    asyncio.run(_run_uploads(ctx, config_values, target_folder_url, pending_files, on_result))
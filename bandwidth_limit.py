@@ -0,0 +1,137 @@
+import re
+import threading
+import time
+from datetime import datetime
+from transfer_metrics import get_metrics
+
+# Tokens a full bucket holds, in seconds of the current rate
+BURST_SECONDS = 1.0
+# Longest single sleep, so a schedule change takes effect within about a second
+MAX_SLEEP_SECONDS = 1.0
+RULE_PATTERN = re.compile(r'^(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(.+)$')
+
+def parse_rate(value):
+    """Mbit/s as bytes per second; unlimited, none, off or 0 mean no limit (None)."""
+    value = value.strip().lower()
+    if value in ('unlimited', 'none', 'off', ''):
+        return None
+    value = re.sub(r'\s*mbit(/s|ps)?$', '', value)
+    rate = float(value)
+    return rate * 1000 * 1000 / 8 if rate > 0 else None
+
+class BandwidthSchedule:
+    """Upload rate by time of day.
+
+    rules are (start_minute, end_minute, bytes_per_second) with minutes
+    since midnight; a rule whose end is before its start runs past
+    midnight. The first matching rule wins, otherwise default applies.
+    A rate of None means unlimited.
+    """
+
+    def __init__(self, rules=(), default=None):
+        self.rules = list(rules)
+        self.default = default
+
+    @classmethod
+    def parse(cls, text):
+        """Parse BandwidthLimit, e.g. '08:00-18:00=20; unlimited' or just '50' (Mbit/s)."""
+        rules = []
+        default = None
+        for part in re.split(r'[;,]', text or ''):
+            part = part.strip()
+            if not part:
+                continue
+            rule = RULE_PATTERN.match(part)
+            if rule:
+                start_hour, start_minute, end_hour, end_minute, rate = rule.groups()
+                rules.append((int(start_hour) * 60 + int(start_minute), int(end_hour) * 60 + int(end_minute),
+                              parse_rate(rate)))
+            else:
+                default = parse_rate(part)
+        return cls(rules, default)
+
+    def rate_at(self, when=None):
+        when = when or datetime.now()
+        minute = when.hour * 60 + when.minute
+        for start, end, rate in self.rules:
+            if start <= end and start <= minute < end:
+                return rate
+            if start > end and (minute >= start or minute < end):
+                return rate
+        return self.default
+
+    def is_unlimited(self):
+        return self.default is None and all(rate is None for _, _, rate in self.rules)
+
+class BandwidthLimiter:
+    """Token bucket shared by every upload thread in the process.
+
+    acquire(n) blocks until n bytes may be sent. The rate is looked up in
+    the schedule on every refill, so a limit that starts or ends mid-upload
+    applies to the next chunk of every transfer without restarting any of
+    them. Requests larger than the bucket are taken in bucket-sized parts.
+    """
+
+    def __init__(self, schedule=None):
+        self._lock = threading.Lock()
+        self.schedule = schedule or BandwidthSchedule()
+        self._tokens = 0.0
+        self._updated_at = time.monotonic()
+        self._rate = None
+
+    def configure(self, schedule):
+        with self._lock:
+            self.schedule = schedule
+
+    def _current_rate(self, now):
+        rate = self.schedule.rate_at()
+        if rate != self._rate:
+            print("Bandwidth limit: " + (f"{rate * 8 / 1000 / 1000:g} Mbit/s" if rate else "unlimited"))
+            self._rate = rate
+            self._tokens = 0.0
+            self._updated_at = now
+        return rate
+
+    def acquire(self, byte_count):
+        waited = 0.0
+        remaining = byte_count
+        while remaining > 0:
+            with self._lock:
+                now = time.monotonic()
+                rate = self._current_rate(now)
+                if rate is None:
+                    break
+                capacity = rate * BURST_SECONDS
+                self._tokens = min(capacity, self._tokens + (now - self._updated_at) * rate)
+                self._updated_at = now
+                part = min(remaining, capacity)
+                if self._tokens >= part:
+                    self._tokens -= part
+                    remaining -= part
+                    continue
+                delay = min(MAX_SLEEP_SECONDS, (part - self._tokens) / rate)
+            time.sleep(delay)
+            waited += delay
+        if waited:
+            get_metrics().add_time('bandwidth_wait', waited)
+
+_limiter = BandwidthLimiter()
+_configured_text = None
+
+def configure_bandwidth_limit(config_values):
+    """Apply the BandwidthLimit schedule from config to the process-wide limiter."""
+    global _configured_text
+    text = config_values.get('BandwidthLimit') if config_values else None
+    if not text or text == _configured_text:
+        return
+    try:
+        schedule = BandwidthSchedule.parse(text)
+    except ValueError:
+        print(f"Invalid BandwidthLimit '{text}', uploads are not rate limited")
+        return
+    _configured_text = text
+    _limiter.configure(schedule)
+
+def get_bandwidth_limiter():
+    """Return the process-wide limiter shared by all upload paths."""
+    return _limiter
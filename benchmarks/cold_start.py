@@ -0,0 +1,85 @@
+"""Cold-start benchmark for the upload scripts.
+
+Each script is imported in a fresh interpreter several times and the
+median wall time is reported. The run fails (exit code 1) when a script
+pulls in one of HEAVY_MODULES at import time, or when its median goes over
+the budget, so a stray top-level import of office365, tkinter or openpyxl
+shows up here before it slows every scheduled job down.
+
+    python benchmarks/cold_start.py [--runs 10] [--budget-ms 250] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ['upload', 'adjustment_upload', 'New_Version']
+HEAVY_MODULES = ['office365', 'tkinter', 'openpyxl', 'pandas', 'requests', 'watchdog', 'cryptography']
+
+PROBE = (
+    "import sys; import {module}; "
+    "print(','.join(m for m in {heavy!r} if m in sys.modules))"
+)
+
+def measure(module, runs):
+    """Return (median seconds, heavy modules imported) for a cold import of module."""
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    timings = []
+    loaded = ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR,
+                                capture_output=True, text=True)
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+        loaded = result.stdout.strip()
+    return statistics.median(timings), [name for name in loaded.split(',') if name]
+
+def baseline(runs):
+    """Median start-up of a bare interpreter, so results can be read as overhead."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of the upload scripts.")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=250.0,
+                        help="fail when a script's median import time (over a bare interpreter) exceeds this")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    interpreter = baseline(args.runs)
+    results = []
+    for module in SCRIPTS:
+        median, heavy = measure(module, args.runs)
+        overhead_ms = max(0.0, (median - interpreter) * 1000)
+        results.append({
+            'script': module,
+            'median_ms': round(median * 1000, 1),
+            'overhead_ms': round(overhead_ms, 1),
+            'heavy_imports': heavy,
+            'ok': not heavy and overhead_ms <= args.budget_ms,
+        })
+
+    if args.json:
+        print(json.dumps({'interpreter_ms': round(interpreter * 1000, 1), 'results': results}))
+    else:
+        print(f"Bare interpreter: {interpreter * 1000:.1f} ms (median of {args.runs})")
+        for result in results:
+            status = 'ok' if result['ok'] else 'FAIL'
+            heavy = f", imports {', '.join(result['heavy_imports'])}" if result['heavy_imports'] else ''
+            print(f"{result['script']:<18} {result['median_ms']:7.1f} ms "
+                  f"(+{result['overhead_ms']:.1f} ms){heavy}  {status}")
+    return 0 if all(result['ok'] for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
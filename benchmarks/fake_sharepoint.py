@@ -0,0 +1,447 @@
+"""Local stand-in for the SharePoint REST endpoints the upload scripts use.
+
+Implements just enough of /_api for the office365 client: form digest,
+folder lookup and creation, Files/add, StartUpload / ContinueUpload /
+FinishUpload / CancelUpload / GetUploadStatus, file metadata, deletes,
+paged folder listings, library items and change logs (GetList), and
+$batch requests of Files/add. Uploaded content is counted, not kept, so
+large files cost no memory. Latency, a shared bandwidth cap and random
+429s can be injected to see how the upload paths behave on a slow or busy
+tenant.
+
+    python benchmarks/fake_sharepoint.py --port 8765 --latency-ms 40 --bandwidth-mbps 200 --throttle-rate 0.02
+
+Point a context at http://127.0.0.1:8765/sites/<name> with any access token.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+READ_BLOCK_SIZE = 1024 * 1024
+# Request line and headers of one request inside a $batch body; its content follows
+INNER_REQUEST = re.compile(rb'(?:POST|GET) (\S+) HTTP/1\.1\r\n(.*?)\r\n\r\n', re.DOTALL)
+
+class Bandwidth:
+    """Shared link capacity: every request body queues behind the bytes before it."""
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._free_at = time.monotonic()
+
+    def consume(self, size):
+        if not self.bytes_per_second:
+            return
+        with self._lock:
+            start = max(self._free_at, time.monotonic())
+            self._free_at = start + size / self.bytes_per_second
+            done_at = self._free_at
+        delay = done_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+class FakeSharePoint:
+    """In-memory document library state shared by every request handler."""
+
+    def __init__(self, latency=0.0, bandwidth=0.0, throttle_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.bandwidth = Bandwidth(bandwidth)
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.folders = set()
+        self.files = {}     # server relative url -> {'length': int, 'unique_id': str, 'modified': float}
+        self.sessions = {}  # upload id -> {'url': str, 'offset': int}
+        self.changes = []   # (item id, change type); a change token is a position in this log
+        self.stats = {'requests': 0, 'throttled': 0, 'bytes_received': 0}
+
+    def should_throttle(self):
+        with self.lock:
+            self.stats['requests'] += 1
+            throttle = self.throttle_rate and self.random.random() < self.throttle_rate
+            if throttle:
+                self.stats['throttled'] += 1
+        return throttle
+
+    def ensure_folder(self, url):
+        url = url.rstrip('/')
+        with self.lock:
+            parts = url.split('/')
+            for i in range(2, len(parts) + 1):
+                self.folders.add('/'.join(parts[:i]))
+
+    def put_file(self, url, length):
+        with self.lock:
+            entry = self.files.get(url)
+            if entry is None:
+                entry = {'unique_id': str(uuid.uuid4()), 'id': len(self.changes) + 1}
+                self.changes.append((entry['id'], 1))  # Add
+            else:
+                self.changes.append((entry['id'], 2))  # Update
+            entry.update(length=length, modified=time.time())
+            self.files[url] = entry
+            self.folders.add(url.rsplit('/', 1)[0])
+            return dict(entry)
+
+    def move_file(self, url, new_url):
+        """Move url to new_url, replacing a file there (MoveTo with the Overwrite flag)."""
+        with self.lock:
+            replaced = self.files.pop(new_url, None)
+            if replaced:
+                self.changes.append((replaced['id'], 3))  # DeleteObject
+            entry = self.files.pop(url)
+            self.files[new_url] = entry
+            self.changes.append((entry['id'], 4))  # Rename
+            return dict(entry)
+
+    def delete_file(self, url):
+        with self.lock:
+            entry = self.files.pop(url, None)
+            if entry:
+                self.changes.append((entry['id'], 3))  # DeleteObject
+
+def _param(path, name):
+    """Value of name=... in an OData call like Foo(name='x',other=guid'y')."""
+    match = re.search(rf"{name}=(?:guid)?'((?:[^']|'')*)'", path, re.IGNORECASE)
+    if match:
+        return unquote(match.group(1)).replace("''", "'")
+    match = re.search(rf"{name}=(\d+)", path, re.IGNORECASE)
+    return match.group(1) if match else None
+
+def _quoted(path, function):
+    """Argument of function('...') in path, e.g. getFolderByServerRelativeUrl('/sites/a/Docs')."""
+    match = re.search(rf"{function}\('((?:[^']|'')*)'\)", path, re.IGNORECASE)
+    if match:
+        return unquote(match.group(1)).replace("''", "'")
+    match = re.search(rf"{function}\(decodedurl='((?:[^']|'')*)'\)", path, re.IGNORECASE)
+    return unquote(match.group(1)).replace("''", "'") if match else None
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like SharePoint Online
+    server_version = 'FakeSharePoint/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def sp(self):
+        return self.server.sharepoint
+
+    def _read_body(self):
+        """Read the request body at the simulated bandwidth; returns its length.
+
+        File content is discarded. JSON and multipart bodies (operation
+        parameters, $batch requests) are kept in self.body.
+        """
+        total = 0
+        keep = any(kind in (self.headers.get('Content-Type') or '') for kind in ('json', 'multipart'))
+        blocks = []
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                self.sp.bandwidth.consume(size)
+                block = self.rfile.read(size)
+                if keep:
+                    blocks.append(block)
+                self.rfile.readline()
+                total += size
+        else:
+            remaining = int(self.headers.get('Content-Length') or 0)
+            while remaining:
+                block = self.rfile.read(min(READ_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                self.sp.bandwidth.consume(len(block))
+                if keep:
+                    blocks.append(block)
+                remaining -= len(block)
+                total += len(block)
+        with self.sp.lock:
+            self.sp.stats['bytes_received'] += total
+        self.body = b''.join(blocks)
+        return total
+
+    def _json_body(self):
+        try:
+            value = json.loads(self.body or b'{}')
+        except ValueError:
+            return {}
+        return value if isinstance(value, dict) else {}
+
+    def _send(self, status, payload=None, headers=None):
+        body = b''
+        if payload is not None:
+            if 'verbose' in (self.headers.get('Accept') or ''):
+                if isinstance(payload.get('value'), list):
+                    # Verbose collections are d.results, with the next page as d.__next
+                    payload = dict(results=payload['value'], __next=payload.get('odata.nextLink'))
+                payload = {'d': payload}
+            body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;odata=nometadata;charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, headers=None):
+        self._send(status, {'error': {'code': str(status), 'message': {'lang': 'en-US', 'value': message}}}, headers)
+
+    def _file_json(self, url, entry):
+        return {
+            'Name': url.rsplit('/', 1)[-1],
+            'ServerRelativeUrl': url,
+            'Length': str(entry['length']),
+            'UniqueId': entry['unique_id'],
+            'TimeLastModified': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(entry['modified'])),
+        }
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        body_length = self._read_body()
+        if self.sp.latency:
+            time.sleep(self.sp.latency)
+        if self.sp.should_throttle():
+            self._error(429, "The request has been throttled", {'Retry-After': str(self.sp.retry_after)})
+            return
+        try:
+            self._route(method, body_length)
+        except KeyError as e:
+            self._error(404, f"File Not Found: {e}")
+
+    def _route(self, method, body_length):
+        parsed = urlparse(self.path)
+        path = unquote(parsed.path)
+        lower = path.lower()
+        site = path[:lower.index('/_api')] if '/_api' in lower else ''
+
+        if lower.endswith('/_api/contextinfo'):
+            self._send(200, {'FormDigestValue': f"0x{uuid.uuid4().hex},{time.time()}",
+                             'FormDigestTimeoutSeconds': 1800, 'WebFullUrl': site})
+            return
+
+        if lower.endswith('/_api/$batch'):
+            self._batch()
+            return
+        if '/getlist(@u)' in lower:
+            self._list(lower, parse_qs(parsed.query))
+            return
+
+        folder_url = _quoted(path, 'getFolderByServerRelativeUrl') or _quoted(path, 'getFolderByServerRelativePath')
+        file_url = _quoted(path, 'getFileByServerRelativeUrl') or _quoted(path, 'getFileByServerRelativePath')
+        file_id = _quoted(path, 'getFileById')
+        if file_id:
+            with self.sp.lock:
+                file_url = next((url for url, entry in self.sp.files.items() if entry['unique_id'] == file_id), None)
+            if file_url is None:
+                raise KeyError(file_id)
+        if folder_url and not file_url:
+            file_name = _quoted(path, 'files')
+            if file_name:
+                file_url = f"{folder_url.rstrip('/')}/{file_name}"
+
+        upload_id = _param(path, 'uploadId') or self._json_body().get('uploadId')
+        offset = _param(path, 'fileOffset')
+        if re.search(r'/startupload\(', lower):
+            with self.sp.lock:
+                self.sp.sessions[upload_id] = {'url': file_url, 'offset': body_length}
+            self._send(200, {'value': str(body_length)})
+        elif re.search(r'/continueupload\(', lower):
+            with self.sp.lock:
+                session = self.sp.sessions[upload_id]
+                if int(offset) != session['offset']:
+                    self._error(400, f"Offset {offset} does not match {session['offset']}")
+                    return
+                session['offset'] += body_length
+                committed = session['offset']
+            self._send(200, {'value': str(committed)})
+        elif re.search(r'/finishupload\(', lower):
+            with self.sp.lock:
+                session = self.sp.sessions.pop(upload_id)
+            entry = self.sp.put_file(session['url'] or file_url, session['offset'] + body_length)
+            self._send(200, self._file_json(session['url'] or file_url, entry))
+        elif re.search(r'/cancelupload\b', lower):
+            with self.sp.lock:
+                self.sp.sessions.pop(upload_id, None)
+            self._send(200, {})
+        elif re.search(r'/moveto\(', lower):
+            self.sp.move_file(file_url, _param(path, 'newurl'))
+            self._send(200, {})
+        elif re.search(r'/getuploadstatus\b', lower):
+            with self.sp.lock:
+                session = self.sp.sessions[upload_id]
+            self._send(200, {'ExpectedContentRange': f"{session['offset']}-", 'UploadId': upload_id})
+        elif re.search(r'/files/(add|addusingpath)\(', lower):
+            name = _param(path, 'url') or _param(path, 'decodedurl')
+            url = f"{folder_url.rstrip('/')}/{name}"
+            self.sp.put_file(url, body_length)
+            self._send(200, self._file_json(url, self.sp.files[url]))
+        elif re.search(r'/folders/(add|addusingpath)\(', lower):
+            name = _quoted(path, 'add') or _param(path, 'decodedurl')
+            url = name if name.startswith('/') else f"{folder_url.rstrip('/')}/{name}"
+            self.sp.ensure_folder(url)
+            self._send(200, {'Name': url.rsplit('/', 1)[-1], 'ServerRelativeUrl': url})
+        elif folder_url and re.search(r'/files/?$', lower):
+            self._list_files(folder_url, parse_qs(parsed.query))
+        elif file_url and (self.headers.get('X-HTTP-Method') or '').upper() == 'DELETE':
+            self.sp.delete_file(file_url)
+            self._send(200, {})
+        elif file_url:
+            with self.sp.lock:
+                entry = dict(self.sp.files[file_url])
+            self._send(200, self._file_json(file_url, entry))
+        elif folder_url:
+            with self.sp.lock:
+                exists = folder_url.rstrip('/') in self.sp.folders
+            if not exists:
+                self._error(404, f"File Not Found: {folder_url}")
+                return
+            self._send(200, {'Name': folder_url.rsplit('/', 1)[-1], 'ServerRelativeUrl': folder_url, 'Exists': True})
+        elif lower.endswith('/_api/web'):
+            self._send(200, {'ServerRelativeUrl': site, 'Url': f"http://{self.headers.get('Host')}{site}"})
+        else:
+            self._error(400, f"Not implemented by the fake server: {method} {path}")
+
+    def _batch(self):
+        """Run the Files/add requests of a $batch body, answering with one inner response each."""
+        boundary = f"batchresponse_{uuid.uuid4()}"
+        parts = []
+        position = 0
+        while True:
+            match = INNER_REQUEST.search(self.body, position)
+            if not match:
+                break
+            length_match = re.search(rb'Content-Length: *(\d+)', match.group(2), re.IGNORECASE)
+            length = int(length_match.group(1)) if length_match else 0
+            position = match.end() + length
+            path = unquote(urlparse(match.group(1).decode('utf-8')).path)
+            folder_url = _quoted(path, 'getFolderByServerRelativeUrl')
+            name = _param(path, 'url')
+            if folder_url and name and re.search(r'/files/add\(', path.lower()):
+                url = f"{folder_url.rstrip('/')}/{name}"
+                status, reason, payload = 200, 'OK', self._file_json(url, self.sp.put_file(url, length))
+            else:
+                status, reason = 400, 'Bad Request'
+                payload = {'error': {'code': '400', 'message': {'lang': 'en-US', 'value': f"Not in batch: {path}"}}}
+            parts.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-Transfer-Encoding: binary\r\n\r\n"
+                         f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json;odata=nometadata\r\n\r\n"
+                         f"{json.dumps(payload)}\r\n")
+        body = (''.join(parts) + f"--{boundary}--\r\n").encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', f"multipart/mixed; boundary={boundary}")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _item_json(self, url, entry):
+        file = self._file_json(url, entry)
+        return {'Id': entry['id'], 'FileRef': url, 'FSObjType': 0,
+                'File': {'Length': file['Length'], 'TimeLastModified': file['TimeLastModified'],
+                         'ETag': f"\"{{{entry['unique_id']}}},{entry['length']}\""}}
+
+    def _list(self, lower, query):
+        """GetList(@u): CurrentChangeToken, paged or filtered Items, and GetChanges from a token."""
+        library = (query.get('@u') or ["''"])[0].strip("'").replace("''", "'").rstrip('/')
+        if lower.endswith('/getchanges'):
+            change_query = self._json_body().get('query', {})
+            start = int(change_query.get('ChangeTokenStart', {}).get('StringValue') or 0)
+            limit = int(change_query.get('FetchLimit') or 1000)
+            with self.sp.lock:
+                log = self.sp.changes[start:start + limit]
+            self._send(200, {'value': [{'ItemId': item_id, 'ChangeType': change_type,
+                                        'ChangeToken': {'StringValue': str(start + number + 1)}}
+                                       for number, (item_id, change_type) in enumerate(log)]})
+            return
+        if not lower.endswith('/items'):
+            with self.sp.lock:
+                token = len(self.sp.changes)
+            self._send(200, {'CurrentChangeToken': {'StringValue': str(token)}})
+            return
+        with self.sp.lock:
+            items = [self._item_json(url, entry) for url, entry in sorted(self.sp.files.items())
+                     if url.startswith(library + '/')]
+        id_filter = (query.get('$filter') or [''])[0]
+        if id_filter:
+            ids = {int(item_id) for item_id in re.findall(r'Id eq (\d+)', id_filter)}
+            self._send(200, {'value': [item for item in items if item['Id'] in ids]})
+            return
+        top = int((query.get('$top') or ['5000'])[0])
+        skip = int((query.get('$skip') or ['0'])[0])
+        payload = {'value': items[skip:skip + top]}
+        if skip + top < len(items):
+            next_query = '&'.join(part for part in urlparse(self.path).query.split('&')
+                                  if not part.startswith('$skip='))
+            payload['odata.nextLink'] = (f"http://{self.headers.get('Host')}{self.path.split('?')[0]}"
+                                         f"?{next_query}&$skip={skip + top}")
+        self._send(200, payload)
+
+    def _list_files(self, folder_url, query):
+        folder_url = folder_url.rstrip('/')
+        top = int((query.get('$top') or ['5000'])[0])
+        skip = int((query.get('$skiptoken') or query.get('$skip') or ['0'])[0].split('=')[-1] or 0)
+        with self.sp.lock:
+            urls = sorted(url for url in self.sp.files if url.rsplit('/', 1)[0] == folder_url)
+            page = [self._file_json(url, self.sp.files[url]) for url in urls[skip:skip + top]]
+        payload = {'value': page}
+        if skip + top < len(urls):
+            payload['odata.nextLink'] = f"http://{self.headers.get('Host')}{self.path.split('?')[0]}?$top={top}&$skip={skip + top}"
+        self._send(200, payload)
+
+class FakeSharePointServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, sharepoint):
+        super().__init__(address, Handler)
+        self.sharepoint = sharepoint
+
+def start_server(host='127.0.0.1', port=0, **options):
+    """Start a fake server on a background thread; returns (server, base url).
+
+    options are passed to FakeSharePoint (latency, bandwidth, throttle_rate,
+    retry_after, seed). Call server.shutdown() when done.
+    """
+    server = FakeSharePointServer((host, port), FakeSharePoint(**options))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local fake SharePoint REST server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="added to every request")
+    parser.add_argument('--bandwidth-mbps', type=float, default=0.0, help="shared upload cap in MB/s (0 = unlimited)")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with a 429")
+    parser.add_argument('--folder', action='append', default=[], help="server relative folder to pre-create")
+    args = parser.parse_args(argv)
+
+    sharepoint = FakeSharePoint(args.latency_ms / 1000, args.bandwidth_mbps * 1024 * 1024,
+                                args.throttle_rate, args.retry_after)
+    for folder in args.folder:
+        sharepoint.ensure_folder(folder)
+    server = FakeSharePointServer((args.host, args.port), sharepoint)
+    print(f"Fake SharePoint listening on http://{args.host}:{args.port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(sharepoint.stats))
+
+if __name__ == "__main__":
+    main()
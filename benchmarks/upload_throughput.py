@@ -0,0 +1,218 @@
+"""Upload throughput benchmark against the local fake SharePoint server.
+
+Runs the upload paths of sharepoint_upload.py (shared by upload.py and
+adjustment_upload.py), upload_chunks.py and New_Version.py against
+benchmarks/fake_sharepoint.py and reports files/sec and MB/sec for:
+
+  small   a batch of small files through the worker pool at each concurrency
+  large   large files through each chunked upload path at each chunk size
+          and concurrency
+
+    python benchmarks/upload_throughput.py --latency-ms 30 --bandwidth-mbps 100 \
+        --concurrency 1 4 8 --chunk-mb 5 10 50 [--json]
+
+Needs the same packages as the scripts themselves (office365). Exits 1
+when any file fails or a scenario never reaches the server.
+
+Measured with office365-rest-python-client 3.2.0, --latency-ms 20
+--small-files 100 --large-files 2 --large-mb 50 --chunk-mb 5 10
+--concurrency 1 4 (MB/s, requests in brackets):
+
+  small 64 KB   sharepoint_upload 0.91 (101) / 3.33 with 4 workers (104)
+                New_Version 0.89 (101)
+  large 5 MB    sharepoint_upload 59.7 (24) / 107.3 with 4 workers (26)
+                upload_chunks 56.2 / 101.7, New_Version 53.0 (25)
+  large 10 MB   sharepoint_upload 95.1 (14) / 165.5 with 4 workers (16)
+                upload_chunks 94.0 / 149.1, New_Version 80.8 (15)
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from functools import partial
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from fake_sharepoint import start_server  # noqa: E402
+
+SITE_PATH = '/sites/bench'
+FOLDER_URL = f"{SITE_PATH}/Shared Documents/Bench"
+
+def fake_token():
+    return {'access_token': 'benchmark', 'token_type': 'Bearer', 'expires_in': 3600}
+
+def make_context(base_url):
+    from office365.sharepoint.client_context import ClientContext
+
+    return ClientContext(base_url + SITE_PATH).with_access_token(fake_token)
+
+def make_files(folder, prefix, count, size):
+    """Write count files of size bytes; returns [(name, path, size)]."""
+    block = os.urandom(min(size, 1024 * 1024)) or b''
+    files = []
+    for i in range(count):
+        name = f"{prefix}_{i:05d}.bin"
+        path = os.path.join(folder, name)
+        with open(path, 'wb') as f:
+            remaining = size
+            while remaining > 0:
+                f.write(block[:remaining])
+                remaining -= len(block)
+        files.append((name, path, size))
+    return files
+
+def base_config(work_dir, chunk_mb=None):
+    config_values = {
+        'DestinationFolderURL': FOLDER_URL,
+        'TargetFolderURL': FOLDER_URL,
+        'ChunkSizeStorePath': os.path.join(work_dir, 'chunk_sizes.json'),
+        'UploadJournalPath': os.path.join(work_dir, 'upload_journal.json'),
+        'TokenCache': 'false',
+    }
+    if chunk_mb:
+        config_values['ChunkSizeMB'] = str(chunk_mb)
+    return config_values
+
+def run_pool(ctx, files, upload_one, workers):
+    """Upload files through the repo's worker pool; returns the failure count."""
+    from upload_pool import run_upload_pool
+
+    failures = []
+
+    def on_result(file_name, error):
+        if error is not None:
+            failures.append((file_name, error))
+
+    run_upload_pool(ctx, FOLDER_URL, files, upload_one, workers, on_result)
+    for file_name, error in failures[:3]:
+        print(f"  {file_name} failed: {error}", file=sys.stderr)
+    return len(failures)
+
+def small_scenarios(files, work_dir, concurrency):
+    import New_Version
+    import sharepoint_upload
+
+    for workers in concurrency:
+        config_values = base_config(work_dir)
+        yield 'sharepoint_upload', None, workers, partial(sharepoint_upload.upload_single_file,
+                                                          config_values=config_values)
+
+    config_values = base_config(work_dir)
+
+    def new_version_small(ctx, target_folder, file_path, file_name, file_size):
+        New_Version.upload_small_files(file_path, config_values, ctx)
+
+    # New_Version uploads one file at a time
+    yield 'New_Version', None, 1, new_version_small
+
+def large_scenarios(work_dir, chunk_sizes, concurrency):
+    import New_Version
+    import sharepoint_upload
+    import upload_chunks
+    from chunk_tuning import ChunkSizeTuner
+
+    for chunk_mb in chunk_sizes:
+        chunk_size = chunk_mb * 1024 * 1024
+        for workers in concurrency:
+            def sharepoint_upload_py(ctx, target_folder, file_path, file_name, file_size):
+                sharepoint_upload.upload_file_in_chunks(ctx, target_folder, file_path, file_name,
+                                                        chunk_tuner=ChunkSizeTuner(chunk_size), file_size=file_size)
+
+            def upload_chunks_py(ctx, target_folder, file_path, file_name, file_size):
+                upload_chunks.upload_file_in_chunks(ctx, target_folder, file_path, file_name,
+                                                    chunk_tuner=ChunkSizeTuner(chunk_size), verify=False)
+
+            yield 'sharepoint_upload', chunk_mb, workers, sharepoint_upload_py
+            yield 'upload_chunks', chunk_mb, workers, upload_chunks_py
+
+        config_values = base_config(work_dir, chunk_mb)
+
+        def new_version_large(ctx, target_folder, file_path, file_name, file_size):
+            New_Version.upload_large_files(file_path, config_values, ctx)
+
+        yield 'New_Version', chunk_mb, 1, new_version_large
+
+def measure(server, ctx, scenario, script, chunk_mb, workers, files, upload_one):
+    stats = server.sharepoint.stats
+    requests_before, throttled_before = stats['requests'], stats['throttled']
+    total_bytes = sum(size for _, _, size in files)
+    start = time.perf_counter()
+    failed = run_pool(ctx, files, upload_one, workers)
+    elapsed = time.perf_counter() - start
+    return {
+        'scenario': scenario,
+        'script': script,
+        'chunk_mb': chunk_mb,
+        'workers': workers,
+        'files': len(files),
+        'failed': failed,
+        'mb': round(total_bytes / 1024 / 1024, 2),
+        'seconds': round(elapsed, 3),
+        'files_per_sec': round(len(files) / elapsed, 2),
+        'mb_per_sec': round(total_bytes / 1024 / 1024 / elapsed, 2),
+        'requests': stats['requests'] - requests_before,
+        'throttled': stats['throttled'] - throttled_before,
+    }
+
+def print_table(results):
+    print(f"{'scenario':<7} {'script':<18} {'chunk':>6} {'workers':>7} {'files':>6} {'MB':>8} "
+          f"{'s':>7} {'files/s':>8} {'MB/s':>8} {'reqs':>6} {'429s':>5}")
+    for r in results:
+        chunk = f"{r['chunk_mb']}M" if r['chunk_mb'] else '-'
+        print(f"{r['scenario']:<7} {r['script']:<18} {chunk:>6} {r['workers']:>7} {r['files']:>6} {r['mb']:>8} "
+              f"{r['seconds']:>7} {r['files_per_sec']:>8} {r['mb_per_sec']:>8} {r['requests']:>6} {r['throttled']:>5}"
+              + (f"  ({r['failed']} failed)" if r['failed'] else ''))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the upload paths against a local fake SharePoint.")
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--bandwidth-mbps', type=float, default=0.0, help="shared cap in MB/s (0 = unlimited)")
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--small-files', type=int, default=200)
+    parser.add_argument('--small-kb', type=int, default=64)
+    parser.add_argument('--large-files', type=int, default=2)
+    parser.add_argument('--large-mb', type=int, default=300)
+    parser.add_argument('--chunk-mb', type=int, nargs='+', default=[5, 10, 50])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--only', choices=['small', 'large'])
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    server, base_url = start_server(latency=args.latency_ms / 1000,
+                                    bandwidth=args.bandwidth_mbps * 1024 * 1024,
+                                    throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=1)
+    server.sharepoint.ensure_folder(FOLDER_URL)
+    work_dir = tempfile.mkdtemp(prefix='sp_bench_')
+    results = []
+    try:
+        ctx = make_context(base_url)
+        if args.only != 'large':
+            small_files = make_files(work_dir, 'small', args.small_files, args.small_kb * 1024)
+            for script, chunk_mb, workers, upload_one in small_scenarios(small_files, work_dir, args.concurrency):
+                results.append(measure(server, ctx, 'small', script, chunk_mb, workers, small_files, upload_one))
+        if args.only != 'small':
+            large_files = make_files(work_dir, 'large', args.large_files, args.large_mb * 1024 * 1024)
+            for script, chunk_mb, workers, upload_one in large_scenarios(work_dir, args.chunk_mb, args.concurrency):
+                results.append(measure(server, ctx, 'large', script, chunk_mb, workers, large_files, upload_one))
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({'server': vars(args), 'results': results}))
+    else:
+        print_table(results)
+    # A scenario that lost files, or never reached the server, did not measure anything
+    broken = [r for r in results if r['failed'] or not r['requests']]
+    for r in broken:
+        print(f"{r['scenario']} {r['script']} (chunk {r['chunk_mb']}, {r['workers']} workers): "
+              f"{r['failed']} failed, {r['requests']} requests", file=sys.stderr)
+    return 1 if broken or not results else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import mmap
+import os
+import queue
+import threading
+
+from transfer_metrics import get_metrics
+
+DEFAULT_READ_AHEAD_BUFFERS = 2
+# A mapped upload holds the chunk being sent plus the one being prefetched
+MAPPED_WINDOW_CHUNKS = 2
+
+_END_OF_FILE = object()
+
+def get_read_ahead_buffers(config_values):
+    """Read the number of chunk buffers from config, falling back to double buffering."""
+    value = config_values.get('ReadAheadBuffers') if config_values else None
+    if not value:
+        return DEFAULT_READ_AHEAD_BUFFERS
+    try:
+        return max(1, int(value))
+    except ValueError:
+        print(f"Invalid ReadAheadBuffers '{value}', using {DEFAULT_READ_AHEAD_BUFFERS}")
+        return DEFAULT_READ_AHEAD_BUFFERS
+
+def get_max_upload_memory(config_values):
+    """Per-upload memory ceiling in bytes from MaxUploadMemoryMB, or None for no limit."""
+    value = config_values.get('MaxUploadMemoryMB') if config_values else None
+    if not value:
+        return None
+    try:
+        return max(1, int(float(value) * 1024 * 1024))
+    except ValueError:
+        print(f"Invalid MaxUploadMemoryMB '{value}', ignoring it")
+        return None
+
+def use_memory_map(config_values):
+    return (config_values.get('ChunkSource') or 'mmap').strip().lower() != 'buffered' if config_values else True
+
+def get_chunk_size_limit(config_values):
+    """Largest chunk that keeps one upload under MaxUploadMemoryMB, or None."""
+    ceiling = get_max_upload_memory(config_values)
+    if ceiling is None:
+        return None
+    chunks_in_memory = MAPPED_WINDOW_CHUNKS if use_memory_map(config_values) else get_read_ahead_buffers(config_values)
+    return max(1, ceiling // chunks_in_memory)
+
+def read_chunks_ahead(file_path, chunk_size, buffer_count=DEFAULT_READ_AHEAD_BUFFERS, start_offset=0):
+    """Yield (offset, chunk) pairs while a reader thread prepares the next chunks.
+
+    Disk reads run on a background thread so chunk N+1 is read while chunk N
+    is being sent. At most buffer_count chunks are held at once: the one the
+    caller is working on plus buffer_count - 1 read ahead. A slot is handed
+    back to the reader each time the caller asks for the next chunk.
+
+    chunk_size may be a callable returning the size of the next chunk, which
+    lets an adaptive tuner change the size while the upload runs.
+    """
+    buffer_count = max(1, buffer_count)
+    free_slots = threading.Semaphore(buffer_count)
+    ready_chunks = queue.Queue()
+    stopped = threading.Event()
+
+    def reader():
+        try:
+            with open(file_path, 'rb') as f:
+                f.seek(start_offset)
+                offset = start_offset
+                while True:
+                    free_slots.acquire()
+                    if stopped.is_set():
+                        return
+                    with get_metrics().timed('disk_read'):
+                        chunk = f.read(chunk_size() if callable(chunk_size) else chunk_size)
+                    if not chunk:
+                        break
+                    ready_chunks.put((offset, chunk))
+                    offset += len(chunk)
+        except Exception as e:
+            ready_chunks.put(e)
+            return
+        ready_chunks.put(_END_OF_FILE)
+
+    threading.Thread(target=reader, name=f"read-ahead:{file_path}", daemon=True).start()
+
+    try:
+        while True:
+            item = ready_chunks.get()
+            if item is _END_OF_FILE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            free_slots.release()
+    finally:
+        # Unblock the reader if the caller stopped early (failure or cancel)
+        stopped.set()
+        free_slots.release()
+
+def _advise(mapped, offset, length, advice):
+    """Best-effort madvise over [offset, offset + length), widened to page bounds."""
+    if advice is None or length <= 0 or not hasattr(mapped, 'madvise'):
+        return
+    start = offset - offset % mmap.PAGESIZE
+    try:
+        mapped.madvise(advice, start, min(len(mapped) - start, length + offset - start))
+    except (OSError, ValueError):
+        pass
+
+def read_chunks_mapped(file_path, chunk_size, start_offset=0):
+    """Yield (offset, memoryview) slices of a read-only memory map of file_path.
+
+    Chunks are views into the page cache, so nothing is copied and a retry
+    resends the same view. The kernel is asked to prefetch the next chunk
+    while the current one is sent (MADV_WILLNEED) and to drop pages that
+    have been sent (MADV_DONTNEED), which keeps resident memory to about
+    two chunks. chunk_size may be a callable, as for read_chunks_ahead.
+    Each slice is released when the next one is requested, so callers must
+    not keep chunks beyond the current iteration.
+    """
+    will_need = getattr(mmap, 'MADV_WILLNEED', None)
+    dont_need = getattr(mmap, 'MADV_DONTNEED', None)
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    try:
+        file_size = len(mapped)
+        offset = start_offset
+        while offset < file_size:
+            length = min(chunk_size() if callable(chunk_size) else chunk_size, file_size - offset)
+            _advise(mapped, offset + length, length, will_need)
+            chunk = view[offset:offset + length]
+            yield offset, chunk
+            try:
+                chunk.release()
+            except BufferError:
+                pass  # Still referenced by the caller; it is freed with the map
+            _advise(mapped, offset, length, dont_need)
+            offset += length
+    finally:
+        try:
+            view.release()
+            mapped.close()
+        except BufferError:
+            pass  # A caller kept a slice alive; the map is closed when it is collected
+
+def iter_file_chunks(file_path, chunk_size, buffer_count=DEFAULT_READ_AHEAD_BUFFERS, start_offset=0, mapped=True):
+    """Yield (offset, chunk) from a memory map, or from buffered read-ahead.
+
+    Falls back to read_chunks_ahead when mapped is False or the file cannot
+    be mapped (some network shares).
+    """
+    if mapped:
+        try:
+            chunks = read_chunks_mapped(file_path, chunk_size, start_offset)
+            first = next(chunks, None)
+        except (OSError, ValueError) as e:
+            print(f"Memory map unavailable for {file_path} ({str(e)}), using buffered reads")
+        else:
+            if first is not None:
+                yield first
+                yield from chunks
+            return
+    yield from read_chunks_ahead(file_path, chunk_size, buffer_count, start_offset)
@@ -0,0 +1,145 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from bandwidth_limit import configure_bandwidth_limit, get_bandwidth_limiter
+from chunk_reader import get_chunk_size_limit
+from throttling import get_throttle_details
+from transfer_metrics import get_metrics
+
+# SharePoint/Graph upload sessions take fragments in multiples of 320 KiB, up to 60 MiB
+CHUNK_ALIGNMENT = 320 * 1024
+MIN_CHUNK_SIZE = 4 * CHUNK_ALIGNMENT
+MAX_CHUNK_SIZE = 192 * CHUNK_ALIGNMENT
+TARGET_CHUNK_SECONDS = 4.0
+
+_store_lock = threading.Lock()
+
+def align_chunk_size(size):
+    """Round size down to the session alignment and clamp it to the allowed range."""
+    size = int(size) // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT
+    return min(MAX_CHUNK_SIZE, max(MIN_CHUNK_SIZE, size))
+
+def get_chunk_size_store_path(config_values):
+    store_path = config_values.get('ChunkSizeStorePath') if config_values else None
+    if store_path:
+        return store_path
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    return os.path.join(script_dir, "chunk_sizes.json")
+
+def load_chunk_sizes(store_path):
+    try:
+        with open(store_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+class ChunkSizeTuner:
+    """Pick the size of the next chunk from how the previous chunks went.
+
+    In fixed mode next_size() always returns the initial size. In adaptive
+    mode each successful chunk's throughput sets the next size so a chunk
+    takes about target_seconds to send, at most doubling or halving per
+    step; a failed chunk halves the size. The size with the best throughput
+    is saved per destination site so the next run starts from it. max_size
+    caps every chunk, whatever the mode, to respect a memory ceiling.
+    """
+
+    def __init__(self, initial_size, adaptive=False, site_url=None, store_path=None,
+                 target_seconds=TARGET_CHUNK_SECONDS, max_size=None):
+        self.adaptive = adaptive
+        self.site_url = site_url
+        self.store_path = store_path
+        self.target_seconds = target_seconds
+        self.max_size = max_size
+        self.best_size = None
+        self.best_throughput = 0.0
+        self._size = align_chunk_size(initial_size) if adaptive else int(initial_size)
+
+    def next_size(self):
+        if self.max_size and self._size > self.max_size:
+            if self.max_size >= CHUNK_ALIGNMENT:
+                return self.max_size // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT
+            return self.max_size
+        return self._size
+
+    def record(self, chunk_length, elapsed):
+        """Feed back the round-trip time of a chunk that was accepted."""
+        if not self.adaptive:
+            return
+        throughput = chunk_length / max(elapsed, 1e-3)
+        # The short final chunk says little about the link, so it never becomes the best size
+        if chunk_length >= MIN_CHUNK_SIZE and throughput > self.best_throughput:
+            self.best_throughput = throughput
+            self.best_size = chunk_length
+        target = throughput * self.target_seconds
+        target = min(max(target, self._size / 2), self._size * 2)
+        self._size = align_chunk_size(target)
+
+    def record_failure(self):
+        """Shrink the next chunk after a failed send so retries cost less."""
+        if self.adaptive:
+            self._size = align_chunk_size(self._size / 2)
+
+    @contextmanager
+    def measure(self, chunk_length):
+        """Time the enclosed send and record it as a success or failure.
+
+        Waits first for the process-wide bandwidth limit to allow the chunk;
+        that wait is not part of the timing. Throttling responses say nothing
+        about the link, so they leave the size alone.
+        """
+        get_bandwidth_limiter().acquire(chunk_length)
+        started_at = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            status_code, _ = get_throttle_details(e)
+            if status_code is None:
+                self.record_failure()
+            raise
+        elapsed = time.monotonic() - started_at
+        self.record(chunk_length, elapsed)
+        get_metrics().record_chunk(chunk_length, elapsed)
+
+    def save(self):
+        """Remember the best chunk size seen for this site."""
+        if not (self.adaptive and self.best_size and self.site_url and self.store_path):
+            return
+        with _store_lock:
+            sizes = load_chunk_sizes(self.store_path)
+            sizes[self.site_url] = self.best_size
+            tmp_path = f"{self.store_path}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(sizes, f, indent=2)
+                os.replace(tmp_path, self.store_path)
+            except OSError as e:
+                print(f"Could not save chunk size for {self.site_url}: {str(e)}")
+
+def create_chunk_tuner(config_values, site_url, default_chunk_size_mb):
+    """Build a tuner from the ChunkSizeMB config value.
+
+    ChunkSizeMB=auto enables adaptive sizing, starting from the size stored
+    for site_url when there is one; a number fixes the chunk size; no value
+    keeps the caller's default. Chunks are capped by MaxUploadMemoryMB.
+    Also applies the BandwidthLimit schedule, which every chunk then obeys.
+    """
+    configure_bandwidth_limit(config_values)
+    max_size = get_chunk_size_limit(config_values)
+    value = (config_values.get('ChunkSizeMB') or '').strip().lower() if config_values else ''
+    if value == 'auto':
+        store_path = get_chunk_size_store_path(config_values)
+        initial_size = load_chunk_sizes(store_path).get(site_url) or default_chunk_size_mb * 1024 * 1024
+        print(f"Adaptive chunk size starting at {initial_size/1024/1024:.2f}MB")
+        return ChunkSizeTuner(initial_size, adaptive=True, site_url=site_url, store_path=store_path,
+                              max_size=max_size)
+    chunk_size_mb = default_chunk_size_mb
+    if value:
+        try:
+            chunk_size_mb = float(value)
+        except ValueError:
+            print(f"Invalid ChunkSizeMB '{value}', using {default_chunk_size_mb}")
+    return ChunkSizeTuner(chunk_size_mb * 1024 * 1024, max_size=max_size)
@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_HASH_ALGORITHM = 'sha256'
+HASH_BLOCK_SIZE = 1024 * 1024
+# Property names under which an upload response may carry the server's content hash
+REMOTE_HASH_PROPERTIES = {
+    'sha256': ('sha256Hash', 'Sha256Hash'),
+    'quickxorhash': ('quickXorHash', 'QuickXorHash'),
+}
+
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+def get_hash_algorithm(config_values):
+    """ContentHash from config: sha256 (default), quickxorhash, or none to turn hashing off."""
+    value = ((config_values.get('ContentHash') if config_values else None) or DEFAULT_HASH_ALGORITHM).strip().lower()
+    if value in ('none', 'off', 'false', '0'):
+        return None
+    if value in ('quickxor', 'quickxorhash'):
+        return 'quickxorhash'
+    if value != 'sha256':
+        print(f"Invalid ContentHash '{value}', using {DEFAULT_HASH_ALGORITHM}")
+    return DEFAULT_HASH_ALGORITHM
+
+class QuickXorHash:
+    """Microsoft's QuickXorHash, as reported for OneDrive and SharePoint files.
+
+    Byte n of the content is XORed into a 160-bit register at bit n * 11
+    (mod 160). Bytes 160 apart land on the same bits, so each update folds
+    the data into one 160-byte block with big-integer XORs, and only that
+    block is shifted into the register byte by byte.
+    """
+
+    WIDTH = 160
+    SHIFT = 11
+
+    def __init__(self):
+        self._register = 0
+        self._length = 0
+
+    def update(self, data):
+        data = memoryview(data).cast('B')
+        if not len(data):
+            return
+        lead = self._length % self.WIDTH
+        # Line every byte up with its position modulo 160, then XOR the 160-byte blocks together
+        folded = int.from_bytes(data, 'little') << (lead * 8)
+        block_count = -(-(lead + len(data)) // self.WIDTH)
+        while block_count > 1:
+            half = block_count // 2
+            bits = half * self.WIDTH * 8
+            folded = (folded >> bits) ^ (folded & ((1 << bits) - 1))
+            block_count -= half
+        mask = (1 << self.WIDTH) - 1
+        register = self._register
+        for position, value in enumerate(folded.to_bytes(self.WIDTH, 'little')):
+            if value:
+                shift = position * self.SHIFT % self.WIDTH
+                register ^= ((value << shift) | (value >> (self.WIDTH - shift))) & mask
+        self._register = register
+        self._length += len(data)
+
+    def digest(self):
+        result = bytearray(self._register.to_bytes(self.WIDTH // 8, 'little'))
+        for i, value in enumerate(self._length.to_bytes(8, 'little')):
+            result[self.WIDTH // 8 - 8 + i] ^= value
+        return bytes(result)
+
+    def hexdigest(self):
+        """Base64, the form the service reports it in (despite the name)."""
+        return base64.b64encode(self.digest()).decode('ascii')
+
+def new_hash(algorithm):
+    return QuickXorHash() if algorithm == 'quickxorhash' else hashlib.new(algorithm)
+
+class StreamHasher:
+    """Hashes an upload's chunks on a helper thread while they are being sent.
+
+    hashed(chunks) passes (offset, chunk) pairs through unchanged and hashes
+    each chunk in parallel with the caller's network I/O; the hash of a chunk
+    is finished before the next chunk is read, so memory-mapped views can be
+    released as usual. A resumed upload hashes the already-sent prefix first.
+    """
+
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self._hash = new_hash(algorithm)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hash')
+
+    def hash_prefix(self, file_path, length):
+        def read_prefix():
+            with open(file_path, 'rb') as f:
+                remaining = length
+                while remaining > 0:
+                    block = f.read(min(HASH_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    self._hash.update(block)
+                    remaining -= len(block)
+        return self._executor.submit(read_prefix)
+
+    def hashed(self, chunks):
+        try:
+            for offset, chunk in chunks:
+                future = self._executor.submit(self._hash.update, chunk)
+                try:
+                    yield offset, chunk
+                finally:
+                    future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def hexdigest(self):
+        self._executor.shutdown(wait=True)
+        return self._hash.hexdigest()
+
+def check_remote_hash(uploaded_file, algorithm, digest):
+    """Compare digest with the hash in an upload response, where the service sends one.
+
+    Returns True on a match and None when the response carries no hash;
+    raises ValueError on a mismatch so the upload is treated as failed.
+    """
+    properties = getattr(uploaded_file, 'properties', None) or {}
+    for name in REMOTE_HASH_PROPERTIES.get(algorithm, ()):
+        remote_digest = properties.get(name)
+        if remote_digest:
+            # Hex digests may differ in case; QuickXorHash is base64, where case matters
+            matches = remote_digest.strip() == digest if algorithm == 'quickxorhash' \
+                else remote_digest.strip().lower() == digest.lower()
+            if not matches:
+                raise ValueError(f"Content hash mismatch: local {algorithm} {digest}, remote {remote_digest}")
+            return True
+    return None
+
+def remember(file_path, algorithm, digest):
+    """Keep a file's hash until its result is recorded (see pop_hash)."""
+    with _hashes_lock:
+        _hashes[os.path.normpath(file_path)] = {algorithm: digest}
+
+def pop_hash(file_path):
+    """Return {algorithm: digest} for file_path's last upload, or {} if it was not hashed."""
+    with _hashes_lock:
+        return _hashes.pop(os.path.normpath(file_path), {})
+
+def record_upload_hash(file_path, algorithm, digest, uploaded_file=None):
+    """Check digest against the upload response, then remember it for the file's result."""
+    if check_remote_hash(uploaded_file, algorithm, digest):
+        print(f"Content hash confirmed by the server ({algorithm})")
+    remember(file_path, algorithm, digest)
@@ -0,0 +1,234 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from chunk_reader import iter_file_chunks, use_memory_map
+from bandwidth_limit import get_bandwidth_limiter
+from chunk_tuning import create_chunk_tuner
+from content_hash import StreamHasher, get_hash_algorithm, new_hash, remember
+from remote_verify import reconcile_uploads
+from sharepoint_upload import get_folder_url
+from throttling import get_throttle_controller
+from upload_journal import create_upload_session
+from upload_pool import ensure_folder
+
+_worker_state = threading.local()
+
+def get_destinations(config_values):
+    """Return [(site_url, folder_url), ...] from config, primary destination first.
+
+    Extra destinations are numbered: DestinationFolderURL2 (with an optional
+    DestinationSiteURL2, defaulting to the primary site), DestinationFolderURL3, ...
+    """
+    primary_site = config_values.get('DestinationSiteURL')
+    destinations = [(primary_site, config_values.get('DestinationFolderURL'))]
+    numbers = sorted(int(match.group(1)) for match in
+                     (re.fullmatch(r'DestinationFolderURL(\d+)', key) for key in config_values) if match)
+    for number in numbers:
+        folder_url = config_values.get(f'DestinationFolderURL{number}')
+        if folder_url:
+            destinations.append((config_values.get(f'DestinationSiteURL{number}') or primary_site, folder_url))
+    return destinations
+
+class FanOutError(Exception):
+    """Raised when a file reached some destinations but not all of them."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{label}: {str(error)}" for label, error in errors.items()))
+
+class FanOut:
+    """Uploads each file to several destinations while reading it only once.
+
+    Files that fit in one chunk are read once and uploaded to every
+    destination in parallel. Larger files get an upload session per
+    destination, and each chunk read from disk is sent to all of them in
+    parallel before the next chunk is read. A destination that fails drops
+    out without stopping the others. Results per destination are kept
+    until the caller collects them with pop_results().
+    """
+
+    def __init__(self, contexts, destinations, config_values, source_folder_path):
+        self.contexts = contexts          # site url -> ClientContext, one sign-in per site
+        self.destinations = destinations  # [(site_url, folder_url)]
+        self.config_values = config_values
+        self.source_folder_path = source_folder_path
+        self.labels = self._make_labels(destinations)
+        self._results = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make_labels(destinations):
+        folders = [folder_url for _, folder_url in destinations]
+        return [folder_url if folders.count(folder_url) == 1 else f"{site_url} {folder_url}"
+                for site_url, folder_url in destinations]
+
+    def _get_targets(self, sub_folder):
+        """This worker thread's own (label, folder) per destination.
+
+        Every destination gets its own clone, even two on the same site,
+        because the chunks for all of them are sent at the same time.
+        sub_folder (relative to the source folder) is mirrored, and created,
+        under each destination.
+        """
+        contexts = getattr(_worker_state, 'contexts', None)
+        if contexts is None:
+            contexts = _worker_state.contexts = {}
+            _worker_state.targets = {}
+        key = (id(self), sub_folder)
+        if key not in _worker_state.targets:
+            targets = []
+            for index, (label, (site_url, folder_url)) in enumerate(zip(self.labels, self.destinations)):
+                worker_ctx = contexts.get((id(self), index))
+                if worker_ctx is None:
+                    ctx = self.contexts[site_url]
+                    worker_ctx = contexts[(id(self), index)] = ctx.clone(ctx.base_url)
+                if sub_folder:
+                    folder_url = f"{folder_url}/{sub_folder}"
+                    ensure_folder(worker_ctx, folder_url)
+                targets.append((label, worker_ctx.web.get_folder_by_server_relative_url(folder_url)))
+            _worker_state.targets[key] = targets
+        return _worker_state.targets[key]
+
+    def upload_one(self, ctx, target_folder, file_path, file_name, file_size):
+        """Pool-compatible upload of one file to every destination.
+
+        The pool's own context and folder are ignored. Raises FanOutError if
+        any destination failed.
+        """
+        sub_folder = os.path.relpath(os.path.dirname(file_path), self.source_folder_path).replace(os.sep, '/')
+        targets = self._get_targets('' if sub_folder == '.' else sub_folder)
+        primary_ctx = self.contexts[self.destinations[0][0]]
+        chunk_tuner = create_chunk_tuner(self.config_values, primary_ctx.base_url, 10)
+        content_hash = get_hash_algorithm(self.config_values)
+        errors = {}
+        with ThreadPoolExecutor(max_workers=len(targets) + 1) as executor:
+            if file_size <= chunk_tuner.next_size():
+                digest = self._upload_whole(executor, targets, file_path, file_name, content_hash, errors)
+            else:
+                digest = self._upload_chunked(executor, targets, file_path, file_name, file_size, chunk_tuner,
+                                              content_hash, errors)
+        if digest:
+            remember(file_path, content_hash, digest)
+        chunk_tuner.save()
+        with self._lock:
+            self._results[os.path.normpath(file_path)] = {label: errors.get(label) for label, _ in targets}
+        if errors:
+            raise FanOutError(errors)
+
+    def _upload_whole(self, executor, targets, file_path, file_name, content_hash, errors):
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        print(f"Uploading '{file_name}' to {len(targets)} destination(s)")
+        throttle = get_throttle_controller()
+        hasher = new_hash(content_hash) if content_hash else None
+        hashing = executor.submit(hasher.update, content) if hasher else None
+        # The same bytes go out once per destination
+        get_bandwidth_limiter().acquire(len(content) * len(targets))
+        futures = {
+            executor.submit(throttle.call,
+                            lambda folder=folder: folder.upload_file(file_name, content).execute_query(),
+                            "upload"): label
+            for label, folder in targets
+        }
+        for future, label in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                errors[label] = e
+        if hashing:
+            hashing.result()
+            return hasher.hexdigest()
+        return None
+
+    def _upload_chunked(self, executor, targets, file_path, file_name, file_size, chunk_tuner, content_hash, errors):
+        throttle = get_throttle_controller()
+        sessions = {}
+
+        def send(label, folder, offset, chunk, is_last):
+            if offset == 0:
+                # One session per destination, started the same way as sharepoint_upload's
+                file_url = f"{get_folder_url(folder)}/{file_name}"
+                sessions[label] = throttle.call(
+                    lambda: create_upload_session(folder.context, folder, file_url, file_name),
+                    "upload session"
+                )
+            session = sessions[label]
+            if is_last:
+                throttle.call(lambda: session.finish_upload(offset, chunk).execute_query(), "chunk")
+            else:
+                throttle.call(lambda: session.upload_chunk(offset, chunk).execute_query(), "chunk")
+
+        print(f"Starting chunked upload for '{file_name}' ({file_size / 1024 / 1024:.2f} MB) "
+              f"to {len(targets)} destination(s)")
+        chunks = iter_file_chunks(file_path, chunk_tuner.next_size, mapped=use_memory_map(self.config_values))
+        hasher = StreamHasher(content_hash) if content_hash else None
+        if hasher:
+            chunks = hasher.hashed(chunks)
+        try:
+            for offset, chunk in chunks:
+                active = [(label, folder) for label, folder in targets if label not in errors]
+                if not active:
+                    break
+                is_last = offset + len(chunk) >= file_size
+                # measure() pays for one copy of the chunk; the other destinations' copies are paid here
+                get_bandwidth_limiter().acquire(len(chunk) * (len(active) - 1))
+                # Every destination gets this chunk before the next one is read (or its view released)
+                with chunk_tuner.measure(len(chunk)):
+                    futures = {executor.submit(send, label, folder, offset, chunk, is_last): label
+                               for label, folder in active}
+                    for future, label in futures.items():
+                        try:
+                            future.result()
+                        except Exception as e:
+                            print(f"Destination {label} failed at {offset / 1024 / 1024:.2f}MB: {str(e)}")
+                            errors[label] = e
+                print(f"Uploaded {(offset + len(chunk)) / 1024 / 1024:.2f}MB of {file_size / 1024 / 1024:.2f}MB "
+                      f"to {len(active) - sum(1 for label, _ in active if label in errors)} destination(s)")
+        except Exception as e:
+            # Anything outside one destination's own send (reading the source) fails all still going
+            for label, _ in targets:
+                errors.setdefault(label, e)
+        finally:
+            # Releases the memory map or read-ahead thread, however the loop ended
+            chunks.close()
+        for label in errors:
+            if label in sessions:
+                try:
+                    sessions[label].delete_object().execute_query()
+                except Exception as cleanup_error:
+                    print(f"Could not cancel the upload session for {label}: {str(cleanup_error)}")
+        if hasher and len(errors) < len(targets):
+            return hasher.hexdigest()
+        return None
+
+    def pop_results(self, file_path):
+        """Return {label: error or None} for file_path, or None if it was not attempted."""
+        with self._lock:
+            return self._results.pop(os.path.normpath(file_path), None)
+
+    def reconcile_uploads(self, expected_sizes):
+        """reconcile_uploads for every destination; reasons name the destination."""
+        problems = {}
+        for label, (site_url, folder_url) in zip(self.labels, self.destinations):
+            for file_name, reason in reconcile_uploads(self.contexts[site_url], folder_url, expected_sizes).items():
+                problems[file_name] = f"{problems[file_name]}; {label}: {reason}" if file_name in problems \
+                    else f"{label}: {reason}"
+        return problems
+
+def open_fan_out(config_values, ctx, make_context, source_folder_path):
+    """Return a FanOut when config lists more than one destination, else None.
+
+    ctx is the primary destination's context; make_context(site_url) is
+    called once for each other site.
+    """
+    destinations = get_destinations(config_values)
+    if len(destinations) < 2:
+        return None
+    contexts = {destinations[0][0]: ctx}
+    for site_url, _ in destinations[1:]:
+        if site_url not in contexts:
+            contexts[site_url] = make_context(site_url)
+    print(f"Fan-out to {len(destinations)} destinations: " + ", ".join(folder for _, folder in destinations))
+    return FanOut(contexts, destinations, config_values, source_folder_path)
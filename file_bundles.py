@@ -0,0 +1,286 @@
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+from bandwidth_limit import get_bandwidth_limiter
+from chunk_tuning import create_chunk_tuner
+from sharepoint_upload import get_folder_url
+from sync_manifest import is_enabled
+from throttling import get_throttle_controller
+from upload_journal import create_upload_session
+
+DEFAULT_BUNDLE_FILE_MAX_KB = 256
+DEFAULT_BUNDLE_TARGET_MB = 100
+COPY_BLOCK_SIZE = 1024 * 1024
+BUNDLE_MANIFEST_NAME = '_bundle_manifest.json'
+
+def _get_number(config_values, key, default):
+    value = config_values.get(key)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"Invalid {key} '{value}', using {default}")
+        return default
+
+def get_bundle_manifest_path(config_values):
+    manifest_path = config_values.get('BundleManifestPath')
+    if manifest_path:
+        return manifest_path
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    return os.path.join(script_dir, "bundle_manifest.jsonl")
+
+class _ChunkSink:
+    """Write-only, unseekable target for ZipFile that collects output for upload."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self, size):
+        chunk = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return chunk
+
+class FileBundle:
+    """A group of small files uploaded together as one zip archive."""
+
+    def __init__(self, name, members):
+        self.name = name
+        self.members = members  # [(file_name, full_path, file_size)]
+        self.size = None        # archive size, known once it has been streamed
+        self.skipped = []       # members that vanished before they were packed
+
+    @property
+    def member_bytes(self):
+        return sum(size for _, _, size in self.members)
+
+    def manifest(self):
+        return {
+            'bundle': self.name,
+            'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'files': [{'name': file_name, 'size': size} for file_name, _, size in self.members
+                      if file_name not in self.skipped],
+        }
+
+def stream_bundle(bundle, chunk_size, compression=zipfile.ZIP_DEFLATED):
+    """Yield the zip archive for bundle in chunks, without writing it to disk.
+
+    The archive is built straight into memory as the chunks are consumed, so
+    at most about one chunk plus one copy block is held at a time.
+    chunk_size may be a callable returning the next chunk size. A listing of
+    the members is added to the archive as _bundle_manifest.json.
+    """
+    next_size = chunk_size if callable(chunk_size) else (lambda: chunk_size)
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=compression) as archive:
+        for file_name, full_path, file_size in bundle.members:
+            try:
+                source = open(full_path, 'rb')
+            except OSError:
+                bundle.skipped.append(file_name)
+                continue
+            with source:
+                info = zipfile.ZipInfo.from_file(full_path, file_name)
+                info.compress_type = compression
+                with archive.open(info, 'w') as target:
+                    for block in iter(lambda: source.read(COPY_BLOCK_SIZE), b''):
+                        target.write(block)
+                        size = next_size()
+                        while len(sink.buffer) >= size:
+                            yield sink.take(size)
+                            size = next_size()
+        archive.writestr(BUNDLE_MANIFEST_NAME, json.dumps(bundle.manifest(), indent=2))
+    while sink.buffer:
+        yield sink.take(next_size())
+    bundle.size = sink.position
+
+def _with_last(chunks):
+    """Yield (chunk, is_last) pairs by looking one chunk ahead."""
+    previous = None
+    for chunk in chunks:
+        if previous is not None:
+            yield previous, False
+        previous = chunk
+    if previous is not None:
+        yield previous, True
+
+def upload_bundle(target_folder, bundle, chunk_tuner, compression=zipfile.ZIP_DEFLATED):
+    """Stream bundle to target_folder through an upload session.
+
+    Uses the same session calls, throttling and chunk tuning as the chunked
+    upload of large files; the total size is not known up front, so the last
+    chunk is found by reading one ahead. A bundle that fits in one chunk is
+    sent with a plain upload instead. A failed session is cancelled.
+    """
+    throttle = get_throttle_controller()
+    offset = 0
+    upload_session = None
+    print(f"Streaming bundle '{bundle.name}' ({len(bundle.members)} files, "
+          f"{bundle.member_bytes / 1024 / 1024:.2f} MB before compression)")
+    try:
+        for chunk, is_last in _with_last(stream_bundle(bundle, chunk_tuner.next_size, compression)):
+            if upload_session is None and is_last:
+                get_bandwidth_limiter().acquire(len(chunk))
+                throttle.call(lambda: target_folder.upload_file(bundle.name, chunk).execute_query(), "upload")
+            else:
+                if upload_session is None:
+                    file_url = f"{get_folder_url(target_folder)}/{bundle.name}"
+                    upload_session = throttle.call(
+                        lambda: create_upload_session(target_folder.context, target_folder, file_url, bundle.name),
+                        "upload session"
+                    )
+
+                def send_chunk():
+                    with chunk_tuner.measure(len(chunk)):
+                        if is_last:
+                            return upload_session.finish_upload(offset, chunk).execute_query()
+                        return upload_session.upload_chunk(offset, chunk).execute_query()
+                throttle.call(send_chunk, "chunk")
+            offset += len(chunk)
+    except Exception:
+        if upload_session:
+            try:
+                upload_session.delete_object().execute_query()
+            except Exception as cleanup_error:
+                print(f"Could not cancel the upload session: {str(cleanup_error)}")
+        raise
+    chunk_tuner.save()
+    print(f"Uploaded bundle '{bundle.name}' ({offset / 1024 / 1024:.2f} MB)")
+
+class FileBundler:
+    """Packs small matched files into zip bundles as they stream past.
+
+    bundle() passes large files through and replaces runs of files up to
+    max_file_size with FileBundle items of about target_size bytes, so they
+    can share the worker pool with ordinary uploads. wrap_upload() and
+    wrap_result() let the pool upload bundles and report each member file.
+    """
+
+    def __init__(self, max_file_size, target_size, prefix='bundle', compression=zipfile.ZIP_DEFLATED,
+                 manifest_path=None):
+        self.max_file_size = max_file_size
+        self.target_size = target_size
+        self.prefix = prefix
+        self.compression = compression
+        self.manifest_path = manifest_path
+        self.bundles = {}
+        self._lock = threading.Lock()
+        self._run_id = time.strftime('%Y%m%d_%H%M%S')
+
+    def _new_bundle(self, members):
+        with self._lock:
+            name = f"{self.prefix}_{self._run_id}_{len(self.bundles) + 1:04d}.zip"
+            bundle = FileBundle(name, members)
+            self.bundles[name] = bundle
+        return bundle
+
+    def bundle(self, pending_files):
+        """Lazily group (file_name, full_path, file_size) items into bundles."""
+        group = []
+        group_size = 0
+        for item in pending_files:
+            if item[2] > self.max_file_size:
+                yield item
+                continue
+            group.append(item)
+            group_size += item[2]
+            if group_size >= self.target_size:
+                yield self._to_item(group)
+                group = []
+                group_size = 0
+        if group:
+            yield self._to_item(group)
+
+    def _to_item(self, group):
+        if len(group) == 1:
+            return group[0]
+        bundle = self._new_bundle(group)
+        return bundle.name, bundle, bundle.member_bytes
+
+    def wrap_upload(self, upload_one, config_values):
+        """Return an upload_one for the pool that also knows how to upload bundles."""
+        def upload_or_bundle(ctx, target_folder, full_path, file_name, file_size):
+            if isinstance(full_path, FileBundle):
+                chunk_tuner = create_chunk_tuner(config_values, ctx.base_url, 10)
+                return upload_bundle(target_folder, full_path, chunk_tuner, self.compression)
+            return upload_one(ctx, target_folder, full_path, file_name, file_size)
+        return upload_or_bundle
+
+    def wrap_result(self, on_result):
+        """Return an on_result that reports each member of a bundle and logs the bundle."""
+        def report(file_name, error):
+            bundle = self.bundles.get(file_name)
+            if bundle is None:
+                on_result(file_name, error)
+                return
+            if error is None:
+                self.record(bundle)
+            for member_name, _, _ in bundle.members:
+                if member_name in bundle.skipped:
+                    on_result(member_name, FileNotFoundError(member_name))
+                else:
+                    on_result(member_name, error)
+        return report
+
+    def record(self, bundle):
+        if not self.manifest_path:
+            return
+        try:
+            with open(self.manifest_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(bundle.manifest()) + "\n")
+        except OSError as e:
+            print(f"Could not write bundle manifest: {str(e)}")
+
+    def expected_sizes(self, expected_sizes):
+        """Swap bundled member names for their archive's name and size, for verification."""
+        remaining = dict(expected_sizes)
+        for bundle in self.bundles.values():
+            members = [name for name, _, _ in bundle.members if name in remaining]
+            if not members:
+                continue
+            for name in members:
+                del remaining[name]
+            if bundle.size is not None:
+                remaining[bundle.name] = bundle.size
+        return remaining
+
+    def expand_problems(self, problems):
+        """Map a verification problem on an archive back to each of its members."""
+        expanded = {}
+        for file_name, reason in problems.items():
+            bundle = self.bundles.get(file_name)
+            if bundle is None:
+                expanded[file_name] = reason
+                continue
+            for member_name, _, _ in bundle.members:
+                if member_name not in bundle.skipped:
+                    expanded[member_name] = f"bundle {bundle.name} {reason}"
+        return expanded
+
+def open_file_bundler(config_values):
+    """Return a FileBundler when BundleSmallFiles is on in config, else None."""
+    if not is_enabled(config_values, 'BundleSmallFiles'):
+        return None
+    max_file_size = _get_number(config_values, 'BundleFileMaxKB', DEFAULT_BUNDLE_FILE_MAX_KB) * 1024
+    target_size = _get_number(config_values, 'BundleTargetMB', DEFAULT_BUNDLE_TARGET_MB) * 1024 * 1024
+    compression = zipfile.ZIP_STORED if (config_values.get('BundleCompression') or '').strip().lower() == 'store' \
+        else zipfile.ZIP_DEFLATED
+    return FileBundler(max_file_size, target_size, config_values.get('BundleName') or 'bundle',
+                       compression, get_bundle_manifest_path(config_values))
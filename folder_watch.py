@@ -0,0 +1,323 @@
+import os
+import threading
+import time
+
+from remote_verify import is_verification_enabled, reconcile_uploads
+from run_log import open_run_log
+from source_scan import get_source_filter
+from sync_manifest import open_sync_manifest
+from content_hash import pop_hash
+from transfer_metrics import write_run_metrics
+from upload_pool import get_max_workers, order_shortest_first, run_upload_pool
+
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_POLL_SECONDS = 5.0
+RETRY_SECONDS = 60.0
+MAX_RETRY_SECONDS = 3600.0
+DEFAULT_MAX_RETRIES = 5
+
+def _get_seconds(config_values, key, default):
+    value = config_values.get(key)
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        print(f"Invalid {key} '{value}', using {default}")
+        return default
+
+def get_settle_seconds(config_values):
+    """How long a file's size and mtime must hold still before it is uploaded (WatchSettleSeconds)."""
+    return _get_seconds(config_values, 'WatchSettleSeconds', DEFAULT_SETTLE_SECONDS)
+
+def get_poll_seconds(config_values):
+    """Rescan interval used only when no change notifications are available (WatchPollSeconds)."""
+    return _get_seconds(config_values, 'WatchPollSeconds', DEFAULT_POLL_SECONDS)
+
+def get_max_retries(config_values):
+    """How many times a failed file is retried before it is reported as failed (WatchMaxRetries)."""
+    value = config_values.get('WatchMaxRetries')
+    if not value:
+        return DEFAULT_MAX_RETRIES
+    try:
+        return max(0, int(value))
+    except ValueError:
+        print(f"Invalid WatchMaxRetries '{value}', using {DEFAULT_MAX_RETRIES}")
+        return DEFAULT_MAX_RETRIES
+
+def _stat_signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+class PendingFiles:
+    """Files seen changing, held back until their writer has finished.
+
+    A file is ready once its size and mtime have not moved for
+    settle_seconds, or straight away after a close-after-write event.
+    Files that vanish before they settle are dropped.
+    """
+
+    def __init__(self, source_folder_path, settle_seconds):
+        self.source_folder_path = source_folder_path
+        self.settle_seconds = settle_seconds
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        # file name -> [stat signature, monotonic time it was last seen moving, closed]
+        self._files = {}
+
+    def touch(self, file_name, delay=0.0):
+        with self._lock:
+            signature = _stat_signature(os.path.join(self.source_folder_path, file_name))
+            self._files[file_name] = [signature, time.monotonic() + delay, False]
+        self._changed.set()
+
+    def mark_closed(self, file_name):
+        with self._lock:
+            signature = _stat_signature(os.path.join(self.source_folder_path, file_name))
+            self._files[file_name] = [signature, time.monotonic(), True]
+        self._changed.set()
+
+    def discard(self, file_name):
+        with self._lock:
+            self._files.pop(file_name, None)
+
+    def pop_ready(self):
+        """Return the names that have settled and when the next one might (or None)."""
+        ready = []
+        next_check = None
+        now = time.monotonic()
+        with self._lock:
+            for file_name, entry in list(self._files.items()):
+                signature, since, closed = entry
+                if since > now:
+                    next_check = since if next_check is None else min(next_check, since)
+                    continue
+                current = _stat_signature(os.path.join(self.source_folder_path, file_name))
+                if current is None:
+                    del self._files[file_name]
+                elif current != signature:
+                    # Still being written: restart its quiet period
+                    entry[0], entry[1], entry[2] = current, now, False
+                    since = now
+                elif closed or now - since >= self.settle_seconds:
+                    del self._files[file_name]
+                    ready.append(file_name)
+                    continue
+                due = since + self.settle_seconds
+                next_check = due if next_check is None else min(next_check, due)
+        return ready, next_check
+
+    def wait(self, timeout):
+        self._changed.wait(timeout)
+        self._changed.clear()
+
+class RetrySchedule:
+    """Backoff for files whose upload failed.
+
+    Each file gets max_retries more attempts, the first after RETRY_SECONDS
+    and each later one twice as long after the last, up to
+    MAX_RETRY_SECONDS. A file that changes on disk starts over.
+    """
+
+    def __init__(self, max_retries, first_delay=RETRY_SECONDS, max_delay=MAX_RETRY_SECONDS):
+        self.max_retries = max_retries
+        self.first_delay = first_delay
+        self.max_delay = max_delay
+        # file name -> (retries so far, stat signature when it last failed)
+        self._failures = {}
+
+    def next_delay(self, file_name, signature):
+        """Seconds until file_name's next attempt, or None once its retries are used up."""
+        retries, last_signature = self._failures.get(file_name, (0, signature))
+        if signature != last_signature:
+            retries = 0
+        if retries >= self.max_retries:
+            self._failures.pop(file_name, None)
+            return None
+        self._failures[file_name] = (retries + 1, signature)
+        return min(self.first_delay * 2 ** retries, self.max_delay)
+
+    def succeeded(self, file_name):
+        self._failures.pop(file_name, None)
+
+def _start_observer(source_folder_path, source_filter, pending):
+    """Subscribe to change notifications for the folder; returns the observer or None.
+
+    watchdog uses inotify on Linux and ReadDirectoryChangesW on Windows. It is
+    optional, so without it the caller falls back to rescanning the folder.
+    """
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    def matching_name(path):
+        file_name = os.path.basename(path)
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(source_folder_path):
+            return None
+        return file_name if source_filter.matches(file_name) else None
+
+    class Handler(FileSystemEventHandler):
+        def on_created(self, event):
+            file_name = None if event.is_directory else matching_name(event.src_path)
+            if file_name:
+                pending.touch(file_name)
+
+        on_modified = on_created
+
+        def on_moved(self, event):
+            file_name = None if event.is_directory else matching_name(event.dest_path)
+            if file_name:
+                # A rename into place is the usual "write then move" hand-off
+                pending.mark_closed(file_name)
+
+        def on_closed(self, event):
+            file_name = None if event.is_directory else matching_name(event.src_path)
+            if file_name:
+                pending.mark_closed(file_name)
+
+        def on_deleted(self, event):
+            file_name = None if event.is_directory else matching_name(event.src_path)
+            if file_name:
+                pending.discard(file_name)
+
+    observer = Observer()
+    observer.schedule(Handler(), source_folder_path, recursive=False)
+    observer.start()
+    return observer
+
+def _scan_folder(source_folder_path, source_filter):
+    """Return {file name: (size, mtime_ns)} for the files matching source_filter."""
+    signatures = {}
+    with os.scandir(source_folder_path) as entries:
+        for entry in entries:
+            if entry.is_file() and source_filter.matches(entry.name):
+                stat = entry.stat()
+                signatures[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return signatures
+
+def watch_and_upload(ctx, config_values, source_folder_path, wildcard_pattern, upload_one,
+                     success_status='Successful', single_file=False):
+    """Upload matching files as they land in source_folder_path, until interrupted.
+
+    Files already in the folder are queued at start-up (and filtered by the
+    manifest when IncrementalSync is on). After that each created, modified
+    or renamed file is queued, debounced until its writer is done, and
+    uploaded in batches through the worker pool with the same context, so
+    there is no per-file start-up or sign-in cost. Failed files are queued
+    again with a backoff (see RetrySchedule) up to WatchMaxRetries times,
+    then reported as failed until they change again.
+    """
+    target_folder_url = config_values.get('DestinationFolderURL')
+    max_workers = get_max_workers(config_values)
+    manifest = open_sync_manifest(config_values)
+    run_log = open_run_log(config_values)
+    pending = PendingFiles(source_folder_path, get_settle_seconds(config_values))
+    poll_seconds = get_poll_seconds(config_values)
+    retries = RetrySchedule(get_max_retries(config_values))
+    source_filter = get_source_filter(config_values, wildcard_pattern, single_file)
+
+    known = _scan_folder(source_folder_path, source_filter)
+    for file_name in known:
+        pending.touch(file_name)
+
+    observer = _start_observer(source_folder_path, source_filter, pending)
+    if observer is None:
+        print(f"watchdog is not installed, rescanning {source_folder_path} every {poll_seconds:g}s")
+    print(f"Watching {source_folder_path} for '{wildcard_pattern}' -> {target_folder_url} (Ctrl+C to stop)")
+
+    def retry_later(file_name, reason):
+        """Queue a failed file again after its backoff; returns False once it has been given up on."""
+        delay = retries.next_delay(file_name, _stat_signature(os.path.join(source_folder_path, file_name)))
+        if delay is None:
+            print(f"✗ {file_name}: giving up after {retries.max_retries} retries ({reason})")
+            return False
+        print(f"  retrying {file_name} in {delay:g}s")
+        pending.touch(file_name, delay=delay)
+        return True
+
+    def record_result(file_name, error):
+        hashes = pop_hash(os.path.join(source_folder_path, file_name))
+        details = dict(hashes)
+        if error is None:
+            print(f"✓ {file_name}")
+            status = success_status
+            retries.succeeded(file_name)
+            if manifest:
+                manifest.record(os.path.join(source_folder_path, file_name), hashes)
+        else:
+            print(f"✗ {file_name}: {str(error)}")
+            status = 'Failed'
+            if not retry_later(file_name, str(error)):
+                details['reason'] = f"gave up after {retries.max_retries} retries: {str(error)}"
+        if run_log:
+            run_log.append(file_name, status, **details)
+
+    try:
+        while True:
+            ready, next_check = pending.pop_ready()
+            if ready:
+                pending_files, _ = order_shortest_first(source_folder_path, ready)
+                if manifest:
+                    pending_files, skipped_files = manifest.filter_changed(pending_files)
+                    for file_name in skipped_files:
+                        print(f"- {file_name} unchanged, skipped")
+                if pending_files:
+                    print(f"Uploading {len(pending_files)} file(s)")
+                    uploaded_files = set()
+
+                    def on_result(file_name, error):
+                        record_result(file_name, error)
+                        if error is None:
+                            uploaded_files.add(file_name)
+
+                    run_upload_pool(ctx, target_folder_url, pending_files, upload_one, max_workers, on_result)
+
+                    if uploaded_files and is_verification_enabled(config_values):
+                        expected_sizes = {name: size for name, _, size in pending_files if name in uploaded_files}
+                        try:
+                            problems = reconcile_uploads(ctx, target_folder_url, expected_sizes)
+                        except Exception as e:
+                            print(f"Bulk verification skipped: {str(e)}")
+                            problems = {}
+                        for file_name, reason in problems.items():
+                            print(f"Verification failed for {file_name}: {reason}")
+                            if manifest:
+                                manifest.forget(os.path.join(source_folder_path, file_name))
+                            if run_log:
+                                run_log.append(file_name, 'Verification Failed')
+                            retry_later(file_name, reason)
+                if manifest:
+                    manifest.save()
+                if run_log:
+                    run_log.flush()
+                write_run_metrics(config_values)
+                continue
+
+            timeout = poll_seconds if observer is None else None
+            if next_check is not None:
+                wait_seconds = max(0.05, next_check - time.monotonic())
+                timeout = wait_seconds if timeout is None else min(timeout, wait_seconds)
+            pending.wait(timeout)
+
+            if observer is None:
+                current = _scan_folder(source_folder_path, source_filter)
+                for file_name, signature in current.items():
+                    if known.get(file_name) != signature:
+                        pending.touch(file_name)
+                known = current
+    except KeyboardInterrupt:
+        print("Stopping watch")
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        if manifest:
+            manifest.save()
+        if run_log:
+            run_log.close()
+        write_run_metrics(config_values)
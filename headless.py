@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import sys
+
+EXIT_OK = 0
+EXIT_FAILED = 1  # The run finished but some files failed
+EXIT_ERROR = 2   # Config or critical error, nothing (more) was uploaded
+
+_headless = False
+_summary_stream = sys.stdout
+
+def set_headless(enabled):
+    """Switch headless mode; progress output then goes to stderr so stdout carries only JSON."""
+    global _headless
+    _headless = enabled
+    if enabled:
+        sys.stdout = sys.stderr
+
+def is_headless():
+    return _headless
+
+def has_display():
+    """Windows always has a desktop; elsewhere Tk needs an X/Wayland display."""
+    return os.name == 'nt' or bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+def parse_args(description, argv=None, watch=False, serve=False):
+    """Parse the command line shared by the upload scripts.
+
+    --headless (or --json) prints a JSON summary instead of showing dialogs,
+    and is switched on automatically when there is no display to show them.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('file_path', nargs='?', help="file or folder\\pattern to upload instead of the config.txt source")
+    parser.add_argument('--headless', '--json', action='store_true', dest='headless',
+                        help="no dialogs; print a JSON summary and exit non-zero on failure")
+    if watch:
+        parser.add_argument('--watch', action='store_true', help="keep running and upload files as they land")
+    if serve:
+        parser.add_argument('--serve', action='store_true',
+                            help="keep running and upload the files later invocations hand over")
+    args = parser.parse_args(argv)
+    set_headless(args.headless or not has_display())
+    return args
+
+def show_popup(title, message):
+    """Show a message box, or just print it when headless."""
+    if _headless:
+        print(f"{title}: {message}")
+        return
+    import tkinter as tk
+    from tkinter import messagebox
+
+    root = tk.Tk()
+    root.withdraw()  # Hide the main window
+    messagebox.showinfo(title, message)
+    root.destroy()
+
+def new_summary():
+    return {'success': 0, 'failed': 0, 'skipped': 0, 'files': [], 'error': None}
+
+def add_file(summary, file_name, status, reason=None):
+    """Add one file's outcome to summary and return its entry for later updates."""
+    entry = {'file': file_name, 'status': status}
+    if reason:
+        entry['reason'] = reason
+    summary['files'].append(entry)
+    return entry
+
+def get_exit_code(summary):
+    if summary['error']:
+        return EXIT_ERROR
+    return EXIT_FAILED if summary['failed'] else EXIT_OK
+
+def fail(error_msg):
+    """Exit with EXIT_ERROR, reporting error_msg in the JSON summary when headless."""
+    summary = new_summary()
+    summary['error'] = error_msg
+    finish(summary)
+
+def finish(summary):
+    """Print the JSON summary when headless and exit with the run's exit code."""
+    if _headless:
+        print(json.dumps(summary), file=_summary_stream, flush=True)
+    sys.exit(get_exit_code(summary))
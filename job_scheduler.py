@@ -0,0 +1,183 @@
+import heapq
+import itertools
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from upload_pool import upload_in_worker
+
+# Files buffered per job, so one huge scan cannot crowd the others out of the queue
+JOB_LOOKAHEAD = 200
+SECTION_PATTERN = re.compile(r'^\[(.+)\]$')
+
+def read_jobs_file(file_path):
+    """Read a multi-job config: shared keys first, then one [Job Name] section per job.
+
+    Returns (shared_values, [(job_name, job_values), ...]). Lines use the
+    same Key = Value format as config.txt; keys in a section override the
+    shared ones for that job only.
+    """
+    shared_values = {}
+    sections = []
+    current = shared_values
+    with open(file_path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#') or line.startswith(';'):
+                continue
+            section = SECTION_PATTERN.match(line)
+            if section:
+                current = {}
+                sections.append((section.group(1).strip(), current))
+                continue
+            parts = line.split("=")
+            if len(parts) >= 2:
+                current[parts[0].strip()] = "=".join(parts[1:]).strip().strip('"')
+            else:
+                print(f"Skipping malformed line: {line}")
+    return shared_values, sections
+
+def parse_deadline(value, now=None):
+    """Turn 'HH:MM' (today) or 'YYYY-MM-DD HH:MM' into a timestamp, or None."""
+    if not value:
+        return None
+    now = now or datetime.now()
+    for fmt in ("%Y-%m-%d %H:%M", "%H:%M"):
+        try:
+            parsed = datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+        if fmt == "%H:%M":
+            parsed = now.replace(hour=parsed.hour, minute=parsed.minute, second=0, microsecond=0)
+        return parsed.timestamp()
+    print(f"Invalid Deadline '{value}', ignoring it")
+    return None
+
+class UploadJob:
+    """One source -> destination job from a multi-job config.
+
+    Priority is an integer, higher first (default 0). Deadline is 'HH:MM'
+    today or 'YYYY-MM-DD HH:MM'. pending_files, upload_one and on_result
+    are set by the caller before the job is scheduled.
+    """
+
+    def __init__(self, name, config_values):
+        self.name = name
+        self.config_values = config_values
+        self.priority = self._get_priority(config_values)
+        self.deadline = parse_deadline(config_values.get('Deadline'))
+        self.target_folder_url = config_values.get('DestinationFolderURL')
+        self.ctx = None
+        self.pending_files = ()
+        self.upload_one = None
+        self.on_result = None
+        self.finished_at = None
+
+    def _get_priority(self, config_values):
+        value = config_values.get('Priority')
+        if not value:
+            return 0
+        try:
+            return int(value)
+        except ValueError:
+            print(f"Invalid Priority '{value}' for job {self.name}, using 0")
+            return 0
+
+    @property
+    def is_late(self):
+        return self.deadline is not None and (self.finished_at or time.time()) > self.deadline
+
+class JobScheduler:
+    """Runs the files of many jobs on one worker pool of max_workers threads.
+
+    Whenever a worker frees up, the next file is the best one across all
+    jobs: highest Priority first, then earliest Deadline, then smallest
+    file. Each job's scan is consumed lazily, JOB_LOOKAHEAD files at a time.
+    Files above large_file_size may hold at most max_workers - 1 workers, so
+    a later urgent small file never waits for a long archive to finish.
+    """
+
+    def __init__(self, jobs, max_workers, large_file_size):
+        self.jobs = jobs
+        self.max_workers = max_workers
+        self.large_file_size = large_file_size
+        self.large_slots = max(1, max_workers - 1)
+        self._order = itertools.count()
+
+    def _key(self, job, file_size):
+        deadline = job.deadline if job.deadline is not None else float('inf')
+        return (-job.priority, deadline, file_size, next(self._order))
+
+    def run(self):
+        queue = []
+        feeds = {job: iter(job.pending_files) for job in self.jobs}
+        buffered = {job: 0 for job in self.jobs}
+        remaining = {job: 0 for job in self.jobs}
+        running = {}
+        large_running = 0
+
+        def refill():
+            for job in list(feeds):
+                while buffered[job] < JOB_LOOKAHEAD:
+                    item = next(feeds[job], None)
+                    if item is None:
+                        del feeds[job]
+                        break
+                    heapq.heappush(queue, (self._key(job, item[2]), job, item))
+                    buffered[job] += 1
+                    remaining[job] += 1
+
+        def take():
+            # The best file that may start now; large files wait while their slots are full
+            deferred = []
+            found = None
+            while queue:
+                entry = heapq.heappop(queue)
+                if entry[2][2] > self.large_file_size and large_running >= self.large_slots:
+                    deferred.append(entry)
+                    continue
+                found = entry
+                break
+            for entry in deferred:
+                heapq.heappush(queue, entry)
+            return found
+
+        def report(done):
+            nonlocal large_running
+            for future in done:
+                job, (file_name, _, file_size) = running.pop(future)
+                if file_size > self.large_file_size:
+                    large_running -= 1
+                try:
+                    future.result()
+                except Exception as e:
+                    job.on_result(file_name, e)
+                else:
+                    job.on_result(file_name, None)
+                remaining[job] -= 1
+                if not remaining[job] and job not in feeds:
+                    job.finished_at = time.time()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                refill()
+                while len(running) < self.max_workers:
+                    entry = take()
+                    if entry is None:
+                        break
+                    _, job, (file_name, full_path, file_size) = entry
+                    buffered[job] -= 1
+                    if file_size > self.large_file_size:
+                        large_running += 1
+                    future = executor.submit(upload_in_worker, job.ctx, job.target_folder_url, job.upload_one,
+                                             file_name, full_path, file_size)
+                    running[future] = (job, (file_name, full_path, file_size))
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                report(done)
+
+        for job in self.jobs:
+            if job.finished_at is None:
+                job.finished_at = time.time()
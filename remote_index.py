@@ -0,0 +1,320 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote, urlsplit
+
+from remote_verify import LISTING_PAGE_SIZE
+from sync_manifest import is_enabled
+from throttling import get_throttle_controller
+
+# Changes fetched per GetChanges call, and item ids looked up per request afterwards
+CHANGE_PAGE_SIZE = 1000
+ITEM_LOOKUP_BATCH = 50
+# ChangeType values after which the item is gone from where it was
+REMOVED_CHANGE_TYPES = (3, 5)  # DeleteObject, MoveAway
+ITEM_SELECT = "$select=Id,FileRef,FSObjType,File/Length,File/TimeLastModified,File/ETag&$expand=File"
+
+def get_remote_index_path(config_values):
+    index_path = config_values.get('RemoteIndexPath')
+    if index_path:
+        return index_path
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    return os.path.join(script_dir, "remote_index.sqlite")
+
+def get_server_relative_url(web_path, folder_url):
+    """folder_url as FileRef spells it: DestinationFolderURL may be relative to the site."""
+    if folder_url.startswith('/'):
+        return folder_url.rstrip('/')
+    return f"{web_path}/{folder_url.strip('/')}"
+
+def get_library_url(ctx, folder_url):
+    """Server-relative URL of the document library that holds folder_url."""
+    web_path = urlsplit(ctx.base_url).path.rstrip('/')
+    relative = get_server_relative_url(web_path, folder_url)[len(web_path):].strip('/')
+    return f"{web_path}/{relative.split('/')[0]}"
+
+def _parse_time(value):
+    """Seconds since the epoch for a SharePoint timestamp like 2024-05-01T10:00:00Z."""
+    if not value:
+        return 0.0
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+class RemoteIndex:
+    """Local SQLite copy of a destination library's file listing.
+
+    The first refresh() of a library lists every file in pages; later ones
+    replay the library's change log from the stored change token and only
+    look up the items that changed, so keeping the index current costs a
+    request or two instead of a listing. If the token has expired the
+    library is listed again. Lookups are local queries, so the upload
+    scripts can ask about every file of a run without touching the network.
+    The size and mtime of each local file uploaded are kept too, so a later
+    run can tell an edited file from one the library already has.
+    """
+
+    def __init__(self, index_path):
+        import sqlite3
+
+        self.index_path = index_path
+        self.web_path = ''  # Site path of the last refresh, for site-relative folder URLs
+        self._lock = threading.Lock()
+        self._scanned = {}  # Remote path -> (size, mtime_ns) of the local file as iter_changed saw it
+        self._uploaded = {}  # Remote path -> (size, mtime_ns), or None to forget; written by close()
+        self._db = sqlite3.connect(index_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                library TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                modified REAL NOT NULL,
+                etag TEXT,
+                PRIMARY KEY (library, item_id)
+            );
+            CREATE INDEX IF NOT EXISTS files_path ON files (path);
+            CREATE TABLE IF NOT EXISTS libraries (
+                library TEXT PRIMARY KEY,
+                change_token TEXT,
+                refreshed_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS uploads (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            );
+        """)
+
+    def close(self):
+        with self._lock:
+            with self._db:
+                self._db.executemany("DELETE FROM uploads WHERE path = ?",
+                                     [(path,) for path, local in self._uploaded.items() if local is None])
+                self._db.executemany("INSERT OR REPLACE INTO uploads VALUES (?, ?, ?)",
+                                     [(path,) + local for path, local in self._uploaded.items() if local is not None])
+            self._uploaded = {}
+            self._db.close()
+
+    def _request(self, ctx, url, payload=None):
+        from office365.runtime.http.http_method import HttpMethod
+        from office365.runtime.http.request_options import RequestOptions
+
+        def send():
+            request = RequestOptions(url)
+            request.set_header('Accept', 'application/json;odata=nometadata')
+            if payload is not None:
+                request.method = HttpMethod.Post
+                request.set_header('Content-Type', 'application/json;odata=nometadata')
+                request.data = payload  # Sent as JSON by the transport
+            # The pending request signs the call and adds the form digest, like any query of ctx
+            return ctx.pending_request().execute_request_direct(request).json()
+
+        return get_throttle_controller().call(send, "remote index")
+
+    def _list_api(self, ctx, library):
+        """The library's endpoint and the @u alias that names it."""
+        escaped = library.replace("'", "''")
+        return f"{ctx.base_url.rstrip('/')}/_api/web/GetList(@u)", f"@u='{quote(escaped)}'"
+
+    @staticmethod
+    def _rows(library, items):
+        """files rows for the list items that are files (folders have FSObjType 1)."""
+        rows = []
+        for item in items:
+            file = item.get('File')
+            if item.get('FSObjType') == 1 or not file:
+                continue
+            rows.append((library, item['Id'], item['FileRef'], int(file.get('Length') or 0),
+                         _parse_time(file.get('TimeLastModified')), file.get('ETag')))
+        return rows
+
+    def _build(self, ctx, library, page_size=LISTING_PAGE_SIZE):
+        list_api, alias = self._list_api(ctx, library)
+        # Take the token first, so changes made while listing are replayed by the next refresh
+        token = self._request(ctx, f"{list_api}?$select=CurrentChangeToken&{alias}")['CurrentChangeToken']['StringValue']
+        url = f"{list_api}/Items?{ITEM_SELECT}&$top={page_size}&{alias}"
+        rows = []
+        while url:
+            page = self._request(ctx, url)
+            rows.extend(self._rows(library, page.get('value', [])))
+            url = page.get('odata.nextLink')
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM files WHERE library = ?", (library,))
+            self._db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO libraries VALUES (?, ?, ?)", (library, token, time.time()))
+        print(f"Remote index: listed {len(rows)} file(s) in {library}")
+
+    def _apply_changes(self, ctx, library, token):
+        list_api, alias = self._list_api(ctx, library)
+        changed_ids = set()
+        removed_ids = set()
+        while True:
+            query = {'query': {'Item': True, 'Add': True, 'Update': True, 'DeleteObject': True, 'Rename': True,
+                               'Move': True, 'Restore': True, 'FetchLimit': CHANGE_PAGE_SIZE,
+                               'ChangeTokenStart': {'StringValue': token}}}
+            changes = self._request(ctx, f"{list_api}/GetChanges?{alias}", query).get('value', [])
+            for change in changes:
+                item_id = change.get('ItemId')
+                if change.get('ChangeType') in REMOVED_CHANGE_TYPES:
+                    removed_ids.add(item_id)
+                    changed_ids.discard(item_id)
+                else:
+                    changed_ids.add(item_id)
+                    removed_ids.discard(item_id)
+            if changes:
+                token = changes[-1]['ChangeToken']['StringValue']
+            if len(changes) < CHANGE_PAGE_SIZE:
+                break
+
+        rows = []
+        ids = sorted(changed_ids)
+        for start in range(0, len(ids), ITEM_LOOKUP_BATCH):
+            batch = ids[start:start + ITEM_LOOKUP_BATCH]
+            id_filter = quote(' or '.join(f"Id eq {item_id}" for item_id in batch))
+            items = self._request(ctx, f"{list_api}/Items?{ITEM_SELECT}&$filter={id_filter}&{alias}").get('value', [])
+            # An item changed and then deleted before this refresh is simply not returned
+            removed_ids.update(set(batch) - {item['Id'] for item in items})
+            rows.extend(self._rows(library, items))
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM files WHERE library = ? AND item_id = ?",
+                                 [(library, item_id) for item_id in removed_ids])
+            self._db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO libraries VALUES (?, ?, ?)", (library, token, time.time()))
+        print(f"Remote index: {len(rows)} changed and {len(removed_ids)} removed item(s) in {library}")
+
+    def refresh(self, ctx, folder_url):
+        """Bring the index of folder_url's library up to date; False if SharePoint could not be asked."""
+        self.web_path = urlsplit(ctx.base_url).path.rstrip('/')
+        library = get_library_url(ctx, folder_url)
+        with self._lock:
+            stored = self._db.execute("SELECT change_token FROM libraries WHERE library = ?", (library,)).fetchone()
+        try:
+            if stored and stored[0]:
+                try:
+                    self._apply_changes(ctx, library, stored[0])
+                    return True
+                except Exception as e:
+                    print(f"Remote index: change log not usable ({str(e)}), listing {library} again")
+            self._build(ctx, library)
+            return True
+        except Exception as e:
+            print(f"Remote index not refreshed: {str(e)}")
+            return False
+
+    def lookup(self, file_url):
+        """{'size', 'modified', 'etag'} of the remote file at file_url, or None if it is not there."""
+        with self._lock:
+            row = self._db.execute("SELECT size, modified, etag FROM files WHERE path = ?", (file_url,)).fetchone()
+        if row is None:
+            return None
+        return {'size': row[0], 'modified': row[1], 'etag': row[2]}
+
+    def iter_changed(self, pending_files, folder_url, skipped):
+        """Lazily yield the (file_name, full_path, file_size) tuples the destination does not have yet.
+
+        A file is skipped (and its name appended to skipped) when the remote
+        copy has the local size and the local file still has the size and
+        mtime it had when this index recorded its upload. The stat comes
+        from the scan when the tuples carry one (source_scan.ScannedFile).
+        """
+        folder_url = get_server_relative_url(self.web_path, folder_url)
+        for item in pending_files:
+            file_name, full_path, file_size = item
+            if not isinstance(full_path, str):
+                yield item
+                continue
+            file_url = f"{folder_url}/{file_name}"
+            try:
+                stat = getattr(item, 'stat', None) or os.stat(full_path)
+            except OSError:
+                yield item
+                continue
+            local = (stat.st_size, stat.st_mtime_ns)
+            self._scanned[file_url] = local
+            remote = self.lookup(file_url)
+            with self._lock:
+                uploaded = self._db.execute("SELECT size, mtime_ns FROM uploads WHERE path = ?", (file_url,)).fetchone()
+            if remote is not None and remote['size'] == file_size and uploaded == local:
+                skipped.append(file_name)
+            else:
+                yield item
+
+    def record_upload(self, folder_url, file_name):
+        """Remember the local stat iter_changed saw for a file that has now been uploaded."""
+        file_url = f"{get_server_relative_url(self.web_path, folder_url)}/{file_name}"
+        local = self._scanned.pop(file_url, None)
+        if local is not None:
+            self._uploaded[file_url] = local
+
+    def forget_upload(self, folder_url, file_name):
+        """Drop the upload record of a file so the next run uploads it again."""
+        self._uploaded[f"{get_server_relative_url(self.web_path, folder_url)}/{file_name}"] = None
+
+    def read_frame(self, folder_url):
+        """pandas DataFrame of the indexed files under folder_url, with paths relative to it."""
+        import pandas as pd
+
+        prefix = f"{get_server_relative_url(self.web_path, folder_url)}/"
+        with self._lock:
+            return pd.read_sql_query(
+                "SELECT substr(path, ?) AS path, size AS remote_size, modified AS remote_modified, etag "
+                "FROM files WHERE substr(path, 1, ?) = ?",
+                self._db, params=(len(prefix) + 1, len(prefix), prefix))
+
+def write_reconciliation_report(index, folder_url, pending_files, report_path):
+    """Compare local files with the index of folder_url and write a CSV report.
+
+    pending_files are (file_name, full_path, file_size) tuples, as from
+    source_scan. The comparison is one pandas outer join, so it stays fast
+    for hundreds of thousands of files. Returns {status: count}.
+    """
+    import numpy as np
+    import pandas as pd
+
+    local = pd.DataFrame(
+        [(item[0], item[2], (getattr(item, 'stat', None) or os.stat(item[1])).st_mtime) for item in pending_files],
+        columns=['path', 'local_size', 'local_modified'])
+    merged = local.merge(index.read_frame(folder_url), on='path', how='outer', indicator=True)
+    merged['status'] = np.select(
+        [merged['_merge'] == 'left_only',
+         merged['_merge'] == 'right_only',
+         merged['local_size'] != merged['remote_size'],
+         merged['local_modified'] // 1 > merged['remote_modified']],
+        ['missing remotely', 'only remote', 'size differs', 'newer locally'],
+        'in sync')
+    for column in ('local_modified', 'remote_modified'):
+        merged[column] = pd.to_datetime(merged[column], unit='s')
+    merged.drop(columns='_merge').sort_values('path').to_csv(report_path, index=False)
+    return merged['status'].value_counts().to_dict()
+
+def open_remote_index(config_values):
+    """Return a RemoteIndex when RemoteIndex is on in config, else None."""
+    if not is_enabled(config_values, 'RemoteIndex'):
+        return None
+    return RemoteIndex(get_remote_index_path(config_values))
+
+if __name__ == "__main__":
+    import argparse
+    from source_scan import get_source_filter, is_recursive, scan_source_files
+    from upload_run import get_sharepoint_context_using_app, read_config_file
+
+    parser = argparse.ArgumentParser(description="Refresh the remote index and write a local-vs-remote report.")
+    parser.add_argument('report_path', nargs='?', help="CSV to write instead of reconciliation_report.csv")
+    args = parser.parse_args()
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    config_values = read_config_file(os.path.join(script_dir, "config.txt"))
+    folder_url = config_values.get('DestinationFolderURL')
+    source_folder_path = config_values.get('SourceFolderPath')
+    index = RemoteIndex(get_remote_index_path(config_values))
+    if not index.refresh(get_sharepoint_context_using_app(config_values), folder_url):
+        sys.exit(1)
+    report_path = args.report_path or os.path.join(script_dir, "reconciliation_report.csv")
+    source_filter = get_source_filter(config_values, config_values.get('FileName'))
+    counts = write_reconciliation_report(index, folder_url,
+                                         scan_source_files(source_folder_path, source_filter, is_recursive(config_values)),
+                                         report_path)
+    index.close()
+    print(f"Reconciliation report written to {report_path}")
+    for status, count in sorted(counts.items()):
+        print(f"  {status}: {count}")
@@ -0,0 +1,42 @@
+from transfer_metrics import get_metrics
+
+LISTING_PAGE_SIZE = 5000
+
+def is_verification_enabled(config_values):
+    """Bulk verification runs unless VerifyUploads is switched off in config."""
+    return (config_values.get('VerifyUploads') or 'true').strip().lower() not in ('0', 'false', 'no', 'off')
+
+def list_remote_files(ctx, folder_url, page_size=LISTING_PAGE_SIZE):
+    """Return {file name: length} for every file in a destination folder.
+
+    Only Name and Length are selected and the listing is fetched in pages of
+    page_size, so a folder of N files costs about N / page_size requests.
+    """
+    files = ctx.web.get_folder_by_server_relative_url(folder_url).files
+    files.select(["Name", "Length"]).get_all(page_size).execute_query()
+    return {remote_file.name: int(remote_file.length or 0) for remote_file in files}
+
+def reconcile_uploads(ctx, folder_url, expected_sizes):
+    """Compare the files of a run against the destination folder in one pass.
+
+    expected_sizes maps file name to local size; names containing / are
+    checked in that sub-folder, one listing per sub-folder. Returns a dict of
+    {file name: reason} for every file that is missing remotely or whose
+    remote length differs; an empty dict means the whole run verified.
+    """
+    if not expected_sizes:
+        return {}
+    remote_sizes = {}
+    with get_metrics().timed('verification'):
+        for sub_folder in sorted({name.rpartition('/')[0] for name in expected_sizes}):
+            prefix = f"{sub_folder}/" if sub_folder else ''
+            listed = list_remote_files(ctx, f"{folder_url}/{sub_folder}" if sub_folder else folder_url)
+            remote_sizes.update({prefix + name: length for name, length in listed.items()})
+    problems = {}
+    for file_name, expected_size in expected_sizes.items():
+        actual_size = remote_sizes.get(file_name)
+        if actual_size is None:
+            problems[file_name] = "missing after upload"
+        elif actual_size != expected_size:
+            problems[file_name] = f"size mismatch, expected {expected_size}, got {actual_size}"
+    return problems
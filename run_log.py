@@ -0,0 +1,239 @@
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from transfer_metrics import get_metrics
+
+FLUSH_EVERY = 50
+FLUSH_SECONDS = 5.0
+DEFAULT_HEADER = ['File Name', 'Timestamp', 'Status']
+# Workbook property recording the JSONL byte offset exported so far
+EXPORTED_OFFSET_PROPERTY = 'RunLogOffset'
+
+_open_logs = {}
+_open_logs_lock = threading.Lock()
+
+def read_entries(log_path, offset=0):
+    """Yield logged entries oldest first, skipping a line torn by a crash."""
+    for entry, _ in _read_entries_from(log_path, offset):
+        yield entry
+
+def _read_entries_from(log_path, offset):
+    """Yield (entry, offset after it) for the complete lines from byte offset on."""
+    try:
+        with open(log_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    return
+                offset += len(line)
+                try:
+                    yield json.loads(line), offset
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        return
+
+def _format_timestamp(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return '' if value is None else str(value)
+
+def _save_with_offset(workbook, xlsx_path, offset):
+    """Record offset as exported and save the workbook through a temporary file."""
+    from openpyxl.packaging.custom import IntProperty
+
+    props = workbook.custom_doc_props
+    for prop in [p for p in props if p.name == EXPORTED_OFFSET_PROPERTY]:
+        props.props.remove(prop)
+    props.append(IntProperty(name=EXPORTED_OFFSET_PROPERTY, value=offset))
+    tmp_path = f"{xlsx_path}.tmp.xlsx"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, xlsx_path)
+
+def seed_from_xlsx(xlsx_path, log_path):
+    """Copy the rows of an existing xlsx log (newest first) into a new JSONL log.
+
+    The workbook is then marked as exported up to the end of those rows,
+    so later exports only add what is logged after them.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(xlsx_path)
+    rows = [row for row in workbook.active.iter_rows(min_row=2, max_col=3, values_only=True) if any(row)]
+    with open(log_path, 'w', encoding='utf-8') as f:
+        for file_name, timestamp, status in reversed(rows):
+            f.write(json.dumps({
+                'file_name': file_name,
+                'timestamp': _format_timestamp(timestamp),
+                'status': status,
+            }) + "\n")
+    _save_with_offset(workbook, xlsx_path, os.path.getsize(log_path))
+    print(f"Imported {len(rows)} row(s) from {xlsx_path} into {log_path}")
+
+def _exported_offset(workbook):
+    """The JSONL offset recorded by the last export, or None for a workbook no export has written."""
+    prop = next((p for p in workbook.custom_doc_props if p.name == EXPORTED_OFFSET_PROPERTY), None)
+    try:
+        return int(prop.value) if prop else None
+    except (TypeError, ValueError):
+        return None
+
+def export_to_xlsx(log_path, xlsx_path):
+    """Add the JSONL entries not yet in the xlsx log under its header row, newest first.
+
+    The workbook remembers how far into the JSONL log it has been exported
+    (the RunLogOffset document property), so only entries appended since
+    are added. Its other rows, sheets and formatting are kept. An existing
+    workbook without that property was not written by this log and may hold
+    rows the JSONL does not, so it is left alone and ValueError is raised.
+    The workbook is saved to a temporary file and swapped in, so a crash
+    never leaves it half saved.
+    """
+    from openpyxl import Workbook, load_workbook
+
+    log_size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+    if os.path.exists(xlsx_path):
+        workbook = load_workbook(xlsx_path)
+        offset = _exported_offset(workbook)
+        if offset is None:
+            raise ValueError(f"{xlsx_path} has no {EXPORTED_OFFSET_PROPERTY} property and may hold rows "
+                             f"that are not in {log_path}; not overwriting it")
+        if offset > log_size:
+            # The JSONL log was replaced since the last export: all of it is new
+            offset = 0
+    else:
+        workbook = Workbook()
+        workbook.active.append(DEFAULT_HEADER)
+        offset = 0
+
+    new_rows = []
+    end_offset = offset
+    for entry, end_offset in _read_entries_from(log_path, offset):
+        status = entry.get('status')
+        if entry.get('destination'):
+            status = f"{status} ({entry['destination']})"
+        new_rows.append([entry.get('file_name'), entry.get('timestamp'), status])
+    if not new_rows and os.path.exists(xlsx_path):
+        return
+
+    sheet = workbook.active
+    sheet.insert_rows(2, len(new_rows))
+    for row_index, row in enumerate(reversed(new_rows), start=2):
+        for column, value in enumerate(row, start=1):
+            sheet.cell(row=row_index, column=column, value=value)
+    _save_with_offset(workbook, xlsx_path, end_offset)
+
+class RunLog:
+    """Append-only upload log with buffered writes.
+
+    Entries are one JSON object per line. They are written in batches of
+    flush_every (or every FLUSH_SECONDS) and fsynced, so a crash loses at most
+    the unflushed batch and never corrupts earlier entries. close() flushes
+    and, with an export_path, adds the run's entries to the xlsx log. An
+    entry appended after close() is written straight to the file and
+    exported with the next run.
+    """
+
+    def __init__(self, log_path, export_path=None, flush_every=FLUSH_EVERY):
+        self.log_path = log_path
+        self.export_path = export_path
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._file = open(log_path, 'a', encoding='utf-8')
+
+    def append(self, file_name, status, **details):
+        entry = {
+            'file_name': file_name,
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'status': status,
+        }
+        entry.update(details)
+        with self._lock:
+            if self._file.closed:
+                # A result that arrives after close() still reaches the log
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + "\n")
+                return
+            self._buffer.append(json.dumps(entry) + "\n")
+            if len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush > FLUSH_SECONDS:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._buffer and not self._file.closed:
+            with get_metrics().timed('log_write'):
+                self._file.write(''.join(self._buffer))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self, export=True):
+        """Flush, close and export to xlsx. Safe to call more than once."""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush_locked()
+            self._file.close()
+        with _open_logs_lock:
+            _open_logs.pop(self.log_path, None)
+        if export and self.export_path:
+            try:
+                with get_metrics().timed('log_export'):
+                    export_to_xlsx(self.log_path, self.export_path)
+            except Exception as e:
+                print(f"Could not export log to {self.export_path}: {str(e)}")
+
+def get_run_log_path(config_values):
+    run_log_path = config_values.get('RunLogPath')
+    if run_log_path:
+        return run_log_path
+    return os.path.splitext(config_values.get('LogFilePath'))[0] + ".jsonl"
+
+def open_run_log(config_values, create=False):
+    """Return the process-wide RunLog for the configured LogFilePath.
+
+    Returns None when no LogFilePath is configured, or when the xlsx log does
+    not exist and create is False, matching the old "log only if the
+    workbook exists" behaviour. An existing xlsx log seeds a new JSONL log
+    so its history is carried over. LogExport=none skips the end-of-run
+    export; run `python run_log.py <log.jsonl> <log.xlsx>` to export on demand.
+    """
+    xlsx_path = config_values.get('LogFilePath')
+    if not xlsx_path or not (create or os.path.exists(xlsx_path)):
+        return None
+    log_path = get_run_log_path(config_values)
+    export = (config_values.get('LogExport') or 'end').strip().lower() != 'none'
+    with _open_logs_lock:
+        run_log = _open_logs.get(log_path)
+        if run_log is None:
+            if not os.path.exists(log_path) and os.path.exists(xlsx_path):
+                try:
+                    seed_from_xlsx(xlsx_path, log_path)
+                except Exception as e:
+                    print(f"Could not import existing log {xlsx_path}: {str(e)}")
+            run_log = RunLog(log_path, xlsx_path if export else None)
+            _open_logs[log_path] = run_log
+    return run_log
+
+def close_run_logs():
+    """Close (and export) every RunLog opened through open_run_log."""
+    with _open_logs_lock:
+        run_logs = list(_open_logs.values())
+    for run_log in run_logs:
+        run_log.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: run_log.py <log.jsonl> <log.xlsx>")
+        sys.exit(1)
+    export_to_xlsx(sys.argv[1], sys.argv[2])
+    print(f"Exported {sys.argv[1]} to {sys.argv[2]}")
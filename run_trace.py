@@ -0,0 +1,204 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Spans shorter than this are counted in the metrics but left out of the trace
+MIN_SPAN_SECONDS = 0.0001
+# Events kept per run, so a long watch or service does not grow without bound
+MAX_EVENTS = 1000000
+DEFAULT_SAMPLE_INTERVAL_MS = 10
+
+def new_run_id():
+    """Start time and process id, shared by a run's trace, profile and metrics."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+class RunTrace:
+    """Spans of one run for the Chrome trace-event format (Perfetto, chrome://tracing).
+
+    Off until configure_tracing() switches it on; while off every call
+    returns at once. complete() records a span that ran on the calling
+    thread and instant() a point event such as a retry. TransferMetrics
+    feeds it, so phases, files and chunks show up without separate hooks.
+    With a profiler it also keeps a cProfile of the main thread and of each
+    worker's uploads, or samples every thread's stack, for the same run.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.run_id = new_run_id()
+        self.trace_dir = None
+        self.profiler = None
+        self._lock = threading.Lock()
+        self._origin = time.monotonic()
+        self._events = []
+        self._threads = {}
+        self._profiles = []
+        self._main_profile = None
+        self._samples = Counter()
+
+    def _thread_id(self):
+        thread = threading.current_thread()
+        if thread.ident not in self._threads:
+            self._threads[thread.ident] = thread.name
+        return thread.ident
+
+    def complete(self, name, category, started_at, seconds, **args):
+        """Record a span of the calling thread that started at monotonic time started_at."""
+        if not self.enabled or seconds < MIN_SPAN_SECONDS:
+            return
+        event = {'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(),
+                 'ts': round((started_at - self._origin) * 1e6, 1), 'dur': round(seconds * 1e6, 1)}
+        if args:
+            event['args'] = args
+        with self._lock:
+            event['tid'] = self._thread_id()
+            if len(self._events) < MAX_EVENTS:
+                self._events.append(event)
+
+    def instant(self, name, category, **args):
+        if not self.enabled:
+            return
+        event = {'name': name, 'cat': category, 'ph': 'i', 's': 't', 'pid': os.getpid(),
+                 'ts': round((time.monotonic() - self._origin) * 1e6, 1)}
+        if args:
+            event['args'] = args
+        with self._lock:
+            event['tid'] = self._thread_id()
+            if len(self._events) < MAX_EVENTS:
+                self._events.append(event)
+
+    @contextmanager
+    def span(self, name, category, **args):
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.complete(name, category, started_at, time.monotonic() - started_at, **args)
+
+    @contextmanager
+    def profiled(self):
+        """cProfile the enclosed work of a worker thread when Profile=cprofile."""
+        if self.profiler != 'cprofile' or threading.current_thread() is threading.main_thread():
+            yield
+            return
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process: only the main thread is profiled
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._profiles.append(profile)
+
+    def start_profiler(self, profiler, interval_ms=DEFAULT_SAMPLE_INTERVAL_MS):
+        self.profiler = profiler
+        if profiler == 'cprofile':
+            import cProfile
+
+            self._main_profile = cProfile.Profile()
+            self._main_profile.enable()
+        elif profiler == 'sample':
+            threading.Thread(target=self._sample, args=(interval_ms / 1000.0,), name='sampler', daemon=True).start()
+
+    def _sample(self, interval):
+        """Count each thread's current stack every interval seconds (collapsed-stack format)."""
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(interval)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                with self._lock:
+                    self._samples[';'.join(reversed(stack))] += 1
+
+    def _write_profile(self, base_path):
+        if self.profiler == 'cprofile':
+            import pstats
+
+            self._main_profile.disable()
+            with self._lock:
+                profiles = list(self._profiles)
+            stats = pstats.Stats(self._main_profile)
+            for profile in profiles:
+                stats.add(profile)
+            stats.dump_stats(f"{base_path}.pstats")
+            self._main_profile.enable()
+            return f"{base_path}.pstats"
+        if self.profiler == 'sample':
+            with self._lock:
+                samples = list(self._samples.items())
+            with open(f"{base_path}.folded", 'w', encoding='utf-8') as f:
+                for stack, count in samples:
+                    f.write(f"{stack} {count}\n")
+            return f"{base_path}.folded"
+        return None
+
+    def write(self):
+        """Write trace-<run id>.json, and the profile of the same run, to trace_dir."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_id, 'args': {'name': name}}
+                    for thread_id, name in threads.items()]
+        trace_path = os.path.join(self.trace_dir, f"trace-{self.run_id}.json")
+        try:
+            profile_path = self._write_profile(os.path.join(self.trace_dir, f"profile-{self.run_id}"))
+            tmp_path = f"{trace_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms',
+                           'otherData': {'run_id': self.run_id, 'script': os.path.basename(sys.argv[0]),
+                                         'profile': profile_path and os.path.basename(profile_path)}}, f)
+            os.replace(tmp_path, trace_path)
+        except OSError as e:
+            print(f"Could not write run trace: {str(e)}")
+            return None
+        return trace_path
+
+_trace = RunTrace()
+
+def configure_tracing(config_values):
+    """Switch tracing on when Trace is set in config.
+
+    Trace=true writes trace-<run id>.json next to the executable, or in the
+    folder TraceDir names. Profile=cprofile or Profile=sample (every
+    ProfileIntervalMs, default 10) adds profile-<run id>.pstats or .folded.
+    """
+    value = (config_values.get('Trace') or '').strip().lower() if config_values else ''
+    if _trace.enabled or value not in ('1', 'true', 'yes', 'on'):
+        return
+    _trace.trace_dir = config_values.get('TraceDir') or os.path.dirname(os.path.abspath(sys.argv[0]))
+    _trace.enabled = True
+    profiler = (config_values.get('Profile') or '').strip().lower()
+    if profiler in ('cprofile', 'sample'):
+        try:
+            interval_ms = float(config_values.get('ProfileIntervalMs') or DEFAULT_SAMPLE_INTERVAL_MS)
+        except ValueError:
+            interval_ms = DEFAULT_SAMPLE_INTERVAL_MS
+        _trace.start_profiler(profiler, interval_ms)
+    elif profiler not in ('', 'none', 'off'):
+        print(f"Invalid Profile '{profiler}', not profiling")
+    print(f"Tracing run {_trace.run_id}")
+
+def get_trace():
+    """Return the process-wide trace shared by all upload paths."""
+    return _trace
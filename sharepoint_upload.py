@@ -0,0 +1,375 @@
+import os
+import re
+import threading
+import time
+import uuid
+from urllib.parse import quote
+
+from bandwidth_limit import configure_bandwidth_limit, get_bandwidth_limiter
+from chunk_reader import (DEFAULT_READ_AHEAD_BUFFERS, get_chunk_size_limit, get_read_ahead_buffers, iter_file_chunks,
+                          use_memory_map)
+from chunk_tuning import ChunkSizeTuner, create_chunk_tuner
+from content_hash import StreamHasher, get_hash_algorithm, new_hash, record_upload_hash
+from throttling import get_throttle_controller
+from upload_journal import create_upload_session, open_upload_journal, open_upload_session
+
+DEFAULT_BATCH_FILE_MAX_KB = 0
+DEFAULT_BATCH_MAX_FILES = 20
+DEFAULT_BATCH_MAX_MB = 4
+DEFAULT_SINGLE_REQUEST_MAX_MB = 10
+
+def _get_number(config_values, key, default):
+    value = config_values.get(key) if config_values else None
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"Invalid {key} '{value}', using {default}")
+        return default
+
+def get_batch_file_max_size(config_values):
+    """Files up to BatchFileMaxKB go into $batch requests; off (0) unless set."""
+    return _get_number(config_values, 'BatchFileMaxKB', DEFAULT_BATCH_FILE_MAX_KB) * 1024
+
+def get_single_request_max_size(config_values):
+    """Files up to SingleRequestMaxMB are read whole and sent in one request.
+
+    Anything larger goes through an upload session so only a chunk or two
+    is in memory at a time. The limit never exceeds the chunk size that
+    MaxUploadMemoryMB allows.
+    """
+    max_size = _get_number(config_values, 'SingleRequestMaxMB', DEFAULT_SINGLE_REQUEST_MAX_MB) * 1024 * 1024
+    chunk_limit = get_chunk_size_limit(config_values)
+    return min(max_size, chunk_limit) if chunk_limit else max_size
+
+def choose_upload_strategy(file_size, config_values):
+    """'batch' for tiny files, 'single' for one-request uploads, 'chunked' above SingleRequestMaxMB."""
+    if file_size > get_single_request_max_size(config_values):
+        return 'chunked'
+    batch_file_max_size = get_batch_file_max_size(config_values)
+    if batch_file_max_size and file_size <= batch_file_max_size:
+        return 'batch'
+    return 'single'
+
+def get_folder_url(target_folder):
+    """Server-relative URL of target_folder, loaded the first time it is needed.
+
+    A folder from get_folder_by_server_relative_url has no properties until
+    it is loaded, and session and journal keys need its real URL.
+    """
+    if not target_folder.is_property_available('ServerRelativeUrl'):
+        get_throttle_controller().call(
+            lambda: target_folder.get().select(['ServerRelativeUrl']).execute_query(), "folder lookup")
+    return target_folder.server_relative_url
+
+def upload_in_one_request(target_folder, file_path, file_name, file_size, config_values=None):
+    """Read a file into memory and upload it in one request, hashing the exact bytes that were sent.
+
+    Only for files up to SingleRequestMaxMB; larger ones go through
+    upload_file_in_chunks. The bandwidth limit is charged once, not again
+    for each retry.
+    """
+    configure_bandwidth_limit(config_values)
+    content_hash = get_hash_algorithm(config_values)
+    with open(file_path, 'rb') as content_file:
+        content = content_file.read()
+
+    get_bandwidth_limiter().acquire(len(content))
+    uploaded_file = get_throttle_controller().call(
+        lambda: target_folder.upload_file(file_name, content).execute_query(), "upload")
+    if content_hash:
+        digest = new_hash(content_hash)
+        digest.update(content)
+        record_upload_hash(file_path, content_hash, digest.hexdigest(), uploaded_file)
+    return uploaded_file
+
+def upload_file_in_chunks(ctx, target_folder, file_path, file_name, chunk_size_mb=10,
+                          read_ahead_buffers=DEFAULT_READ_AHEAD_BUFFERS, chunk_tuner=None, journal=None,
+                          verify=False, use_mapped=True, file_size=None, content_hash=None):
+    """Upload a file through an upload session, one chunk at a time.
+
+    An empty staging file is added next to the destination and every
+    chunk, including the first, is sent with upload_chunk / finish_upload
+    on its session; finishing moves it over the destination, so an
+    existing file is only replaced by a complete upload.
+    Chunks are zero-copy slices of a memory map of the file, or read ahead
+    on a background thread with use_mapped=False (at most
+    read_ahead_buffers in memory). A chunk_tuner picks each chunk's size
+    instead of chunk_size_mb. With a journal, a failed session is kept so a
+    later call for the same unchanged file resumes from the offset the
+    server committed; otherwise it is cancelled. With content_hash the
+    chunks are hashed as they are sent (see content_hash.pop_hash). verify
+    looks the file up afterwards and compares its length; leave it off
+    when the caller reconciles the whole run (remote_verify).
+    """
+    if chunk_tuner is None:
+        chunk_tuner = ChunkSizeTuner(chunk_size_mb * 1024 * 1024)
+    if file_size is None:
+        file_size = os.path.getsize(file_path)
+    offset = 0
+    upload_session = None
+    journal_key = None
+
+    try:
+        print(f"Starting chunked upload for '{file_name}' ({file_size / 1024 / 1024:.2f} MB)")
+
+        throttle = get_throttle_controller()
+        target_file_url = f"{get_folder_url(target_folder)}/{file_name}"
+        upload_session, start_offset, journal_key = open_upload_session(
+            ctx, journal, file_path, target_file_url,
+            lambda: throttle.call(
+                lambda: create_upload_session(ctx, target_folder, target_file_url, file_name),
+                "upload session"
+            ),
+            chunk_tuner.next_size()
+        )
+        offset = start_offset
+
+        chunks = iter_file_chunks(file_path, chunk_tuner.next_size, read_ahead_buffers, start_offset, use_mapped)
+        # Hashed on a helper thread while each chunk is sent, so the file is read only once
+        hasher = StreamHasher(content_hash) if content_hash else None
+        if hasher:
+            if start_offset:
+                hasher.hash_prefix(file_path, start_offset)
+            chunks = hasher.hashed(chunks)
+
+        started_at = time.monotonic()
+        uploaded_file = None
+        for offset, chunk in chunks:
+            is_last = (offset + len(chunk)) >= file_size
+
+            def send_chunk():
+                with chunk_tuner.measure(len(chunk)):
+                    if is_last:
+                        return upload_session.finish_upload(offset, chunk).execute_query()
+                    return upload_session.upload_chunk(offset, chunk).execute_query()
+
+            # Retries transient errors; backs off only when SharePoint throttles
+            uploaded_file = throttle.call(send_chunk, "chunk")
+            if journal_key and not is_last:
+                journal.update(journal_key, offset + len(chunk), chunk_tuner.next_size())
+            print(f"Uploaded {(offset + len(chunk)) / 1024 / 1024:.2f}MB of {file_size / 1024 / 1024:.2f}MB")
+
+        elapsed = max(time.monotonic() - started_at, 1e-6)
+        print(f"Transferred '{file_name}' at {(file_size - start_offset) / 1024 / 1024 / elapsed:.2f} MB/s")
+        if journal_key:
+            journal.remove(journal_key)
+            journal_key = None
+        if hasher:
+            record_upload_hash(file_path, content_hash, hasher.hexdigest(), uploaded_file)
+
+        if verify:
+            uploaded_file = ctx.web.get_file_by_server_relative_url(target_file_url)
+            ctx.load(uploaded_file, ["Length"])
+            ctx.execute_query()
+            if uploaded_file.length != file_size:
+                raise Exception(f"Size mismatch! Expected {file_size}, got {uploaded_file.length}")
+            print(f"Verified '{file_name}'")
+
+        chunk_tuner.save()
+        return uploaded_file
+
+    except Exception as e:
+        print(f"Upload failed at {offset / 1024 / 1024:.2f}MB: {str(e)}")
+        if journal_key:
+            print("Upload session kept in the journal; the next run resumes from the last confirmed chunk")
+        elif upload_session:
+            try:
+                upload_session.delete_object().execute_query()
+            except Exception as cleanup_error:
+                print(f"Could not cancel the upload session: {str(cleanup_error)}")
+        raise
+
+def upload_single_file(ctx, target_folder, file_path, file_name, file_size, config_values=None):
+    """Upload one file in one request, or through an upload session above SingleRequestMaxMB."""
+    print(f"\nProcessing: {file_name} ({file_size / 1024 / 1024:.2f} MB)")
+    if choose_upload_strategy(file_size, config_values) == 'chunked':
+        return upload_file_in_chunks(ctx, target_folder, file_path, file_name,
+                                     read_ahead_buffers=get_read_ahead_buffers(config_values),
+                                     chunk_tuner=create_chunk_tuner(config_values, ctx.base_url, 10),
+                                     journal=open_upload_journal(config_values),
+                                     use_mapped=use_memory_map(config_values), file_size=file_size,
+                                     content_hash=get_hash_algorithm(config_values))
+    return upload_in_one_request(target_folder, file_path, file_name, file_size, config_values)
+
+def _odata_string(value):
+    return quote(value.replace("'", "''"), safe="/")
+
+class FileBatch:
+    """Tiny files bound for one folder, uploaded together in one $batch request."""
+
+    def __init__(self, name, folder_url, members):
+        self.name = name
+        self.folder_url = folder_url
+        self.members = members  # [(file_name, full_path, file_size)], file_name without the folder
+
+    @property
+    def size(self):
+        return sum(size for _, _, size in self.members)
+
+def build_batch_body(site_url, batch):
+    """Multipart $batch body with one Files/add per member, each in its own changeset.
+
+    Separate changesets keep the files independent: one failing does not
+    roll back or hide the others. Returns (content_type, body, contents).
+    """
+    boundary = f"batch_{uuid.uuid4()}"
+    parts = []
+    contents = []
+    for file_name, full_path, _ in batch.members:
+        with open(full_path, 'rb') as f:
+            content = f.read()
+        contents.append(content)
+        changeset = f"changeset_{uuid.uuid4()}"
+        url = (f"{site_url}/_api/web/GetFolderByServerRelativeUrl('{_odata_string(batch.folder_url)}')"
+               f"/Files/add(url='{_odata_string(file_name)}',overwrite=true)")
+        parts.append((
+            f"--{boundary}\r\n"
+            f"Content-Type: multipart/mixed; boundary={changeset}\r\n\r\n"
+            f"--{changeset}\r\n"
+            "Content-Type: application/http\r\n"
+            "Content-Transfer-Encoding: binary\r\n\r\n"
+            f"POST {url} HTTP/1.1\r\n"
+            "Content-Type: application/octet-stream\r\n"
+            "Accept: application/json;odata=nometadata\r\n"
+            f"Content-Length: {len(content)}\r\n\r\n"
+        ).encode('utf-8') + content + f"\r\n--{changeset}--\r\n".encode('utf-8'))
+    body = b''.join(parts) + f"--{boundary}--\r\n".encode('utf-8')
+    return f"multipart/mixed; boundary={boundary}", body, contents
+
+def parse_batch_statuses(response_text):
+    """HTTP status of each inner response of a $batch reply, in request order."""
+    return [int(status) for status in re.findall(r'^HTTP/1\.1 (\d{3})', response_text, re.MULTILINE)]
+
+def send_batch(ctx, batch):
+    """POST batch to /_api/$batch; returns ({file_name: status}, {file_name: content})."""
+    from office365.runtime.http.http_method import HttpMethod
+    from office365.runtime.http.request_options import RequestOptions
+
+    content_type, body, contents = build_batch_body(ctx.base_url.rstrip('/'), batch)
+    get_bandwidth_limiter().acquire(len(body))
+
+    def post():
+        request = RequestOptions(f"{ctx.base_url.rstrip('/')}/_api/$batch")
+        request.method = HttpMethod.Post
+        request.set_header('Content-Type', content_type)
+        request.set_header('Accept', 'application/json;odata=nometadata')
+        request.data = body
+        # The pending request signs the call and adds the form digest, like any query of ctx
+        return ctx.pending_request().execute_request_direct(request)
+
+    response = get_throttle_controller().call(post, "batch upload")
+    statuses = parse_batch_statuses(response.content.decode('utf-8', 'replace'))
+    names = [file_name for file_name, _, _ in batch.members]
+    if len(statuses) != len(names):
+        raise ValueError(f"$batch returned {len(statuses)} responses for {len(names)} files")
+    return dict(zip(names, statuses)), dict(zip(names, contents))
+
+class BatchUploader:
+    """Groups tiny files into $batch requests that share the worker pool.
+
+    batch() passes other files through and replaces runs of tiny files for
+    the same folder with FileBatch items. wrap_upload() sends them, retrying
+    any file the batch did not accept with an ordinary upload, and
+    wrap_result() reports every member file on its own.
+    """
+
+    def __init__(self, target_folder_url, max_file_size, max_files=DEFAULT_BATCH_MAX_FILES,
+                 max_bytes=DEFAULT_BATCH_MAX_MB * 1024 * 1024):
+        self.target_folder_url = target_folder_url
+        self.max_file_size = max_file_size
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.batches = {}
+        self.batch_count = 0  # $batch requests that were accepted
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def _to_item(self, sub_folder, members):
+        if len(members) == 1:
+            file_name, full_path, file_size = members[0]
+            return (f"{sub_folder}/{file_name}" if sub_folder else file_name), full_path, file_size
+        with self._lock:
+            name = f"$batch {len(self.batches) + 1:04d}"
+        folder_url = f"{self.target_folder_url}/{sub_folder}" if sub_folder else self.target_folder_url
+        batch = FileBatch(name, folder_url, members)
+        item_name = f"{sub_folder}/{name}" if sub_folder else name
+        with self._lock:
+            self.batches[item_name] = batch
+        return item_name, batch, batch.size
+
+    def batch(self, pending_files):
+        """Lazily group (file_name, full_path, file_size) items into batches."""
+        groups = {}
+        for item in pending_files:
+            file_name, full_path, file_size = item
+            if not isinstance(full_path, str) or file_size > self.max_file_size:
+                yield item
+                continue
+            sub_folder, _, base_name = file_name.rpartition('/')
+            group = groups.setdefault(sub_folder, [])
+            group.append((base_name, full_path, file_size))
+            if len(group) >= self.max_files or sum(size for _, _, size in group) >= self.max_bytes:
+                yield self._to_item(sub_folder, groups.pop(sub_folder))
+        for sub_folder, group in groups.items():
+            yield self._to_item(sub_folder, group)
+
+    def wrap_upload(self, upload_one, config_values):
+        """Return an upload_one for the pool that also knows how to send batches."""
+        content_hash = get_hash_algorithm(config_values)
+
+        def upload_or_batch(ctx, target_folder, full_path, file_name, file_size):
+            if not isinstance(full_path, FileBatch):
+                return upload_one(ctx, target_folder, full_path, file_name, file_size)
+            batch = full_path
+            print(f"Sending {len(batch.members)} tiny file(s) in one $batch request")
+            try:
+                statuses, contents = send_batch(ctx, batch)
+                with self._lock:
+                    self.batch_count += 1
+            except Exception as e:
+                print(f"$batch failed ({str(e)}), uploading its files one by one")
+                statuses, contents = {}, {}
+            results = {}
+            for member_name, member_path, member_size in batch.members:
+                if 200 <= statuses.get(member_name, 0) < 300:
+                    if content_hash:
+                        digest = new_hash(content_hash)
+                        digest.update(contents[member_name])
+                        record_upload_hash(member_path, content_hash, digest.hexdigest())
+                    results[member_name] = None
+                    continue
+                try:
+                    upload_in_one_request(target_folder, member_path, member_name, member_size, config_values)
+                    results[member_name] = None
+                except Exception as e:
+                    results[member_name] = e
+            with self._lock:
+                self._results[id(batch)] = results
+
+        return upload_or_batch
+
+    def wrap_result(self, on_result):
+        """Return an on_result that reports each member of a batch."""
+        def report(file_name, error):
+            batch = self.batches.get(file_name)
+            if batch is None:
+                on_result(file_name, error)
+                return
+            with self._lock:
+                results = self._results.pop(id(batch), {})
+            sub_folder = file_name.rpartition('/')[0]
+            for member_name, _, _ in batch.members:
+                member_error = results.get(member_name, error)
+                on_result(f"{sub_folder}/{member_name}" if sub_folder else member_name, member_error)
+        return report
+
+def open_batch_uploader(config_values, target_folder_url):
+    """Return a BatchUploader when BatchFileMaxKB is set, else None."""
+    max_file_size = get_batch_file_max_size(config_values)
+    if max_file_size <= 0:
+        return None
+    max_files = int(_get_number(config_values, 'BatchMaxFiles', DEFAULT_BATCH_MAX_FILES))
+    max_bytes = _get_number(config_values, 'BatchMaxMB', DEFAULT_BATCH_MAX_MB) * 1024 * 1024
+    return BatchUploader(target_folder_url, max_file_size, max(1, max_files), max_bytes)
@@ -0,0 +1,119 @@
+import fnmatch
+import glob
+import os
+import re
+import time
+
+from sync_manifest import is_enabled
+from transfer_metrics import get_metrics
+
+def split_patterns(value):
+    """Split a FileName / ExcludeFileName value like "*.csv; *.xlsx" into patterns."""
+    return [pattern.strip() for pattern in re.split(r'[;,]', value or '') if pattern.strip()]
+
+def compile_patterns(patterns):
+    """Compile wildcard patterns into one regex, or None for an empty list.
+
+    Matching is case-insensitive on Windows, like fnmatch.fnmatch there.
+    """
+    if not patterns:
+        return None
+    flags = re.IGNORECASE if os.name == 'nt' else 0
+    return re.compile('|'.join(f"(?:{fnmatch.translate(pattern)})" for pattern in patterns), flags)
+
+class SourceFilter:
+    """Include/exclude wildcard patterns, compiled once and applied to each entry.
+
+    Include patterns match the file name. Exclude patterns match the file
+    name or its path relative to the source folder (with / separators), so
+    "archive/*" skips a whole sub-folder and "archive" skips every
+    sub-folder of that name.
+    """
+
+    def __init__(self, include, exclude=None):
+        self.include = compile_patterns(include)
+        self.exclude = compile_patterns(exclude or [])
+
+    def matches(self, file_name, relative_name=None):
+        if self.include is None or not self.include.match(file_name):
+            return False
+        if self.exclude is not None:
+            if self.exclude.match(file_name) or (relative_name and self.exclude.match(relative_name)):
+                return False
+        return True
+
+    def excludes_folder(self, folder_name, relative_name=None):
+        """Whether a sub-folder is skipped, by its own name or its relative path."""
+        if self.exclude is None:
+            return False
+        names = [folder_name] + ([relative_name] if relative_name else [])
+        return any(self.exclude.match(name) or self.exclude.match(name + '/') for name in names)
+
+def get_source_filter(config_values, wildcard_pattern, single_file=False):
+    """Filter for a FileName value, or with single_file for one file name matched as it is.
+
+    A single file (a path given on the command line) is never split into
+    patterns, so "Report, Q1.xlsx" or "[draft].txt" still match.
+    """
+    include = [glob.escape(wildcard_pattern)] if single_file else split_patterns(wildcard_pattern)
+    return SourceFilter(include,
+                        split_patterns(config_values.get('ExcludeFileName')))
+
+def is_recursive(config_values):
+    return is_enabled(config_values, 'ScanRecursive')
+
+class ScannedFile(tuple):
+    """(relative_name, full_path, file_size) with the scan's os.stat_result as .stat."""
+
+    def __new__(cls, relative_name, full_path, stat):
+        item = super().__new__(cls, (relative_name, full_path, stat.st_size))
+        item.stat = stat
+        return item
+
+def scan_source_files(source_folder_path, source_filter, recursive=False, on_missing=None):
+    """Lazily yield (relative_name, full_path, file_size) for each matching file.
+
+    Built on os.scandir, so file type comes from the directory listing and
+    the size from the entry's cached stat (free on Windows, one stat per
+    match elsewhere). Files are yielded as they are found, so uploads can
+    start while the rest of the tree is still being scanned. relative_name
+    uses / separators and is the plain file name at the top level. Each
+    tuple is a ScannedFile, so later steps can use its .stat instead of
+    asking the file system again. Files that vanish mid-scan are passed to
+    on_missing(relative_name).
+    """
+    metrics = get_metrics()
+    folders = [(source_folder_path, '')]
+    while folders:
+        folder_path, prefix = folders.pop()
+        resumed_at = time.monotonic()
+        try:
+            entries = os.scandir(folder_path)
+        except OSError as e:
+            print(f"Cannot scan {folder_path}: {str(e)}")
+            continue
+        with entries:
+            for entry in entries:
+                relative_name = prefix + entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError as e:
+                    print(f"Cannot scan {entry.path}: {str(e)}")
+                    continue
+                if is_dir:
+                    if recursive and not source_filter.excludes_folder(entry.name, relative_name):
+                        folders.append((entry.path, relative_name + '/'))
+                    continue
+                try:
+                    if not entry.is_file() or not source_filter.matches(entry.name, relative_name):
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    if on_missing:
+                        on_missing(relative_name)
+                    continue
+                # Only the time between yields is the scan's; the rest belongs to the caller
+                metrics.add_time('scan', time.monotonic() - resumed_at, resumed_at)
+                yield ScannedFile(relative_name, entry.path, stat)
+                resumed_at = time.monotonic()
+        metrics.add_time('scan', time.monotonic() - resumed_at, resumed_at)
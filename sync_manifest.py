@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+SAVE_EVERY = 100
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def is_enabled(config_values, key):
+    return (config_values.get(key) or '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def get_manifest_path(config_values):
+    manifest_path = config_values.get('ManifestPath')
+    if manifest_path:
+        return manifest_path
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    return os.path.join(script_dir, "upload_manifest.json")
+
+def hash_file(file_path):
+    """SHA-256 of a file's content, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class SyncManifest:
+    """Record of files already uploaded to a destination, for incremental runs.
+
+    Each entry holds the size and mtime of the source file when it was
+    uploaded and, with use_hash, its SHA-256. A file whose size and mtime
+    still match is skipped without reading it. When only the mtime moved
+    the content is rehashed, and the file is skipped if the hash matches.
+    Saving merges this instance's changes into the file as it is on disk,
+    so several jobs can share one manifest file.
+    """
+
+    def __init__(self, manifest_path, destination, use_hash=False):
+        self.manifest_path = manifest_path
+        self.destination = destination
+        self.use_hash = use_hash
+        self._lock = threading.Lock()
+        self._scanned = {}
+        self._changed = set()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _key(self, file_path):
+        return f"{self.destination}|{os.path.abspath(file_path)}"
+
+    def is_unchanged(self, file_path, stat=None):
+        """Return True if file_path matches what was last uploaded."""
+        stat = stat or os.stat(file_path)
+        key = self._key(file_path)
+        self._scanned[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        entry = self._entries.get(key)
+        if not entry or entry.get('size') != stat.st_size:
+            return False
+        if entry.get('mtime_ns') == stat.st_mtime_ns:
+            return True
+        if not (self.use_hash and entry.get('sha256')):
+            return False
+        sha256 = hash_file(file_path)
+        self._scanned[key]['sha256'] = sha256
+        if sha256 != entry['sha256']:
+            return False
+        # Touched but identical: remember the new mtime so it isn't rehashed next run
+        with self._lock:
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self._changed.add(key)
+        return True
+
+    def iter_changed(self, pending_files, skipped):
+        """Lazily yield the (file_name, full_path, file_size) tuples that changed.
+
+        Names of unchanged files are appended to skipped as they are found.
+        """
+        for item in pending_files:
+            try:
+                unchanged = self.is_unchanged(item[1], getattr(item, 'stat', None))
+            except OSError:
+                unchanged = False
+            if unchanged:
+                skipped.append(item[0])
+            else:
+                yield item
+
+    def filter_changed(self, pending_files):
+        """Split (file_name, full_path, file_size) tuples into (changed, skipped_names)."""
+        skipped = []
+        changed = list(self.iter_changed(pending_files, skipped))
+        return changed, skipped
+
+    def record(self, file_path, hashes=None):
+        """Mark file_path as uploaded, using the stat taken when it was scanned.
+
+        hashes ({algorithm: digest}) computed during the upload are stored
+        as they are, so a sha256 from the upload is not computed again.
+        """
+        key = self._key(file_path)
+        entry = self._scanned.pop(key, None)
+        if entry is None:
+            stat = os.stat(file_path)
+            entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if hashes:
+            entry.update(hashes)
+        if self.use_hash and 'sha256' not in entry:
+            entry['sha256'] = hash_file(file_path)
+        entry['uploaded_at'] = time.time()
+        with self._lock:
+            self._entries[key] = entry
+            self._changed.add(key)
+            should_save = len(self._changed) >= SAVE_EVERY
+        if should_save:
+            self.save()
+
+    def forget(self, file_path):
+        """Drop file_path so the next run uploads it again."""
+        key = self._key(file_path)
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._changed.add(key)
+
+    def save(self):
+        with self._lock:
+            if not self._changed:
+                return
+            entries = self._load()
+            for key in self._changed:
+                if key in self._entries:
+                    entries[key] = self._entries[key]
+                else:
+                    entries.pop(key, None)
+            tmp_path = f"{self.manifest_path}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.manifest_path)
+                self._entries = entries
+                self._changed = set()
+            except OSError as e:
+                print(f"Could not save upload manifest: {str(e)}")
+
+def open_sync_manifest(config_values):
+    """Return a SyncManifest when IncrementalSync is on in config, else None."""
+    if not is_enabled(config_values, 'IncrementalSync'):
+        return None
+    destination = f"{config_values.get('DestinationSiteURL')}|{config_values.get('DestinationFolderURL')}"
+    return SyncManifest(get_manifest_path(config_values), destination,
+                        use_hash=is_enabled(config_values, 'ManifestHash'))
@@ -0,0 +1,67 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+SITE_PATH = '/sites/test'
+FOLDER_URL = f"{SITE_PATH}/Shared Documents/Upload"
+
+@pytest.fixture(scope='session')
+def fake_server():
+    from fake_sharepoint import start_server
+
+    server, base_url = start_server(seed=1)
+    server.sharepoint.ensure_folder(FOLDER_URL)
+    yield server, base_url
+    server.shutdown()
+
+def seed_token_cache(cache_path, site_url, client_id, client_secret):
+    """Cache a token for site_url so the scripts never try the real ACS exchange."""
+    from office365.runtime.auth.client_credential import ClientCredential
+    from token_cache import TokenCache
+
+    TokenCache(cache_path, ClientCredential(client_id, client_secret)).put(
+        site_url, 'test-token', 'Bearer', time.time() + 3600)
+
+@pytest.fixture
+def script_dir(tmp_path, fake_server):
+    """A folder with config.txt (defaults only) pointing at the fake server, and a source folder."""
+    _, base_url = fake_server
+    site_url = base_url + SITE_PATH
+    source = tmp_path / 'source'
+    source.mkdir()
+    cache_path = str(tmp_path / 'token_cache.bin')
+    seed_token_cache(cache_path, site_url, 'test-id', 'test-secret')
+    (tmp_path / 'config.txt').write_text(
+        f"SourceFolderPath={source}\n"
+        f"FileName=*.dat\n"
+        f"DestinationSiteURL={site_url}\n"
+        f"DestinationFolderURL={FOLDER_URL}/{tmp_path.name}\n"
+        f"Client Id=test-id\n"
+        f"Client Secret=test-secret\n"
+        f"TokenCache=true\n"
+        f"TokenCachePath={cache_path}\n")
+    fake_server[0].sharepoint.ensure_folder(f"{FOLDER_URL}/{tmp_path.name}")
+    return tmp_path
+
+def run_script(script_dir, script_name, *args):
+    """Run a repo script headless from script_dir; returns (exit code, JSON summary).
+
+    The script is copied next to config.txt, as the scripts read it from
+    their own folder; the rest of the repo is found through PYTHONPATH.
+    """
+    script_path = shutil.copy(os.path.join(REPO_DIR, script_name), str(script_dir))
+    result = subprocess.run([sys.executable, script_path, '--headless', *args],
+                            cwd=str(script_dir), capture_output=True, text=True, timeout=300,
+                            env=dict(os.environ, PYTHONPATH=REPO_DIR))
+    lines = result.stdout.strip().splitlines()
+    assert lines, result.stderr[-2000:]
+    return result.returncode, json.loads(lines[-1])
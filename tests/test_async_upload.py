@@ -0,0 +1,134 @@
+import asyncio
+import threading
+
+import pytest
+
+from async_upload import ConnectionPool, get_max_connections, get_max_in_flight, run_async_uploads
+from conftest import FOLDER_URL, SITE_PATH
+
+def run_against(responses, exchange, **pool_options):
+    """Run exchange(pool) against a local server answering each request with the next of responses.
+
+    A response of None never answers. Returns (exchange's result, connections the server accepted).
+    """
+    accepted = []
+
+    async def handle(reader, writer):
+        accepted.append(writer)
+        while responses:
+            request = await reader.readuntil(b'\r\n\r\n')
+            length = int(request.lower().split(b'content-length:')[1].split(b'\r\n')[0])
+            await reader.readexactly(length)
+            response = responses.pop(0)
+            if response is None:
+                await asyncio.sleep(60)
+            writer.write(response)
+            await writer.drain()
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = ConnectionPool(f"http://127.0.0.1:{port}", 2, **pool_options)
+        try:
+            return await exchange(pool)
+        finally:
+            await pool.close()
+            server.close()
+
+    return asyncio.run(main()), len(accepted)
+
+def test_config_values():
+    assert get_max_connections({}) == 16
+    assert get_max_connections({'MaxConnectionsPerSite': '0'}) == 1
+    assert get_max_in_flight({'MaxInFlightUploads': 'lots'}) == 100
+
+def test_responses_without_a_body_keep_the_connection():
+    responses = [b"HTTP/1.1 204 No Content\r\n\r\n",
+                 b"HTTP/1.1 304 Not Modified\r\nContent-Length: 10\r\n\r\n",
+                 b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"]
+
+    async def exchange(pool):
+        return [await pool.request('GET', '/', {}) for _ in range(3)]
+
+    results, connections = run_against(responses, exchange)
+    assert [(status, data) for status, _, data in results] == [(204, b''), (304, b''), (200, b'ok')]
+    assert connections == 1
+
+def test_chunked_body_with_extensions_and_trailers():
+    responses = [b"HTTP/1.1 100 Continue\r\n\r\n"
+                 b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\nContent-Length: 99\r\n\r\n"
+                 b"5;name=value\r\nhello\r\n6\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n",
+                 b"HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\nnext"]
+
+    async def exchange(pool):
+        return [await pool.request('GET', '/', {}) for _ in range(2)]
+
+    results, connections = run_against(responses, exchange)
+    assert [data for _, _, data in results] == [b'hello world', b'next']
+    assert connections == 1
+
+def test_a_silent_server_times_out_and_the_connection_is_closed():
+    async def exchange(pool):
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.request('POST', '/', {}, b'body')
+        return pool._idle
+
+    idle, _ = run_against([None], exchange, io_timeout=0.2)
+    assert idle == []
+
+def test_a_failed_exchange_does_not_leak_the_connection():
+    async def exchange(pool):
+        with pytest.raises(ValueError):
+            await pool.request('GET', '/', {})
+        return pool._idle
+
+    idle, _ = run_against([b"HTTP/1.1 200 OK\r\nTransfer-Encoding: gzip\r\n\r\n"], exchange)
+    assert idle == []
+
+@pytest.fixture
+def ctx(fake_server):
+    from office365.sharepoint.client_context import ClientContext
+
+    token = {'access_token': 'test', 'token_type': 'Bearer', 'expires_in': 3600}
+    return ClientContext(fake_server[1] + SITE_PATH).with_access_token(lambda: token)
+
+def test_run_async_uploads_against_the_fake_server(fake_server, ctx, tmp_path):
+    folder_url = f"{FOLDER_URL}/{tmp_path.name}"
+    fake_server[0].sharepoint.ensure_folder(folder_url)
+    sizes = {'a.bin': 10, 'b.bin': 3 * 1024 * 1024}
+    for name, size in sizes.items():
+        (tmp_path / name).write_bytes(b'x' * size)
+    pending = [(name, str(tmp_path / name), size) for name, size in sizes.items()]
+    results = []
+
+    run_async_uploads(ctx, {'SingleRequestMaxMB': '1', 'ChunkSizeMB': '1'}, folder_url, iter(pending),
+                      lambda name, error: results.append((name, error)))
+
+    assert sorted(results) == [('a.bin', None), ('b.bin', None)]
+    assert {url.rsplit('/', 1)[1]: entry['length'] for url, entry in fake_server[0].sharepoint.files.items()
+            if url.startswith(folder_url + '/')} == sizes
+
+def test_the_scan_runs_off_the_event_loop_thread(fake_server, ctx, tmp_path):
+    folder_url = f"{FOLDER_URL}/{tmp_path.name}"
+    fake_server[0].sharepoint.ensure_folder(folder_url)
+    (tmp_path / 'a.bin').write_bytes(b'x')
+    scan_threads = []
+
+    def scan():
+        scan_threads.append(threading.current_thread())
+        yield ('a.bin', str(tmp_path / 'a.bin'), 1)
+
+    results = []
+    run_async_uploads(ctx, {}, folder_url, scan(), lambda name, error: results.append((name, error)))
+
+    assert results == [('a.bin', None)]
+    assert scan_threads[0] is not threading.current_thread()
+
+def test_a_failing_scan_ends_the_run_with_its_error(ctx):
+    def scan():
+        raise PermissionError('source share went away')
+        yield
+
+    with pytest.raises(PermissionError):
+        run_async_uploads(ctx, {}, FOLDER_URL, scan(), lambda name, error: None)
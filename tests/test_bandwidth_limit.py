@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+
+import bandwidth_limit
+from bandwidth_limit import BandwidthLimiter, BandwidthSchedule, parse_rate
+
+def test_parse_rate():
+    assert parse_rate('8') == 1000 * 1000
+    assert parse_rate('16 Mbit/s') == 2 * 1000 * 1000
+    for value in ('unlimited', 'off', '0', ''):
+        assert parse_rate(value) is None
+    with pytest.raises(ValueError):
+        parse_rate('fast')
+
+def test_schedule_by_time_of_day():
+    schedule = BandwidthSchedule.parse('08:00-18:00=8; 22:00-06:00=16; 80')
+    assert schedule.rate_at(datetime(2024, 1, 1, 9, 0)) == 1000 * 1000
+    assert schedule.rate_at(datetime(2024, 1, 1, 23, 30)) == 2 * 1000 * 1000
+    assert schedule.rate_at(datetime(2024, 1, 1, 2, 0)) == 2 * 1000 * 1000
+    assert schedule.rate_at(datetime(2024, 1, 1, 19, 0)) == 10 * 1000 * 1000
+    assert not schedule.is_unlimited()
+    assert BandwidthSchedule.parse('unlimited').is_unlimited()
+
+def test_unlimited_acquire_never_sleeps(monkeypatch):
+    monkeypatch.setattr(bandwidth_limit.time, 'sleep', pytest.fail)
+    BandwidthLimiter().acquire(10 ** 9)
+
+def test_token_bucket_paces_to_the_rate(monkeypatch):
+    clock = [1000.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(bandwidth_limit.time, 'monotonic', lambda: clock[0])
+    monkeypatch.setattr(bandwidth_limit.time, 'sleep', sleep)
+    limiter = BandwidthLimiter(BandwidthSchedule(default=1000.0))
+    # The bucket starts empty, and 2.5 s of traffic is taken in bucket-sized parts
+    limiter.acquire(2500)
+    assert sum(sleeps) == pytest.approx(2.5)
+    assert max(sleeps) <= bandwidth_limit.MAX_SLEEP_SECONDS
@@ -0,0 +1,56 @@
+import os
+import threading
+
+import pytest
+
+from chunk_reader import (get_chunk_size_limit, get_read_ahead_buffers, iter_file_chunks, read_chunks_ahead,
+                          read_chunks_mapped)
+
+@pytest.fixture
+def data_file(tmp_path):
+    data = os.urandom(10000)
+    (tmp_path / 'data.bin').write_bytes(data)
+    return str(tmp_path / 'data.bin'), data
+
+def test_config_values():
+    assert get_read_ahead_buffers({}) == 2
+    assert get_read_ahead_buffers({'ReadAheadBuffers': '0'}) == 1
+    assert get_read_ahead_buffers({'ReadAheadBuffers': 'lots'}) == 2
+    assert get_chunk_size_limit({}) is None
+    assert get_chunk_size_limit({'MaxUploadMemoryMB': '8'}) == 4 * 1024 * 1024
+    assert get_chunk_size_limit({'MaxUploadMemoryMB': '8', 'ChunkSource': 'buffered', 'ReadAheadBuffers': '4'}) \
+        == 2 * 1024 * 1024
+
+@pytest.mark.parametrize('read_chunks', [read_chunks_ahead, read_chunks_mapped])
+def test_chunks_cover_the_file_from_the_start_offset(data_file, read_chunks):
+    file_path, data = data_file
+    chunks = [(offset, bytes(chunk)) for offset, chunk in read_chunks(file_path, 3000, start_offset=1000)]
+    assert [offset for offset, _ in chunks] == [1000, 4000, 7000]
+    assert b''.join(chunk for _, chunk in chunks) == data[1000:]
+
+@pytest.mark.parametrize('read_chunks', [read_chunks_ahead, read_chunks_mapped])
+def test_chunk_size_may_change_while_reading(data_file, read_chunks):
+    file_path, data = data_file
+    sizes = iter([1000, 4000])
+    chunks = [bytes(chunk) for _, chunk in read_chunks(file_path, lambda: next(sizes, 5000))]
+    assert [len(chunk) for chunk in chunks] == [1000, 4000, 5000]
+
+def test_stopping_early_ends_the_reader_thread(data_file):
+    file_path, _ = data_file
+    chunks = read_chunks_ahead(file_path, 1000, buffer_count=2)
+    next(chunks)
+    reader = next(thread for thread in threading.enumerate() if thread.name == f"read-ahead:{file_path}")
+    chunks.close()
+    reader.join(timeout=5)
+    assert not reader.is_alive()
+
+def test_empty_and_unmapped_files_fall_back_to_buffered_reads(tmp_path, data_file):
+    (tmp_path / 'empty.bin').write_bytes(b'')
+    assert list(iter_file_chunks(str(tmp_path / 'empty.bin'), 1000)) == []
+
+    file_path, data = data_file
+    assert b''.join(chunk for _, chunk in iter_file_chunks(file_path, 4096, mapped=False)) == data
+
+def test_read_errors_reach_the_caller(tmp_path):
+    with pytest.raises(OSError):
+        list(read_chunks_ahead(str(tmp_path / 'missing.bin'), 1000))
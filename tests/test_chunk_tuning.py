@@ -0,0 +1,50 @@
+import json
+
+from chunk_tuning import (CHUNK_ALIGNMENT, MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, ChunkSizeTuner, align_chunk_size,
+                          create_chunk_tuner)
+
+MB = 1024 * 1024
+
+def test_align_chunk_size():
+    assert align_chunk_size(10 * MB) == 10 * MB // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT
+    assert align_chunk_size(1) == MIN_CHUNK_SIZE
+    assert align_chunk_size(10 ** 12) == MAX_CHUNK_SIZE
+
+def test_fixed_tuner_keeps_its_size():
+    tuner = ChunkSizeTuner(5 * MB)
+    tuner.record(5 * MB, 100.0)
+    tuner.record_failure()
+    assert tuner.next_size() == 5 * MB
+
+def test_adaptive_tuner_steps_toward_target_seconds():
+    tuner = ChunkSizeTuner(10 * MB, adaptive=True, target_seconds=4.0)
+    start = tuner.next_size()
+    # Fast link: at most doubles per step
+    tuner.record(start, 0.1)
+    assert tuner.next_size() == align_chunk_size(start * 2)
+    # Slow link: at most halves per step
+    size = tuner.next_size()
+    tuner.record(size, 100.0)
+    assert tuner.next_size() == align_chunk_size(size / 2)
+    tuner.record_failure()
+    assert tuner.next_size() == align_chunk_size(size / 4)
+
+def test_max_size_caps_every_chunk():
+    tuner = ChunkSizeTuner(50 * MB, max_size=8 * MB + 1)
+    assert tuner.next_size() == 8 * MB // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT
+
+def test_best_size_is_saved_and_reused(tmp_path):
+    store_path = str(tmp_path / 'chunk_sizes.json')
+    config_values = {'ChunkSizeMB': 'auto', 'ChunkSizeStorePath': store_path}
+    tuner = create_chunk_tuner(config_values, 'https://site', 10)
+    size = tuner.next_size()
+    tuner.record(size, 1.0)
+    tuner.record(MIN_CHUNK_SIZE - 1, 0.001)  # a short final chunk never becomes the best
+    tuner.save()
+    assert json.load(open(store_path)) == {'https://site': size}
+    assert create_chunk_tuner(config_values, 'https://site', 50).next_size() == size
+
+def test_create_chunk_tuner_from_config():
+    assert create_chunk_tuner({'ChunkSizeMB': '5'}, 'https://site', 10).next_size() == 5 * MB
+    assert create_chunk_tuner({'ChunkSizeMB': 'lots'}, 'https://site', 10).next_size() == 10 * MB
+    assert create_chunk_tuner({}, 'https://site', 10).adaptive is False
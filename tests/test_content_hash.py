@@ -0,0 +1,59 @@
+import base64
+import hashlib
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from content_hash import QuickXorHash, StreamHasher, check_remote_hash, get_hash_algorithm, pop_hash, remember
+
+def reference_quickxorhash(data):
+    """Byte by byte, as in Microsoft's description of the algorithm."""
+    register = 0
+    for index, value in enumerate(data):
+        shift = index * 11 % 160
+        register ^= ((value << shift) | (value >> (160 - shift))) & ((1 << 160) - 1)
+    digest = bytearray(register.to_bytes(20, 'little'))
+    for i, value in enumerate(len(data).to_bytes(8, 'little')):
+        digest[12 + i] ^= value
+    return base64.b64encode(bytes(digest)).decode('ascii')
+
+def test_hash_algorithm_from_config():
+    assert get_hash_algorithm({}) == 'sha256'
+    assert get_hash_algorithm(None) == 'sha256'
+    assert get_hash_algorithm({'ContentHash': 'QuickXor'}) == 'quickxorhash'
+    assert get_hash_algorithm({'ContentHash': 'off'}) is None
+    assert get_hash_algorithm({'ContentHash': 'md5'}) == 'sha256'
+
+@pytest.mark.parametrize('sizes', [[0], [1], [159, 1, 160], [1000], [7, 333, 2048, 5]])
+def test_quickxorhash_matches_the_reference_in_any_chunking(sizes):
+    data = os.urandom(sum(sizes))
+    quick = QuickXorHash()
+    offset = 0
+    for size in sizes:
+        quick.update(data[offset:offset + size])
+        offset += size
+    assert quick.hexdigest() == reference_quickxorhash(data)
+
+def test_stream_hasher_passes_chunks_through(tmp_path):
+    data = os.urandom(3000)
+    (tmp_path / 'a.bin').write_bytes(data)
+    hasher = StreamHasher('sha256')
+    hasher.hash_prefix(str(tmp_path / 'a.bin'), 1000).result()
+    chunks = [(offset, data[offset:offset + 700]) for offset in range(1000, 3000, 700)]
+
+    assert list(hasher.hashed(iter(chunks))) == chunks
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+
+def test_remote_hash_check():
+    digest = hashlib.sha256(b'x').hexdigest()
+    assert check_remote_hash(SimpleNamespace(properties={'Sha256Hash': digest.upper()}), 'sha256', digest)
+    assert check_remote_hash(SimpleNamespace(properties={}), 'sha256', digest) is None
+    assert check_remote_hash(None, 'sha256', digest) is None
+    with pytest.raises(ValueError):
+        check_remote_hash(SimpleNamespace(properties={'quickXorHash': 'abc='}), 'quickxorhash', 'ABC=')
+
+def test_hashes_are_kept_until_popped(tmp_path):
+    remember(str(tmp_path / 'sub' / '..' / 'a.bin'), 'sha256', 'abc')
+    assert pop_hash(str(tmp_path / 'a.bin')) == {'sha256': 'abc'}
+    assert pop_hash(str(tmp_path / 'a.bin')) == {}
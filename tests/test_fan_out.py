@@ -0,0 +1,64 @@
+import pytest
+
+import fan_out
+from conftest import FOLDER_URL, SITE_PATH
+from fan_out import FanOutError, get_destinations, open_fan_out
+
+@pytest.fixture
+def ctx(fake_server):
+    from office365.sharepoint.client_context import ClientContext
+
+    token = {'access_token': 'test', 'token_type': 'Bearer', 'expires_in': 3600}
+    return ClientContext(fake_server[1] + SITE_PATH).with_access_token(lambda: token)
+
+def make_fan_out(fake_server, ctx, tmp_path):
+    folders = [f"{FOLDER_URL}/{tmp_path.name}/one", f"{FOLDER_URL}/{tmp_path.name}/two"]
+    for folder_url in folders:
+        fake_server[0].sharepoint.ensure_folder(folder_url)
+    config_values = {'DestinationSiteURL': ctx.base_url, 'DestinationFolderURL': folders[0],
+                     'DestinationFolderURL2': folders[1], 'ChunkSizeMB': '0.001'}
+    return open_fan_out(config_values, ctx, None, str(tmp_path)), folders
+
+def listing(fake_server, folder_url):
+    return {url.rsplit('/', 1)[1]: entry['length'] for url, entry in fake_server[0].sharepoint.files.items()
+            if url.rsplit('/', 1)[0] == folder_url}
+
+def test_get_destinations():
+    config_values = {'DestinationSiteURL': 'https://a', 'DestinationFolderURL': '/docs',
+                     'DestinationFolderURL3': '/three', 'DestinationSiteURL3': 'https://b',
+                     'DestinationFolderURL2': '/two'}
+    assert get_destinations(config_values) == [('https://a', '/docs'), ('https://a', '/two'), ('https://b', '/three')]
+    assert open_fan_out({'DestinationFolderURL': '/docs'}, None, None, '.') is None
+
+def test_each_destination_gets_the_file(fake_server, ctx, tmp_path):
+    fan, folders = make_fan_out(fake_server, ctx, tmp_path)
+    for name, size in (('small.bin', 100), ('big.bin', 5000)):
+        (tmp_path / name).write_bytes(b'x' * size)
+        fan.upload_one(ctx, None, str(tmp_path / name), name, size)
+
+    for folder_url in folders:
+        assert listing(fake_server, folder_url) == {'small.bin': 100, 'big.bin': 5000}
+    assert fan.pop_results(str(tmp_path / 'big.bin')) == {folders[0]: None, folders[1]: None}
+
+def test_a_read_error_fails_every_destination_and_releases_the_chunks(fake_server, ctx, tmp_path, monkeypatch):
+    fan, folders = make_fan_out(fake_server, ctx, tmp_path)
+    (tmp_path / 'big.bin').write_bytes(b'x' * 5000)
+    closed = []
+
+    def failing_chunks(file_path, next_size, mapped=True):
+        try:
+            yield 0, b'x' * next_size()
+            raise OSError('read error')
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(fan_out, 'iter_file_chunks', failing_chunks)
+
+    with pytest.raises(FanOutError) as raised:
+        fan.upload_one(ctx, None, str(tmp_path / 'big.bin'), 'big.bin', 5000)
+
+    assert set(raised.value.errors) == set(folders)
+    assert closed == [True]
+    # Both sessions were cancelled and their staging files removed
+    for folder_url in folders:
+        assert listing(fake_server, folder_url) == {}
@@ -0,0 +1,65 @@
+import io
+import json
+import zipfile
+
+from file_bundles import BUNDLE_MANIFEST_NAME, FileBundle, FileBundler, open_file_bundler, stream_bundle
+
+def make_files(root, sizes):
+    items = []
+    for i, size in enumerate(sizes):
+        path = root / f"f{i}.bin"
+        path.write_bytes(bytes([i % 256]) * size)
+        items.append((path.name, str(path), size))
+    return items
+
+def test_small_files_are_grouped_and_large_ones_pass_through(tmp_path):
+    items = make_files(tmp_path, [10, 10, 10, 1000, 10, 10])
+    bundler = FileBundler(max_file_size=100, target_size=25)
+    grouped = list(bundler.bundle(iter(items)))
+
+    assert [item[0] for item in grouped if not isinstance(item[1], FileBundle)] == ['f3.bin']
+    bundles = [item[1] for item in grouped if isinstance(item[1], FileBundle)]
+    assert [[name for name, _, _ in bundle.members] for bundle in bundles] == \
+        [['f0.bin', 'f1.bin', 'f2.bin'], ['f4.bin', 'f5.bin']]
+    assert grouped[0][2] == 30
+
+def test_a_lone_small_file_is_not_bundled(tmp_path):
+    items = make_files(tmp_path, [10])
+    assert list(FileBundler(100, 1000).bundle(iter(items))) == items
+
+def test_stream_bundle_builds_a_valid_archive(tmp_path):
+    items = make_files(tmp_path, [5000, 70000, 3])
+    bundle = FileBundle('b.zip', items + [('gone.bin', str(tmp_path / 'gone.bin'), 1)])
+    chunks = list(stream_bundle(bundle, 4096))
+
+    assert all(len(chunk) == 4096 for chunk in chunks[:-1])
+    data = b''.join(chunks)
+    assert bundle.size == len(data)
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    for name, path, _ in items:
+        assert archive.read(name) == open(path, 'rb').read()
+    assert bundle.skipped == ['gone.bin']
+    manifest = json.loads(archive.read(BUNDLE_MANIFEST_NAME))
+    assert [entry['name'] for entry in manifest['files']] == ['f0.bin', 'f1.bin', 'f2.bin']
+
+def test_results_and_verification_map_back_to_members(tmp_path):
+    items = make_files(tmp_path, [10, 10])
+    bundler = FileBundler(100, 1000, manifest_path=str(tmp_path / 'bundles.jsonl'))
+    name, bundle, _ = next(bundler.bundle(iter(items)))
+    bundle.size = 123
+
+    results = []
+    bundler.wrap_result(lambda file_name, error: results.append((file_name, error)))(name, None)
+    assert results == [('f0.bin', None), ('f1.bin', None)]
+    assert json.loads(open(tmp_path / 'bundles.jsonl').read())['bundle'] == name
+
+    assert bundler.expected_sizes({'f0.bin': 10, 'f1.bin': 10, 'other': 5}) == {name: 123, 'other': 5}
+    assert bundler.expand_problems({name: 'size mismatch', 'other': 'missing'}) == {
+        'f0.bin': f"bundle {name} size mismatch", 'f1.bin': f"bundle {name} size mismatch", 'other': 'missing'}
+
+def test_open_file_bundler_follows_config():
+    assert open_file_bundler({}) is None
+    bundler = open_file_bundler({'BundleSmallFiles': 'true', 'BundleFileMaxKB': '4', 'BundleTargetMB': '1',
+                                 'BundleCompression': 'store'})
+    assert (bundler.max_file_size, bundler.target_size) == (4096, 1024 * 1024)
+    assert bundler.compression == zipfile.ZIP_STORED
@@ -0,0 +1,55 @@
+import os
+import time
+
+from folder_watch import PendingFiles, RetrySchedule, get_max_retries, get_settle_seconds
+
+def test_config_values():
+    assert get_settle_seconds({}) == 2.0
+    assert get_settle_seconds({'WatchSettleSeconds': '-1'}) == 0.0
+    assert get_max_retries({}) == 5
+    assert get_max_retries({'WatchMaxRetries': 'never'}) == 5
+    assert get_max_retries({'WatchMaxRetries': '0'}) == 0
+
+def test_retries_back_off_and_stop():
+    schedule = RetrySchedule(3, first_delay=60, max_delay=200)
+    assert [schedule.next_delay('a.dat', (1, 1)) for _ in range(4)] == [60, 120, 200, None]
+    # Given up on; a later failure of the same file starts over
+    assert schedule.next_delay('a.dat', (1, 1)) == 60
+
+def test_a_changed_or_uploaded_file_starts_over():
+    schedule = RetrySchedule(2, first_delay=1)
+    schedule.next_delay('a.dat', (1, 1))
+    schedule.next_delay('a.dat', (1, 1))
+    assert schedule.next_delay('a.dat', (2, 2)) == 1
+
+    schedule.succeeded('a.dat')
+    assert schedule.next_delay('a.dat', (2, 2)) == 1
+
+def test_pending_files_settle_before_they_are_ready(tmp_path):
+    pending = PendingFiles(str(tmp_path), settle_seconds=0.2)
+    (tmp_path / 'a.dat').write_bytes(b'a')
+    (tmp_path / 'b.dat').write_bytes(b'b')
+    pending.touch('a.dat')
+    pending.mark_closed('b.dat')
+    pending.touch('gone.dat')
+
+    ready, next_check = pending.pop_ready()
+    assert ready == ['b.dat']
+    assert next_check is not None
+
+    # Still being written: its quiet period starts again
+    with open(tmp_path / 'a.dat', 'ab') as f:
+        f.write(b'more')
+    os.utime(tmp_path / 'a.dat', ns=(0, time.time_ns() + 10**9))
+    time.sleep(0.25)
+    assert pending.pop_ready()[0] == []
+    time.sleep(0.25)
+    assert pending.pop_ready() == (['a.dat'], None)
+
+def test_retry_delay_holds_a_file_back(tmp_path):
+    pending = PendingFiles(str(tmp_path), settle_seconds=0)
+    (tmp_path / 'a.dat').write_bytes(b'a')
+    pending.touch('a.dat', delay=60)
+    ready, next_check = pending.pop_ready()
+    assert ready == []
+    assert next_check > time.monotonic() + 50
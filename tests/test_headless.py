@@ -0,0 +1,61 @@
+import io
+import json
+import sys
+
+import pytest
+
+import headless
+from headless import EXIT_ERROR, EXIT_FAILED, EXIT_OK, add_file, finish, get_exit_code, new_summary, parse_args
+
+@pytest.fixture
+def summary_stream(monkeypatch):
+    stream = io.StringIO()
+    monkeypatch.setattr(headless, '_summary_stream', stream)
+    monkeypatch.setattr(headless, '_headless', False)
+    monkeypatch.setattr(sys, 'stdout', sys.stdout)
+    return stream
+
+def test_headless_flag_and_missing_display(summary_stream, monkeypatch):
+    monkeypatch.setattr(headless, 'has_display', lambda: True)
+    args = parse_args("upload", ['C:\\in\\*.csv'], watch=True)
+    assert (args.file_path, args.watch, headless.is_headless()) == ('C:\\in\\*.csv', False, False)
+
+    assert parse_args("upload", ['--json']).headless
+    assert headless.is_headless()
+    # Progress goes to stderr so stdout carries only the summary
+    assert sys.stdout is sys.stderr
+
+    monkeypatch.setattr(headless, 'has_display', lambda: False)
+    parse_args("upload", [])
+    assert headless.is_headless()
+
+def test_exit_codes():
+    summary = new_summary()
+    assert get_exit_code(summary) == EXIT_OK
+    add_file(summary, 'a.dat', 'Failed', 'timed out')
+    summary['failed'] += 1
+    assert get_exit_code(summary) == EXIT_FAILED
+    summary['error'] = 'Config file not found'
+    assert get_exit_code(summary) == EXIT_ERROR
+    assert summary['files'] == [{'file': 'a.dat', 'status': 'Failed', 'reason': 'timed out'}]
+
+def test_finish_prints_the_summary_only_when_headless(summary_stream, monkeypatch):
+    summary = new_summary()
+    add_file(summary, 'a.dat', 'Successful')
+    summary['success'] = 1
+
+    with pytest.raises(SystemExit) as exited:
+        finish(summary)
+    assert exited.value.code == EXIT_OK
+    assert summary_stream.getvalue() == ''
+
+    monkeypatch.setattr(headless, '_headless', True)
+    with pytest.raises(SystemExit) as exited:
+        headless.fail("Source folder not found")
+    assert exited.value.code == EXIT_ERROR
+    assert json.loads(summary_stream.getvalue())['error'] == "Source folder not found"
+
+def test_popup_is_printed_when_headless(summary_stream, monkeypatch, capsys):
+    monkeypatch.setattr(headless, '_headless', True)
+    headless.show_popup("Upload Complete", "3 file(s) uploaded")
+    assert capsys.readouterr().out == "Upload Complete: 3 file(s) uploaded\n"
@@ -0,0 +1,82 @@
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from job_scheduler import JobScheduler, UploadJob, parse_deadline, read_jobs_file
+
+class FakeContext:
+    base_url = 'https://site'
+    web = SimpleNamespace(get_folder_by_server_relative_url=lambda url: SimpleNamespace(url=url))
+
+    def clone(self, base_url):
+        return self
+
+def make_job(name, files, results, upload_one, **config_values):
+    job = UploadJob(name, dict(config_values, DestinationFolderURL=f"/docs/{name}"))
+    job.ctx = FakeContext()
+    job.pending_files = [(file_name, f"/src/{file_name}", file_size) for file_name, file_size in files]
+    job.upload_one = upload_one
+    job.on_result = lambda file_name, error: results.append((name, file_name, error))
+    return job
+
+def test_read_jobs_file(tmp_path):
+    (tmp_path / 'jobs.txt').write_text(
+        "# shared\nDestinationSiteURL = https://site\nPriority = 1\n\n"
+        "[Invoices]\nSourceFolderPath = C:\\in\nPriority = 5\n"
+        "[ Reports ]\nFileName = \"*.csv\"\nnot a setting\n")
+
+    shared, sections = read_jobs_file(str(tmp_path / 'jobs.txt'))
+    assert shared == {'DestinationSiteURL': 'https://site', 'Priority': '1'}
+    assert sections == [('Invoices', {'SourceFolderPath': 'C:\\in', 'Priority': '5'}),
+                        ('Reports', {'FileName': '*.csv'})]
+
+def test_parse_deadline_and_priority():
+    now = datetime(2024, 5, 1, 9, 30)
+    assert parse_deadline('17:00', now) == datetime(2024, 5, 1, 17, 0).timestamp()
+    assert parse_deadline('2024-05-02 08:15', now) == datetime(2024, 5, 2, 8, 15).timestamp()
+    assert parse_deadline('tomorrow', now) is None
+    assert parse_deadline('', now) is None
+    assert UploadJob('a', {'Priority': 'high'}).priority == 0
+    assert UploadJob('a', {'Deadline': '2000-01-01 00:00'}).is_late
+
+def test_best_file_across_jobs_goes_first():
+    order = []
+    results = []
+
+    def upload_one(ctx, folder, full_path, file_name, file_size):
+        order.append(file_name)
+
+    jobs = [make_job('low', [('low-small', 1), ('low-big', 100)], results, upload_one),
+            make_job('late', [('late-a', 50)], results, upload_one, Priority='5', Deadline='2099-01-01 00:00'),
+            make_job('soon', [('soon-b', 90), ('soon-a', 10)], results, upload_one, Priority='5',
+                     Deadline='2098-01-01 00:00')]
+    JobScheduler(jobs, max_workers=1, large_file_size=1000).run()
+
+    assert order == ['soon-a', 'soon-b', 'late-a', 'low-small', 'low-big']
+    assert all(error is None for _, _, error in results)
+    assert all(job.finished_at for job in jobs)
+
+def test_large_files_leave_a_worker_free_and_errors_are_reported():
+    lock = threading.Lock()
+    running = {'large': 0, 'most': 0}
+    results = []
+
+    def upload_one(ctx, folder, full_path, file_name, file_size):
+        if file_size > 10:
+            with lock:
+                running['large'] += 1
+                running['most'] = max(running['most'], running['large'])
+            time.sleep(0.05)
+            with lock:
+                running['large'] -= 1
+        elif file_name == 'bad':
+            raise ValueError('boom')
+
+    job = make_job('mixed', [('big-1', 100), ('big-2', 100), ('big-3', 100), ('bad', 1), ('ok', 1)],
+                   results, upload_one)
+    JobScheduler([job], max_workers=3, large_file_size=10).run()
+
+    assert running['most'] == 2
+    assert sorted(file_name for _, file_name, _ in results) == ['bad', 'big-1', 'big-2', 'big-3', 'ok']
+    assert [str(error) for _, file_name, error in results if file_name == 'bad'] == ['boom']
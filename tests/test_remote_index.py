@@ -0,0 +1,69 @@
+import os
+import time
+
+import pytest
+
+from conftest import FOLDER_URL, SITE_PATH
+from remote_index import RemoteIndex
+from source_scan import get_source_filter, scan_source_files
+
+@pytest.fixture
+def ctx(fake_server):
+    from office365.sharepoint.client_context import ClientContext
+
+    token = {'access_token': 'test', 'token_type': 'Bearer', 'expires_in': 3600}
+    return ClientContext(fake_server[1] + SITE_PATH).with_access_token(lambda: token)
+
+@pytest.fixture
+def folder(fake_server, tmp_path):
+    folder_url = f"{FOLDER_URL}/{tmp_path.name}"
+    fake_server[0].sharepoint.ensure_folder(folder_url)
+    (tmp_path / 'source').mkdir()
+    for name in ('a.dat', 'b.dat'):
+        (tmp_path / 'source' / name).write_bytes(b'data')
+        fake_server[0].sharepoint.put_file(f"{folder_url}/{name}", 4)
+    return folder_url
+
+def changed_names(index, ctx, folder_url, source):
+    assert index.refresh(ctx, folder_url)
+    skipped = []
+    changed = index.iter_changed(scan_source_files(str(source), get_source_filter({}, '*.dat')), folder_url, skipped)
+    return sorted(item[0] for item in changed), sorted(skipped)
+
+def test_only_files_edited_since_their_upload_are_changed(tmp_path, ctx, folder):
+    index = RemoteIndex(str(tmp_path / 'index.sqlite'))
+    # Same size remotely, but not uploaded through this index: uploaded once
+    assert changed_names(index, ctx, folder, tmp_path / 'source') == (['a.dat', 'b.dat'], [])
+    index.record_upload(folder, 'a.dat')
+    index.record_upload(folder, 'b.dat')
+    index.close()
+
+    index = RemoteIndex(str(tmp_path / 'index.sqlite'))
+    assert changed_names(index, ctx, folder, tmp_path / 'source') == ([], ['a.dat', 'b.dat'])
+
+    # Same size, so only the mtime tells the edit apart; the remote copy is still newer
+    (tmp_path / 'source' / 'a.dat').write_bytes(b'DATA')
+    os.utime(tmp_path / 'source' / 'a.dat', (time.time() - 3600, time.time() - 3600))
+    assert changed_names(index, ctx, folder, tmp_path / 'source') == (['a.dat'], ['b.dat'])
+    index.close()
+
+def test_a_forgotten_upload_is_sent_again(tmp_path, ctx, folder):
+    index = RemoteIndex(str(tmp_path / 'index.sqlite'))
+    changed_names(index, ctx, folder, tmp_path / 'source')
+    index.record_upload(folder, 'a.dat')
+    index.record_upload(folder, 'b.dat')
+    index.forget_upload(folder, 'b.dat')
+    index.close()
+
+    index = RemoteIndex(str(tmp_path / 'index.sqlite'))
+    assert changed_names(index, ctx, folder, tmp_path / 'source') == (['b.dat'], ['a.dat'])
+    index.close()
+
+def test_a_remote_copy_of_another_size_is_replaced(tmp_path, ctx, fake_server, folder):
+    index = RemoteIndex(str(tmp_path / 'index.sqlite'))
+    changed_names(index, ctx, folder, tmp_path / 'source')
+    index.record_upload(folder, 'a.dat')
+    fake_server[0].sharepoint.put_file(f"{folder}/a.dat", 9)
+
+    assert changed_names(index, ctx, folder, tmp_path / 'source')[0] == ['a.dat', 'b.dat']
+    index.close()
@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import FOLDER_URL, SITE_PATH
+from remote_verify import is_verification_enabled, list_remote_files, reconcile_uploads
+
+@pytest.fixture
+def ctx(fake_server):
+    from office365.sharepoint.client_context import ClientContext
+
+    token = {'access_token': 'test', 'token_type': 'Bearer', 'expires_in': 3600}
+    return ClientContext(fake_server[1] + SITE_PATH).with_access_token(lambda: token)
+
+def test_verification_is_on_by_default():
+    assert is_verification_enabled({})
+    assert not is_verification_enabled({'VerifyUploads': 'off'})
+
+def test_listing_is_paged(fake_server, ctx, tmp_path):
+    folder_url = f"{FOLDER_URL}/{tmp_path.name}"
+    fake_server[0].sharepoint.ensure_folder(folder_url)
+    for index in range(7):
+        fake_server[0].sharepoint.put_file(f"{folder_url}/{index}.dat", index)
+
+    assert list_remote_files(ctx, folder_url, page_size=3) == {f"{index}.dat": index for index in range(7)}
+
+def test_reconcile_reports_missing_and_resized_files(fake_server, ctx, tmp_path):
+    folder_url = f"{FOLDER_URL}/{tmp_path.name}"
+    fake_server[0].sharepoint.ensure_folder(f"{folder_url}/sub")
+    fake_server[0].sharepoint.put_file(f"{folder_url}/a.dat", 10)
+    fake_server[0].sharepoint.put_file(f"{folder_url}/b.dat", 5)
+    fake_server[0].sharepoint.put_file(f"{folder_url}/sub/c.dat", 3)
+
+    problems = reconcile_uploads(ctx, folder_url, {'a.dat': 10, 'b.dat': 6, 'sub/c.dat': 3, 'sub/d.dat': 1})
+    assert problems == {'b.dat': "size mismatch, expected 6, got 5", 'sub/d.dat': "missing after upload"}
+    assert reconcile_uploads(ctx, folder_url, {}) == {}
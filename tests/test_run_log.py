@@ -0,0 +1,89 @@
+import pytest
+
+from run_log import EXPORTED_OFFSET_PROPERTY, RunLog, export_to_xlsx, open_run_log, read_entries
+
+def sheet_rows(xlsx_path):
+    from openpyxl import load_workbook
+
+    return [list(row) for row in load_workbook(xlsx_path).active.iter_rows(values_only=True)]
+
+def write_log(log_path, *entries):
+    run_log = RunLog(str(log_path), flush_every=1)
+    for file_name, status in entries:
+        run_log.append(file_name, status)
+    run_log.close()
+
+def test_entries_survive_a_torn_last_line(tmp_path):
+    log_path = tmp_path / 'log.jsonl'
+    write_log(log_path, ('a.dat', 'Successful'), ('b.dat', 'Failed'))
+    with open(log_path, 'a') as f:
+        f.write('{"file_name": "c.d')
+
+    assert [entry['file_name'] for entry in read_entries(str(log_path))] == ['a.dat', 'b.dat']
+
+def test_append_after_close_still_reaches_the_log(tmp_path):
+    run_log = RunLog(str(tmp_path / 'log.jsonl'))
+    run_log.close()
+    run_log.append('late.dat', 'Successful')
+    assert [entry['file_name'] for entry in read_entries(str(tmp_path / 'log.jsonl'))] == ['late.dat']
+
+def test_export_adds_only_new_entries_newest_first(tmp_path):
+    log_path, xlsx_path = tmp_path / 'log.jsonl', tmp_path / 'log.xlsx'
+    write_log(log_path, ('a.dat', 'Successful'))
+    export_to_xlsx(str(log_path), str(xlsx_path))
+    write_log(log_path, ('b.dat', 'Failed'), ('c.dat', 'Successful'))
+    export_to_xlsx(str(log_path), str(xlsx_path))
+    export_to_xlsx(str(log_path), str(xlsx_path))
+
+    assert [(row[0], row[2]) for row in sheet_rows(xlsx_path)] == [
+        ('File Name', 'Status'), ('c.dat', 'Successful'), ('b.dat', 'Failed'), ('a.dat', 'Successful')]
+
+def test_export_keeps_other_sheets_and_formatting(tmp_path):
+    from openpyxl import load_workbook
+    from openpyxl.styles import Font
+
+    log_path, xlsx_path = tmp_path / 'log.jsonl', tmp_path / 'log.xlsx'
+    write_log(log_path, ('a.dat', 'Successful'))
+    export_to_xlsx(str(log_path), str(xlsx_path))
+    workbook = load_workbook(xlsx_path)
+    workbook.active['A1'].font = Font(bold=True)
+    workbook.create_sheet('Notes')['A1'] = 'keep me'
+    workbook.save(xlsx_path)
+
+    write_log(log_path, ('b.dat', 'Successful'))
+    export_to_xlsx(str(log_path), str(xlsx_path))
+
+    workbook = load_workbook(xlsx_path)
+    assert workbook.active['A1'].font.bold
+    assert workbook['Notes']['A1'].value == 'keep me'
+    assert [row[0] for row in sheet_rows(xlsx_path)] == ['File Name', 'b.dat', 'a.dat']
+
+def test_a_workbook_without_the_marker_is_not_overwritten(tmp_path):
+    from openpyxl import Workbook
+
+    log_path, xlsx_path = tmp_path / 'log.jsonl', tmp_path / 'log.xlsx'
+    workbook = Workbook()
+    workbook.active.append(['File Name', 'Timestamp', 'Status'])
+    workbook.active.append(['only-in-xlsx.dat', '2024-01-01 00:00:00', 'Successful'])
+    workbook.save(xlsx_path)
+    write_log(log_path, ('a.dat', 'Successful'))
+
+    with pytest.raises(ValueError):
+        export_to_xlsx(str(log_path), str(xlsx_path))
+    assert sheet_rows(xlsx_path)[1][0] == 'only-in-xlsx.dat'
+
+def test_an_old_workbook_seeds_the_log_once(tmp_path):
+    from openpyxl import Workbook, load_workbook
+
+    xlsx_path = tmp_path / 'log.xlsx'
+    workbook = Workbook()
+    workbook.active.append(['File', 'When', 'Result'])
+    workbook.active.append(['old.dat', '2024-01-01 00:00:00', 'Successful'])
+    workbook.save(xlsx_path)
+
+    run_log = open_run_log({'LogFilePath': str(xlsx_path)})
+    assert EXPORTED_OFFSET_PROPERTY in load_workbook(xlsx_path).custom_doc_props.names
+    run_log.append('new.dat', 'Successful')
+    run_log.close()
+
+    assert [row[0] for row in sheet_rows(xlsx_path)] == ['File', 'new.dat', 'old.dat']
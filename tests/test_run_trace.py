@@ -0,0 +1,64 @@
+import json
+import threading
+import time
+
+import pytest
+
+import run_trace
+from run_trace import RunTrace, configure_tracing, get_trace
+
+@pytest.fixture
+def trace(monkeypatch):
+    trace = RunTrace()
+    monkeypatch.setattr(run_trace, '_trace', trace)
+    yield trace
+    if trace._main_profile:
+        trace._main_profile.disable()
+
+def read_events(trace_path):
+    with open(trace_path, encoding='utf-8') as f:
+        return json.load(f)
+
+def test_tracing_is_off_until_configured(trace, tmp_path):
+    configure_tracing({'TraceDir': str(tmp_path)})
+    with trace.span('upload', 'file'):
+        pass
+    trace.instant('retry', 'throttle')
+    assert trace.write() is None
+    assert list(tmp_path.iterdir()) == []
+
+def test_spans_and_instants_are_written_per_thread(trace, tmp_path):
+    configure_tracing({'Trace': 'true', 'TraceDir': str(tmp_path)})
+    assert get_trace() is trace
+
+    with trace.span('scan', 'phase', files=2):
+        time.sleep(0.01)
+    worker = threading.Thread(target=trace.instant, args=('retry', 'throttle'), kwargs={'attempt': 1}, name='worker')
+    worker.start()
+    worker.join()
+    trace.complete('too short', 'chunk', time.monotonic(), 0.0)
+
+    data = read_events(trace.write())
+    events = {event['name']: event for event in data['traceEvents']}
+    assert events['scan']['ph'] == 'X' and events['scan']['dur'] >= 10000
+    assert events['scan']['args'] == {'files': 2}
+    assert events['retry']['ph'] == 'i' and events['retry']['args'] == {'attempt': 1}
+    assert 'too short' not in events
+    thread_names = {event['args']['name'] for event in data['traceEvents'] if event['ph'] == 'M'}
+    assert thread_names == {'MainThread', 'worker'}
+    assert data['otherData']['run_id'] == trace.run_id
+
+def test_cprofile_is_written_next_to_the_trace(trace, tmp_path):
+    import pstats
+
+    configure_tracing({'Trace': 'on', 'TraceDir': str(tmp_path), 'Profile': 'cprofile'})
+    sum(range(1000))
+    data = read_events(trace.write())
+
+    assert data['otherData']['profile'] == f"profile-{trace.run_id}.pstats"
+    assert pstats.Stats(str(tmp_path / data['otherData']['profile'])).total_calls > 0
+
+def test_an_unknown_profiler_is_ignored(trace, tmp_path, capsys):
+    configure_tracing({'Trace': 'yes', 'TraceDir': str(tmp_path), 'Profile': 'perf'})
+    assert trace.enabled and trace.profiler is None
+    assert "Invalid Profile 'perf'" in capsys.readouterr().out
@@ -0,0 +1,136 @@
+import json
+import os
+import time
+import uuid
+
+import pytest
+
+from conftest import FOLDER_URL, run_script
+
+SMALL_FILES = {'a.dat': 1000, 'b.dat': 64 * 1024, 'c.dat': 300 * 1024}
+# Above the default SingleRequestMaxMB, so it goes through an upload session
+SESSION_FILE = ('big.dat', 12 * 1024 * 1024)
+
+def write_files(source, files):
+    for name, size in files.items():
+        (source / name).write_bytes(os.urandom(size))
+
+def uploaded(fake_server, script_dir):
+    folder_url = f"{FOLDER_URL}/{script_dir.name}"
+    sharepoint = fake_server[0].sharepoint
+    return {url.rsplit('/', 1)[1]: entry['length'] for url, entry in sharepoint.files.items()
+            if url.rsplit('/', 1)[0] == folder_url}
+
+@pytest.mark.parametrize('script_name', ['upload.py', 'adjustment_upload.py', 'New_Version.py'])
+def test_script_uploads_source_folder(fake_server, script_dir, script_name):
+    files = dict(SMALL_FILES, **{SESSION_FILE[0]: SESSION_FILE[1]})
+    write_files(script_dir / 'source', files)
+    (script_dir / 'source' / 'skip.txt').write_bytes(b'not matched')
+
+    exit_code, summary = run_script(script_dir, script_name)
+
+    assert exit_code == 0, summary
+    assert summary['success'] == len(files)
+    assert summary['failed'] == 0
+    assert uploaded(fake_server, script_dir) == files
+    assert not fake_server[0].sharepoint.sessions
+
+def test_incremental_sync_skips_unchanged_files(fake_server, script_dir):
+    write_files(script_dir / 'source', SMALL_FILES)
+    with open(script_dir / 'config.txt', 'a') as f:
+        f.write(f"IncrementalSync=true\nManifestPath={script_dir / 'manifest.json'}\n")
+
+    assert run_script(script_dir, 'upload.py')[1]['success'] == len(SMALL_FILES)
+    (script_dir / 'source' / 'a.dat').write_bytes(b'changed')
+    exit_code, summary = run_script(script_dir, 'upload.py')
+
+    assert exit_code == 0, summary
+    assert summary['success'] == 1
+    assert summary['skipped'] == len(SMALL_FILES) - 1
+    assert uploaded(fake_server, script_dir)['a.dat'] == len(b'changed')
+
+def test_remote_index_skips_files_uploaded_unchanged(fake_server, script_dir):
+    write_files(script_dir / 'source', SMALL_FILES)
+    with open(script_dir / 'config.txt', 'a') as f:
+        f.write(f"RemoteIndex=true\nRemoteIndexPath={script_dir / 'index.sqlite'}\n")
+
+    assert run_script(script_dir, 'upload.py')[1]['success'] == len(SMALL_FILES)
+    assert run_script(script_dir, 'upload.py')[1]['skipped'] == len(SMALL_FILES)
+    # Same size as the remote copy: only the recorded mtime shows the edit
+    (script_dir / 'source' / 'a.dat').write_bytes(os.urandom(SMALL_FILES['a.dat']))
+    os.utime(script_dir / 'source' / 'a.dat', (time.time() - 3600, time.time() - 3600))
+    exit_code, summary = run_script(script_dir, 'upload.py')
+
+    assert exit_code == 0, summary
+    assert summary['success'] == 1
+    assert summary['skipped'] == len(SMALL_FILES) - 1
+
+@pytest.mark.parametrize('script_name', ['upload.py', 'adjustment_upload.py'])
+def test_single_file_with_a_comma_in_its_name(fake_server, script_dir, script_name):
+    write_files(script_dir / 'source', {'Report, Q1.dat': 100, 'Report': 10, 'Q1.dat': 10})
+
+    exit_code, summary = run_script(script_dir, script_name, str(script_dir / 'source' / 'Report, Q1.dat'))
+
+    assert exit_code == 0, summary
+    assert uploaded(fake_server, script_dir) == {'Report, Q1.dat': 100}
+
+@pytest.mark.parametrize('script_name, status', [('upload.py', 'Successful'), ('adjustment_upload.py', 'Success')])
+def test_scripts_share_one_run_with_their_own_status(fake_server, script_dir, script_name, status):
+    write_files(script_dir / 'source', {'a.dat': 10})
+
+    exit_code, summary = run_script(script_dir, script_name)
+
+    assert exit_code == 0, summary
+    assert [(entry['file'], entry['status']) for entry in summary['files']] == [('a.dat', status)]
+
+@pytest.mark.parametrize('script_name', ['upload.py', 'adjustment_upload.py'])
+def test_missing_source_folder_is_an_error(fake_server, script_dir, script_name):
+    (script_dir / 'source').rmdir()
+
+    exit_code, summary = run_script(script_dir, script_name)
+
+    assert exit_code == 2
+    assert summary['error'].startswith('Source folder not found')
+
+@pytest.mark.parametrize('script_name', ['upload.py', 'adjustment_upload.py'])
+def test_expired_journal_sessions_are_cleaned_up(fake_server, script_dir, script_name):
+    journal_path = script_dir / 'upload_journal.json'
+    journal_path.write_text(json.dumps({'old': {'upload_id': str(uuid.uuid4()), 'file_url': f"{FOLDER_URL}/gone.bin",
+                                                'updated_at': time.time() - 48 * 3600}}))
+
+    exit_code, summary = run_script(script_dir, script_name)
+
+    assert exit_code == 0, summary
+    assert json.loads(journal_path.read_text()) == {}
+
+def test_async_engine_uploads_source_folder(fake_server, script_dir):
+    files = dict(SMALL_FILES, **{SESSION_FILE[0]: SESSION_FILE[1]})
+    write_files(script_dir / 'source', files)
+    with open(script_dir / 'config.txt', 'a') as f:
+        f.write("UploadEngine=async\n")
+
+    exit_code, summary = run_script(script_dir, 'upload.py')
+
+    assert exit_code == 0, summary
+    assert summary['success'] == len(files)
+    assert uploaded(fake_server, script_dir) == files
+
+def test_jobs_share_one_run(fake_server, script_dir):
+    shared = [line for line in (script_dir / 'config.txt').read_text().splitlines()
+              if not line.startswith(('SourceFolderPath', 'DestinationFolderURL'))]
+    folder_url = f"{FOLDER_URL}/{script_dir.name}"
+    fake_server[0].sharepoint.ensure_folder(f"{folder_url}/reports")
+    (script_dir / 'reports').mkdir()
+    write_files(script_dir / 'source', {'a.dat': 10, 'b.dat': 20})
+    write_files(script_dir / 'reports', {'r.dat': 30})
+    (script_dir / 'jobs.txt').write_text("\n".join(shared + [
+        "[Daily]", f"SourceFolderPath={script_dir / 'source'}", f"DestinationFolderURL={folder_url}",
+        "[Reports]", f"SourceFolderPath={script_dir / 'reports'}", f"DestinationFolderURL={folder_url}/reports",
+        "Priority=5"]) + "\n")
+
+    exit_code, summary = run_script(script_dir, 'upload_jobs.py')
+
+    assert exit_code == 0, summary
+    assert summary['jobs']['Daily']['success'] == 2
+    assert summary['jobs']['Reports']['success'] == 1
+    assert uploaded(fake_server, script_dir) == {'a.dat': 10, 'b.dat': 20}
@@ -0,0 +1,108 @@
+import pytest
+
+from conftest import FOLDER_URL, SITE_PATH
+from sharepoint_upload import (BatchUploader, FileBatch, build_batch_body, choose_upload_strategy,
+                               open_batch_uploader, parse_batch_statuses, send_batch)
+
+KB = 1024
+MB = 1024 * 1024
+
+@pytest.fixture
+def ctx(fake_server):
+    from office365.sharepoint.client_context import ClientContext
+
+    token = {'access_token': 'test', 'token_type': 'Bearer', 'expires_in': 3600}
+    return ClientContext(fake_server[1] + SITE_PATH).with_access_token(lambda: token)
+
+def make_files(root, sizes):
+    items = []
+    for i, size in enumerate(sizes):
+        path = root / f"f{i}.bin"
+        path.write_bytes(b'x' * size)
+        items.append((path.name, str(path), size))
+    return items
+
+def test_choose_upload_strategy():
+    assert choose_upload_strategy(1 * KB, {}) == 'single'
+    assert choose_upload_strategy(0, {}) == 'single'
+    assert choose_upload_strategy(11 * MB, {}) == 'chunked'
+    assert choose_upload_strategy(1 * KB, {'BatchFileMaxKB': '64'}) == 'batch'
+    assert choose_upload_strategy(100 * KB, {'BatchFileMaxKB': '64'}) == 'single'
+    assert choose_upload_strategy(2 * MB, {'SingleRequestMaxMB': '1'}) == 'chunked'
+
+def test_batching_is_opt_in():
+    assert open_batch_uploader({}, FOLDER_URL) is None
+    uploader = open_batch_uploader({'BatchFileMaxKB': '8', 'BatchMaxFiles': '3'}, FOLDER_URL)
+    assert (uploader.max_file_size, uploader.max_files) == (8 * KB, 3)
+
+def test_batch_groups_tiny_files_per_folder(tmp_path):
+    items = make_files(tmp_path, [10, 20, 30, 5000, 40])
+    pending = [items[0], ('sub/' + items[1][0], items[1][1], items[1][2]), items[2], items[3], items[4]]
+    uploader = BatchUploader(FOLDER_URL, max_file_size=1000, max_files=2)
+    grouped = list(uploader.batch(iter(pending)))
+
+    names = [item[0] for item in grouped]
+    assert names == ['$batch 0001', 'f3.bin', 'sub/f1.bin', 'f4.bin']
+    batch = uploader.batches['$batch 0001']
+    assert [member[0] for member in batch.members] == ['f0.bin', 'f2.bin']
+    assert batch.folder_url == FOLDER_URL
+
+def test_batch_body_has_one_changeset_per_file(tmp_path):
+    items = make_files(tmp_path, [3, 4])
+    content_type, body, contents = build_batch_body('https://site', FileBatch('b', "/docs/O'Neil", items))
+    assert content_type.startswith('multipart/mixed; boundary=batch_')
+    assert body.count(b'Content-Type: multipart/mixed; boundary=changeset_') == 2
+    assert b"GetFolderByServerRelativeUrl('/docs/O%27%27Neil')/Files/add(url='f0.bin',overwrite=true)" in body
+    assert contents == [b'xxx', b'xxxx']
+    assert parse_batch_statuses("HTTP/1.1 200 OK\r\n\r\n--b\r\nHTTP/1.1 500 Oops\r\n") == [200, 500]
+
+def test_send_batch_against_the_fake_server(fake_server, ctx, tmp_path):
+    folder_url = f"{FOLDER_URL}/{tmp_path.name}"
+    fake_server[0].sharepoint.ensure_folder(folder_url)
+    items = make_files(tmp_path, [10, 20, 30])
+
+    statuses, contents = send_batch(ctx, FileBatch('b', folder_url, items))
+
+    assert statuses == {'f0.bin': 200, 'f1.bin': 200, 'f2.bin': 200}
+    assert {url.rsplit('/', 1)[1]: entry['length'] for url, entry in fake_server[0].sharepoint.files.items()
+            if url.startswith(folder_url + '/')} == {'f0.bin': 10, 'f1.bin': 20, 'f2.bin': 30}
+
+def test_failed_batch_falls_back_to_single_uploads(fake_server, ctx, tmp_path, monkeypatch):
+    folder_url = f"{FOLDER_URL}/{tmp_path.name}"
+    fake_server[0].sharepoint.ensure_folder(folder_url)
+    items = make_files(tmp_path, [10, 20])
+    uploader = BatchUploader(folder_url, max_file_size=1000)
+    item = next(uploader.batch(iter(items)))
+    monkeypatch.setattr('sharepoint_upload.send_batch', lambda *args: (_ for _ in ()).throw(OSError('down')))
+
+    results = []
+    upload = uploader.wrap_upload(lambda *args: None, {})
+    upload(ctx, ctx.web.get_folder_by_server_relative_url(folder_url), item[1], item[0], item[2])
+    uploader.wrap_result(lambda name, error: results.append((name, error)))(item[0], None)
+
+    assert results == [('f0.bin', None), ('f1.bin', None)]
+    assert uploader.batch_count == 0
+    assert sorted(url.rsplit('/', 1)[1] for url in fake_server[0].sharepoint.files
+                  if url.startswith(folder_url + '/')) == ['f0.bin', 'f1.bin']
+
+def test_single_request_upload_charges_bandwidth_once(tmp_path, monkeypatch):
+    from types import SimpleNamespace
+    from sharepoint_upload import upload_in_one_request
+
+    charged = []
+    attempts = []
+    monkeypatch.setattr('sharepoint_upload.get_bandwidth_limiter', lambda: SimpleNamespace(acquire=charged.append))
+    monkeypatch.setattr('throttling.ThrottleController.backoff_delay', lambda self, attempt: 0.0)
+
+    def execute_query():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError('reset')
+        return 'uploaded'
+
+    folder = SimpleNamespace(upload_file=lambda name, content: SimpleNamespace(execute_query=execute_query))
+    (tmp_path / 'a.bin').write_bytes(b'x' * 10)
+
+    assert upload_in_one_request(folder, str(tmp_path / 'a.bin'), 'a.bin', 10) == 'uploaded'
+    assert len(attempts) == 2
+    assert charged == [10]
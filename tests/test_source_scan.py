@@ -0,0 +1,80 @@
+import os
+
+from source_scan import SourceFilter, get_source_filter, scan_source_files, split_patterns
+
+def make_tree(root, names):
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'x' * len(name))
+
+def scan(root, source_filter, recursive=True, on_missing=None):
+    return sorted(scan_source_files(str(root), source_filter, recursive, on_missing))
+
+def test_split_patterns():
+    assert split_patterns(' *.csv; *.xlsx,report?.txt ;') == ['*.csv', '*.xlsx', 'report?.txt']
+    assert split_patterns(None) == []
+
+def test_include_and_exclude():
+    source_filter = SourceFilter(['*.csv', '*.txt'], ['tmp_*', 'archive/*'])
+    assert source_filter.matches('a.csv')
+    assert not source_filter.matches('a.xlsx')
+    assert not source_filter.matches('tmp_a.csv')
+    assert not source_filter.matches('a.csv', 'archive/a.csv')
+    assert not SourceFilter([]).matches('a.csv')
+
+def test_scan_yields_relative_names_and_sizes(tmp_path):
+    make_tree(tmp_path, ['a.csv', 'b.txt', 'sub/c.csv', 'sub/deeper/d.csv'])
+    found = scan(tmp_path, get_source_filter({}, '*.csv'))
+    assert [(name, size) for name, _, size in found] == [('a.csv', 5), ('sub/c.csv', 9), ('sub/deeper/d.csv', 16)]
+    assert found[0][1] == os.path.join(str(tmp_path), 'a.csv')
+    assert found[0].stat.st_size == 5
+    assert [name for name, _, _ in scan(tmp_path, get_source_filter({}, '*.csv'), recursive=False)] == ['a.csv']
+
+def test_excluded_folders_are_not_entered(tmp_path):
+    make_tree(tmp_path, ['a.csv', 'archive/b.csv', 'sub/archive/c.csv', 'sub/d.csv'])
+    by_name = get_source_filter({'ExcludeFileName': 'archive'}, '*.csv')
+    assert [name for name, _, _ in scan(tmp_path, by_name)] == ['a.csv', 'sub/d.csv']
+    by_path = get_source_filter({'ExcludeFileName': 'sub/archive/*'}, '*.csv')
+    assert [name for name, _, _ in scan(tmp_path, by_path)] == ['a.csv', 'archive/b.csv', 'sub/d.csv']
+
+def test_unreadable_entries_are_not_reported_missing(tmp_path, monkeypatch):
+    make_tree(tmp_path, ['a.csv', 'sub/b.csv'])
+    real_scandir = os.scandir
+
+    class BrokenEntry:
+        def __init__(self, entry):
+            self.entry = entry
+            self.name = entry.name
+            self.path = entry.path
+
+        def is_dir(self, follow_symlinks=True):
+            raise PermissionError(self.path)
+
+    class Listing:
+        def __init__(self, path):
+            self.entries = real_scandir(path)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            self.entries.close()
+
+        def __iter__(self):
+            for entry in self.entries:
+                yield BrokenEntry(entry) if entry.name == 'sub' else entry
+
+    monkeypatch.setattr(os, 'scandir', Listing)
+    missing = []
+    assert [name for name, _, _ in scan(tmp_path, get_source_filter({}, '*.csv'), on_missing=missing.append)] \
+        == ['a.csv']
+    assert missing == []
+
+def test_single_file_name_is_matched_as_it_is(tmp_path):
+    make_tree(tmp_path, ['Report, Q1.xlsx', 'Report', 'Q1.xlsx', '[draft].txt', 'd.txt'])
+    for name in ('Report, Q1.xlsx', '[draft].txt'):
+        found = scan(tmp_path, get_source_filter({}, name, single_file=True), recursive=False)
+        assert [found_name for found_name, _, _ in found] == [name]
+    # A FileName value from config is still a list of patterns
+    assert len(scan(tmp_path, get_source_filter({}, 'Report, Q1.xlsx'), recursive=False)) == 2
@@ -0,0 +1,68 @@
+import json
+import os
+
+from sync_manifest import SyncManifest, hash_file, open_sync_manifest
+
+def write(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+def test_unchanged_files_are_skipped(tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    a = write(tmp_path / 'a.txt', b'one')
+    b = write(tmp_path / 'b.txt', b'two')
+    manifest = SyncManifest(manifest_path, 'dest')
+    for path in (a, b):
+        manifest.is_unchanged(path)
+        manifest.record(path)
+    manifest.save()
+
+    write(tmp_path / 'b.txt', b'three')
+    skipped = []
+    changed = list(SyncManifest(manifest_path, 'dest').iter_changed(
+        [('a.txt', a, 3), ('b.txt', b, 5)], skipped))
+    assert [item[0] for item in changed] == ['b.txt']
+    assert skipped == ['a.txt']
+
+def test_touched_file_with_same_hash_is_skipped(tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    a = write(tmp_path / 'a.txt', b'same')
+    manifest = SyncManifest(manifest_path, 'dest', use_hash=True)
+    manifest.record(a)
+    manifest.save()
+    assert json.load(open(manifest_path))[f"dest|{os.path.abspath(a)}"]['sha256'] == hash_file(a)
+
+    stat = os.stat(a)
+    os.utime(a, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert SyncManifest(manifest_path, 'dest', use_hash=True).is_unchanged(a)
+    assert not SyncManifest(manifest_path, 'dest').is_unchanged(a)
+
+def test_save_merges_with_other_writers(tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    a = write(tmp_path / 'a.txt', b'a')
+    b = write(tmp_path / 'b.txt', b'b')
+    first = SyncManifest(manifest_path, 'dest')
+    second = SyncManifest(manifest_path, 'dest')
+    first.record(a)
+    second.record(b)
+    first.save()
+    second.save()
+    assert len(json.load(open(manifest_path))) == 2
+
+    second.forget(a)
+    second.save()
+    assert list(json.load(open(manifest_path))) == [f"dest|{os.path.abspath(b)}"]
+
+def test_destinations_are_kept_apart(tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    a = write(tmp_path / 'a.txt', b'a')
+    manifest = SyncManifest(manifest_path, 'one')
+    manifest.record(a)
+    manifest.save()
+    assert not SyncManifest(manifest_path, 'two').is_unchanged(a)
+
+def test_open_sync_manifest_follows_config(tmp_path):
+    assert open_sync_manifest({}) is None
+    manifest = open_sync_manifest({'IncrementalSync': 'yes', 'ManifestHash': 'true',
+                                   'ManifestPath': str(tmp_path / 'm.json')})
+    assert manifest.use_hash
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+from throttling import ThrottleController, get_throttle_details, parse_retry_after
+
+class HTTPError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = SimpleNamespace(status_code=status_code, headers={'Retry-After': retry_after})
+
+def failing(errors, result='ok'):
+    """An operation that raises each of errors in turn, then returns result."""
+    calls = []
+
+    def operation():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return operation, calls
+
+def test_parse_retry_after():
+    assert parse_retry_after('5') == 5.0
+    assert parse_retry_after('-3') == 0.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+def test_get_throttle_details():
+    assert get_throttle_details(HTTPError(429, '2')) == (429, 2.0)
+    assert get_throttle_details(HTTPError(503)) == (503, None)
+    assert get_throttle_details(HTTPError(500, '2')) == (None, None)
+    assert get_throttle_details(ValueError()) == (None, None)
+
+def test_backoff_delay_grows_with_jitter_and_is_capped():
+    controller = ThrottleController(base_delay=1.0, max_delay=10.0)
+    for attempt, ceiling in ((1, 1.0), (2, 2.0), (3, 4.0), (10, 10.0)):
+        for _ in range(20):
+            assert ceiling / 2 <= controller.backoff_delay(attempt) <= ceiling
+
+def test_throttle_uses_retry_after_and_resets_on_success():
+    controller = ThrottleController(base_delay=0.01, max_delay=0.05)
+    operation, calls = failing([HTTPError(429, '0'), HTTPError(503, '0')])
+    assert controller.call(operation) == 'ok'
+    assert len(calls) == 3
+    assert controller.state()['total_throttles'] == 2
+    assert controller.state()['consecutive_throttles'] == 0
+
+def test_transient_errors_back_off_then_give_up(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('throttling.time.sleep', sleeps.append)
+    controller = ThrottleController(base_delay=1.0, max_attempts=3)
+    operation, calls = failing([ValueError('a'), ValueError('b'), ValueError('c')])
+    with pytest.raises(ValueError, match='c'):
+        controller.call(operation)
+    assert len(calls) == 3
+    assert len(sleeps) == 2
+    assert 0.5 <= sleeps[0] <= 1.0 and 1.0 <= sleeps[1] <= 2.0
+
+def test_throttle_retries_are_limited():
+    controller = ThrottleController(base_delay=0.001, max_attempts=1, max_throttle_retries=2)
+    operation, calls = failing([HTTPError(429, '0')] * 5)
+    with pytest.raises(HTTPError):
+        controller.call(operation)
+    assert len(calls) == 3
+
+def test_call_async_retries_like_call():
+    import asyncio
+
+    controller = ThrottleController(base_delay=0.001)
+    operation, calls = failing([HTTPError(429, '0'), ValueError('transient')])
+
+    async def run():
+        return await controller.call_async(lambda: asyncio.sleep(0, operation()))
+
+    # operation() raises before the awaitable exists, as a failed request would
+    assert asyncio.run(run()) == 'ok'
+    assert len(calls) == 3
@@ -0,0 +1,54 @@
+import os
+import time
+
+import pytest
+
+import token_cache
+from token_cache import TOKEN_REFRESH_MARGIN, TokenCache, cached_token_provider, is_token_cache_enabled
+
+@pytest.fixture
+def credentials():
+    from office365.runtime.auth.client_credential import ClientCredential
+
+    return ClientCredential('client-id', 'client-secret')
+
+def test_token_cache_is_opt_in():
+    assert not is_token_cache_enabled({})
+    assert not is_token_cache_enabled({'TokenCache': 'off'})
+    assert is_token_cache_enabled({'TokenCache': 'True'})
+
+def test_tokens_are_returned_until_near_expiry(tmp_path, credentials):
+    cache = TokenCache(str(tmp_path / 'cache.bin'), credentials)
+    cache.put('https://a.sharepoint.com/sites/x', 'token-a', 'Bearer', time.time() + 3600)
+    cache.put('https://b.sharepoint.com/sites/y', 'token-b', 'Bearer', time.time() + TOKEN_REFRESH_MARGIN - 1)
+
+    # Keyed by host, so another site on the same host shares the token
+    assert cache.get('https://a.sharepoint.com/sites/other')[0] == 'token-a'
+    assert cache.get('https://b.sharepoint.com/sites/y') is None
+    assert b'token-a' not in (tmp_path / 'cache.bin').read_bytes()
+
+@pytest.mark.skipif(os.name == 'nt', reason="POSIX file modes")
+def test_cache_file_is_private(tmp_path, credentials):
+    TokenCache(str(tmp_path / 'cache.bin'), credentials).put('https://a', 't', 'Bearer', time.time() + 3600)
+    assert os.stat(tmp_path / 'cache.bin').st_mode & 0o077 == 0
+
+def test_other_credentials_cannot_read_the_cache(tmp_path, credentials):
+    from office365.runtime.auth.client_credential import ClientCredential
+
+    TokenCache(str(tmp_path / 'cache.bin'), credentials).put('https://a', 't', 'Bearer', time.time() + 3600)
+    assert TokenCache(str(tmp_path / 'cache.bin'), ClientCredential('client-id', 'other')).get('https://a') is None
+
+def test_provider_acquires_once_then_serves_the_cache(tmp_path, credentials, monkeypatch):
+    acquired = []
+
+    def acquire(site_url, client_credentials):
+        acquired.append(site_url)
+        return 'fresh', 'Bearer', time.time() + 3600
+
+    monkeypatch.setattr(token_cache, 'acquire_app_only_token', acquire)
+    get_token = cached_token_provider('https://a/sites/x', credentials, str(tmp_path / 'cache.bin'))
+
+    tokens = [get_token(), get_token()]
+    assert [token['access_token'] for token in tokens] == ['fresh', 'fresh']
+    assert acquired == ['https://a/sites/x']
+    assert 0 < tokens[0]['expires_in'] <= 3600 - TOKEN_REFRESH_MARGIN
@@ -0,0 +1,50 @@
+import json
+
+from transfer_metrics import TransferMetrics, format_prometheus, get_metrics_path, write_run_metrics
+
+def test_metrics_file_is_opt_in(tmp_path):
+    assert get_metrics_path({}) is None
+    assert get_metrics_path({'MetricsPath': 'none'}) is None
+    assert get_metrics_path({'MetricsPath': 'true'}).endswith('run_metrics.json')
+    assert get_metrics_path({'MetricsPath': str(tmp_path / 'm.json')}) == str(tmp_path / 'm.json')
+
+def test_summary_totals_and_percentiles():
+    metrics = TransferMetrics()
+    for seconds in (1.0, 2.0, 3.0):
+        metrics.record_file('a', 100, seconds)
+    metrics.record_file('bad', 50, 0.5, ok=False)
+    metrics.record_chunk(1000, 0.5)
+    metrics.increment('retries', 2)
+    metrics.add_time('auth', 0.25)
+
+    summary = metrics.summary()
+    assert summary['files']['succeeded'] == 3
+    assert summary['files']['failed'] == 1
+    assert summary['files']['bytes'] == 300
+    assert summary['files']['seconds']['p50'] == 2.0
+    assert summary['chunks']['bytes_per_second'] == 2000.0
+    assert summary['counters'] == {'retries': 2}
+    assert summary['phases'] == {'auth': 0.25}
+
+def test_write_run_metrics(tmp_path):
+    metrics = TransferMetrics()
+    metrics.record_file('a', 100, 1.0)
+
+    write_run_metrics({}, metrics)
+    assert list(tmp_path.iterdir()) == []
+
+    config_values = {'MetricsPath': str(tmp_path / 'run.json'), 'MetricsTextfilePath': str(tmp_path / 'run.prom')}
+    write_run_metrics(config_values, metrics)
+    assert json.loads((tmp_path / 'run.json').read_text())['files']['succeeded'] == 1
+    assert 'sharepoint_upload_files{job=' in (tmp_path / 'run.prom').read_text()
+
+def test_prometheus_format():
+    metrics = TransferMetrics()
+    metrics.record_file('a', 100, 1.0)
+    metrics.increment('throttled')
+    text = format_prometheus(metrics.summary(), 'upload')
+
+    assert '# TYPE sharepoint_upload_files gauge' in text
+    assert 'sharepoint_upload_files{job="upload",status="success"} 1' in text
+    assert 'sharepoint_upload_events{job="upload",event="throttled"} 1' in text
+    assert 'sharepoint_upload_file_seconds_count{job="upload"} 1' in text
@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+from conftest import FOLDER_URL, SITE_PATH
+from upload_journal import ResumedUploadSession, UploadJournal, get_file_fingerprint
+
+def make_journal(tmp_path, max_age_hours=24, save_interval_seconds=0):
+    return UploadJournal(str(tmp_path / 'journal.json'), max_age_hours, save_interval_seconds)
+
+def test_session_is_found_while_source_is_unchanged(tmp_path):
+    source = tmp_path / 'big.bin'
+    source.write_bytes(b'x' * 100)
+    journal = make_journal(tmp_path)
+    key = UploadJournal.make_key('https://site', '/docs/big.bin', str(source))
+    fingerprint = get_file_fingerprint(str(source))
+    journal.start(key, 'session-1', fingerprint, '/docs/big.bin', 10)
+    journal.update(key, 40, chunk_size=20)
+
+    entry = journal.find(key, fingerprint)
+    assert (entry['upload_id'], entry['offset'], entry['chunk_size']) == ('session-1', 40, 20)
+
+    source.write_bytes(b'y' * 101)
+    assert journal.find(key, get_file_fingerprint(str(source))) is None
+
+def test_remove_and_update_of_unknown_key(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.update('missing', 10)
+    journal.start('key', 'session-1', {'size': 1}, '/docs/a', 10)
+    journal.remove('key')
+    assert journal.find('key', {'size': 1}) is None
+
+def test_offset_updates_are_written_at_most_once_per_interval(tmp_path):
+    journal = make_journal(tmp_path, save_interval_seconds=3600)
+    journal.start('key', 'session-1', {'size': 1}, '/docs/a', 10)
+    for offset in (10, 20, 30):
+        journal.update('key', offset)
+    assert journal._load()['key']['offset'] == 0
+
+    journal.save_interval_seconds = 0
+    journal.update('key', 40)
+    assert journal._load()['key']['offset'] == 40
+
+def test_expired_sessions_are_not_resumed_and_cleaned_up(tmp_path):
+    journal = make_journal(tmp_path, max_age_hours=1)
+    journal.start('old', 'session-1', {'size': 1}, '/docs/a', 10)
+    journal.start('new', 'session-2', {'size': 1}, '/docs/b', 10)
+    entries = journal._load()
+    entries['old']['updated_at'] = time.time() - 7200
+    journal._save(entries)
+
+    assert journal.find('old', {'size': 1}) is None
+    assert journal.cleanup() == 1
+    assert list(journal._load()) == ['new']
+    assert journal.cleanup() == 0
+
+@pytest.fixture
+def ctx(fake_server):
+    from office365.sharepoint.client_context import ClientContext
+
+    token = {'access_token': 'test', 'token_type': 'Bearer', 'expires_in': 3600}
+    return ClientContext(fake_server[1] + SITE_PATH).with_access_token(lambda: token)
+
+def upload_over_existing_file(fake_server, ctx, tmp_path):
+    """Upload 300 bytes in 100-byte chunks over a 7-byte big.bin; returns the folder's files by name."""
+    from chunk_tuning import ChunkSizeTuner
+    from sharepoint_upload import upload_file_in_chunks
+
+    folder_url = f"{FOLDER_URL}/{tmp_path.name}"
+    sharepoint = fake_server[0].sharepoint
+    sharepoint.ensure_folder(folder_url)
+    sharepoint.put_file(f"{folder_url}/big.bin", 7)
+    source = tmp_path / 'big.bin'
+    source.write_bytes(b'x' * 300)
+    folder = ctx.web.get_folder_by_server_relative_url(folder_url)
+    error = None
+    try:
+        upload_file_in_chunks(ctx, folder, str(source), 'big.bin', chunk_tuner=ChunkSizeTuner(100))
+    except OSError as e:
+        error = e
+    return error, {url.rsplit('/', 1)[1]: entry['length'] for url, entry in sharepoint.files.items()
+                   if url.startswith(folder_url + '/')}
+
+def test_session_replaces_the_destination_only_when_complete(fake_server, ctx, tmp_path):
+    assert upload_over_existing_file(fake_server, ctx, tmp_path) == (None, {'big.bin': 300})
+
+def test_failed_session_leaves_the_destination_alone(fake_server, ctx, tmp_path, monkeypatch):
+    def fail(self, offset, chunk):
+        raise OSError('connection reset')
+    monkeypatch.setattr(ResumedUploadSession, 'upload_chunk', fail)
+    monkeypatch.setattr('throttling.ThrottleController.call', lambda self, operation, description: operation())
+
+    error, files = upload_over_existing_file(fake_server, ctx, tmp_path)
+
+    assert str(error) == 'connection reset'
+    # The staging file is gone and the old version is still there
+    assert files == {'big.bin': 7}
+    assert not fake_server[0].sharepoint.sessions
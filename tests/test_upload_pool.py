@@ -0,0 +1,95 @@
+import threading
+from types import SimpleNamespace
+
+import upload_pool
+from upload_pool import (get_large_file_threshold_mb, get_max_workers, order_shortest_first, run_upload_pool,
+                         shortest_first_windows)
+
+class FakeContext:
+    """Just enough of ClientContext for the pool: clone() and folder lookups."""
+
+    def __init__(self, base_url='https://site', ensured=None):
+        self.base_url = base_url
+        self.ensured = ensured if ensured is not None else []
+        self.web = SimpleNamespace(get_folder_by_server_relative_url=lambda url: SimpleNamespace(url=url),
+                                   ensure_folder_path=self._ensure_folder_path)
+
+    def _ensure_folder_path(self, url):
+        self.ensured.append(url)
+        return SimpleNamespace(execute_query=lambda: None)
+
+    def clone(self, base_url):
+        return FakeContext(base_url, self.ensured)
+
+def test_config_values():
+    assert get_max_workers({}) == upload_pool.DEFAULT_MAX_WORKERS
+    assert get_max_workers({'MaxConcurrentUploads': '0'}) == 1
+    assert get_max_workers({'MaxConcurrentUploads': 'many'}) == upload_pool.DEFAULT_MAX_WORKERS
+    assert get_large_file_threshold_mb({'LargeFileThresholdMB': '1.5'}) == 1.5
+
+def test_order_shortest_first(tmp_path):
+    (tmp_path / 'big').write_bytes(b'x' * 30)
+    (tmp_path / 'small').write_bytes(b'x')
+    pending, missing = order_shortest_first(str(tmp_path), ['big', 'gone', 'small'])
+    assert [(name, size) for name, _, size in pending] == [('small', 1), ('big', 30)]
+    assert missing == ['gone']
+
+def test_shortest_first_windows_sorts_each_window_lazily():
+    consumed = []
+
+    def scan():
+        for size in (5, 3, 4, 1, 2):
+            consumed.append(size)
+            yield (f"f{size}", f"/src/f{size}", size)
+
+    ordered = shortest_first_windows(scan(), window=3)
+    assert next(ordered)[2] == 3
+    assert consumed == [5, 3, 4]
+    assert [item[2] for item in ordered] == [4, 5, 1, 2]
+
+def test_run_upload_pool_reports_every_file_on_the_calling_thread():
+    ctx = FakeContext()
+    uploaded = []
+    results = []
+    caller = threading.current_thread()
+
+    def upload_one(worker_ctx, folder, full_path, file_name, file_size):
+        assert worker_ctx is not ctx
+        if file_name == 'bad':
+            raise OSError('bad file')
+        uploaded.append((folder.url, file_name, file_size))
+
+    def on_result(file_name, error):
+        assert threading.current_thread() is caller
+        results.append((file_name, error and str(error)))
+
+    pending = [('a', '/src/a', 1), ('sub/b', '/src/sub/b', 2), ('bad', '/src/bad', 3)]
+    run_upload_pool(ctx, '/docs', iter(pending), upload_one, 2, on_result)
+
+    assert sorted(results) == [('a', None), ('bad', 'bad file'), ('sub/b', None)]
+    assert sorted(uploaded) == [('/docs', 'a', 1), ('/docs/sub', 'b', 2)]
+    assert ctx.ensured == ['/docs/sub']
+
+def test_run_upload_pool_consumes_the_scan_lazily():
+    started = threading.Event()
+    release = threading.Event()
+    consumed = []
+
+    def scan():
+        for i in range(20):
+            consumed.append(i)
+            yield (f"f{i}", f"/src/f{i}", i)
+
+    def upload_one(worker_ctx, folder, full_path, file_name, file_size):
+        started.set()
+        release.wait(5)
+
+    worker = threading.Thread(target=run_upload_pool,
+                              args=(FakeContext(), '/docs', scan(), upload_one, 2, lambda *_: None))
+    worker.start()
+    started.wait(5)
+    # At most max_workers * 2 files are queued ahead of the workers
+    assert len(consumed) <= 5
+    release.set()
+    worker.join(5)
+    assert len(consumed) == 20
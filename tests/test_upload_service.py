@@ -0,0 +1,60 @@
+import json
+import os
+import socket
+import sys
+
+import pytest
+
+import upload_service
+from upload_service import UploadService, get_batch_seconds, get_service_file_path, hand_off
+
+@pytest.fixture
+def service_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_service, 'get_service_dir', lambda: str(tmp_path / 'services'))
+    return tmp_path / 'services'
+
+@pytest.fixture
+def service(service_dir):
+    service = UploadService('upload', batch_seconds=0.1)
+    assert service.start()
+    yield service
+    service.stop()
+
+def test_config_values():
+    assert get_batch_seconds({}) == 1.0
+    assert get_batch_seconds({'ServiceBatchSeconds': 'soon'}) == 1.0
+
+def test_service_file_is_per_user_and_per_install(monkeypatch, tmp_path):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    monkeypatch.setenv('LOCALAPPDATA', str(tmp_path))
+    monkeypatch.setattr(sys, 'argv', [str(tmp_path / 'one' / 'upload.exe')])
+    first = get_service_file_path('upload')
+    monkeypatch.setattr(sys, 'argv', [str(tmp_path / 'two' / 'upload.exe')])
+    second = get_service_file_path('upload')
+
+    assert first != second
+    assert os.path.dirname(first) == str(tmp_path / 'sharepoint_upload')
+
+def test_hand_off_queues_paths_once_they_go_quiet(service, tmp_path):
+    assert hand_off('upload', [str(tmp_path / 'a.dat'), str(tmp_path / 'b.dat')])
+    assert hand_off('upload', [str(tmp_path / 'a.dat')])
+
+    assert sorted(os.path.basename(path) for path in service.take_batch()) == ['a.dat', 'b.dat']
+
+@pytest.mark.skipif(os.name == 'nt', reason="POSIX file modes")
+def test_service_file_is_private(service):
+    assert os.stat(service.service_file_path).st_mode & 0o077 == 0
+
+def test_only_one_service_runs_and_a_bad_token_is_refused(service, service_dir):
+    assert not UploadService('upload').start()
+
+    with open(service.service_file_path) as f:
+        port = json.load(f)['port']
+    with socket.create_connection(('127.0.0.1', port), timeout=2) as sock:
+        sock.sendall(json.dumps({'token': 'guess', 'paths': ['/etc/passwd']}).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as reply:
+            assert json.loads(reply.readline()) == {'error': 'bad token'}
+    assert service.add([]) == 0
+
+def test_no_service_means_no_hand_off(service_dir):
+    assert not hand_off('upload', ['a.dat'])
@@ -0,0 +1,185 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from transfer_metrics import get_metrics
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+def parse_retry_after(value):
+    """Convert a Retry-After header (seconds or HTTP date) to seconds, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # Only HTTP-date values need the email package, which is slow to import
+    from email.utils import parsedate_to_datetime
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def get_throttle_details(error):
+    """Return (status_code, retry_after_seconds) if error is a throttling response.
+
+    office365 raises ClientRequestException carrying the requests Response;
+    anything without a 429/503 response returns (None, None).
+    """
+    response = getattr(error, 'response', None)
+    status_code = getattr(response, 'status_code', None)
+    if status_code not in THROTTLE_STATUS_CODES:
+        return None, None
+    headers = getattr(response, 'headers', None) or {}
+    return status_code, parse_retry_after(headers.get('Retry-After'))
+
+class ThrottleController:
+    """Backoff state shared by every upload thread in the process.
+
+    Requests go out at full speed until SharePoint answers 429 or 503. The
+    controller then pauses all callers, honouring Retry-After when present
+    and otherwise backing off exponentially with jitter. The first success
+    after a throttle resets the backoff.
+    """
+
+    def __init__(self, base_delay=1.0, max_delay=120.0, max_attempts=3, max_throttle_retries=8):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.max_throttle_retries = max_throttle_retries
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+        self._consecutive_throttles = 0
+        self._last_retry_after = None
+        self._total_throttles = 0
+        self._total_wait = 0.0
+
+    def wait(self):
+        """Block until any active backoff window has passed."""
+        with self._lock:
+            delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+            with self._lock:
+                self._total_wait += delay
+            get_metrics().add_time('throttle_wait', delay)
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_throttles = 0
+
+    def record_throttle(self, retry_after=None):
+        """Register a throttling response and return the delay imposed."""
+        with self._lock:
+            self._consecutive_throttles += 1
+            self._total_throttles += 1
+            self._last_retry_after = retry_after
+            if retry_after is not None:
+                delay = min(retry_after, self.max_delay)
+            else:
+                delay = self.backoff_delay(self._consecutive_throttles)
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+            return delay
+
+    def backoff_delay(self, attempt):
+        """Exponential backoff for the given attempt (1-based), with jitter on the upper half."""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def state(self):
+        """Snapshot of the controller for logging."""
+        with self._lock:
+            return {
+                'throttled': self._resume_at > time.monotonic(),
+                'wait_remaining': max(0.0, self._resume_at - time.monotonic()),
+                'consecutive_throttles': self._consecutive_throttles,
+                'last_retry_after': self._last_retry_after,
+                'total_throttles': self._total_throttles,
+                'total_wait_seconds': self._total_wait,
+            }
+
+    def describe(self):
+        state = self.state()
+        return (f"consecutive={state['consecutive_throttles']} total={state['total_throttles']} "
+                f"waited={state['total_wait_seconds']:.1f}s")
+
+    def _retry_after_failure(self, error, counts, description):
+        """Decide whether a failed attempt is retried; counts is [attempts, throttle_retries].
+
+        Returns None to give up, or how long the caller alone sleeps before
+        retrying. A throttle returns 0, as its backoff is shared through wait().
+        """
+        status_code, retry_after = get_throttle_details(error)
+        if status_code and counts[1] < self.max_throttle_retries:
+            counts[1] += 1
+            get_metrics().increment('throttle_retries')
+            delay = self.record_throttle(retry_after)
+            print(f"Throttled (HTTP {status_code}) on {description}, backing off {delay:.1f}s ({self.describe()})")
+            return 0.0
+        counts[0] += 1
+        if counts[0] >= self.max_attempts:
+            return None
+        get_metrics().increment('retries')
+        delay = self.backoff_delay(counts[0])
+        print(f"Retrying {description} in {delay:.1f}s... (Attempt {counts[0]})")
+        return delay
+
+    def call(self, operation, description="request"):
+        """Run operation(), retrying throttled responses and transient errors.
+
+        Throttling responses are retried up to max_throttle_retries times after
+        the shared backoff; any other error is retried up to max_attempts,
+        after an exponential backoff with jitter of the calling thread only.
+        """
+        counts = [0, 0]
+        while True:
+            self.wait()
+            try:
+                result = operation()
+            except Exception as e:
+                retry_delay = self._retry_after_failure(e, counts, description)
+                if retry_delay is None:
+                    raise
+                time.sleep(retry_delay)
+                continue
+            self.record_success()
+            return result
+
+    async def call_async(self, operation, description="request"):
+        """call() for the asyncio engine: operation() returns an awaitable.
+
+        Same retry policy and shared backoff state, but waiting out a
+        backoff suspends only the calling task, not the event loop thread.
+        """
+        import asyncio
+
+        counts = [0, 0]
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                with self._lock:
+                    self._total_wait += delay
+                get_metrics().add_time('throttle_wait', delay)
+            try:
+                result = await operation()
+            except Exception as e:
+                retry_delay = self._retry_after_failure(e, counts, description)
+                if retry_delay is None:
+                    raise
+                await asyncio.sleep(retry_delay)
+                continue
+            self.record_success()
+            return result
+
+_controller = ThrottleController()
+
+def get_throttle_controller():
+    """Return the process-wide controller shared by all upload paths."""
+    return _controller
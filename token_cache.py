@@ -0,0 +1,129 @@
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+from transfer_metrics import get_metrics
+
+# Tokens are handed out (and refreshed) this long before they actually expire
+TOKEN_REFRESH_MARGIN = 300
+
+_cache_lock = threading.Lock()
+
+def is_token_cache_enabled(config_values):
+    """TokenCache=true keeps access tokens on disk between runs; off by default."""
+    return (config_values.get('TokenCache') or 'false').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def get_token_cache_path(config_values):
+    cache_path = config_values.get('TokenCachePath')
+    if cache_path:
+        return cache_path
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    return os.path.join(script_dir, "token_cache.bin")
+
+def _get_fernet(client_credentials):
+    # cryptography ships with office365's msal dependency; only needed once a token is cached
+    from cryptography.fernet import Fernet
+
+    secret = f"{client_credentials.client_id}:{client_credentials.client_secret}".encode('utf-8')
+    return Fernet(base64.urlsafe_b64encode(hashlib.sha256(secret).digest()))
+
+class TokenCache:
+    """Encrypted on-disk cache of app-only access tokens.
+
+    Entries are keyed by SharePoint host and client id and encrypted with a
+    key derived from the client secret. Anyone who can read config.txt can
+    therefore read the cache too, so it is only used with TokenCache=true
+    and is created readable by its owner only (where the OS supports it).
+    A token is only returned while more than TOKEN_REFRESH_MARGIN seconds
+    of its lifetime remain.
+    """
+
+    def __init__(self, cache_path, client_credentials):
+        self.cache_path = cache_path
+        self.client_credentials = client_credentials
+
+    def _load(self):
+        try:
+            with open(self.cache_path, 'rb') as f:
+                encrypted = f.read()
+        except OSError:
+            return {}
+        try:
+            return json.loads(_get_fernet(self.client_credentials).decrypt(encrypted))
+        except Exception:
+            # Written with other credentials, or corrupt: start over
+            return {}
+
+    def _save(self, entries):
+        encrypted = _get_fernet(self.client_credentials).encrypt(json.dumps(entries).encode('utf-8'))
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            f.write(encrypted)
+        os.replace(tmp_path, self.cache_path)
+
+    def _key(self, site_url):
+        return f"{urlparse(site_url).hostname}|{self.client_credentials.client_id}"
+
+    def get(self, site_url):
+        """Return (access_token, token_type, expires_at) or None if missing or near expiry."""
+        with _cache_lock:
+            entry = self._load().get(self._key(site_url))
+        if not entry or entry['expires_at'] - time.time() <= TOKEN_REFRESH_MARGIN:
+            return None
+        return entry['access_token'], entry['token_type'], entry['expires_at']
+
+    def put(self, site_url, access_token, token_type, expires_at):
+        with _cache_lock:
+            entries = self._load()
+            now = time.time()
+            entries = {key: entry for key, entry in entries.items() if entry['expires_at'] > now}
+            entries[self._key(site_url)] = {
+                'access_token': access_token,
+                'token_type': token_type,
+                'expires_at': expires_at,
+            }
+            try:
+                self._save(entries)
+            except OSError as e:
+                print(f"Could not write token cache: {str(e)}")
+
+def acquire_app_only_token(site_url, client_credentials):
+    """Run the ACS client-credentials exchange; returns (access_token, token_type, expires_at)."""
+    from office365.runtime.auth.providers.acs_token_provider import ACSTokenProvider
+
+    token = ACSTokenProvider(site_url, client_credentials).get_app_only_access_token()
+    expires_in = int(getattr(token, 'expiresIn', 3600))
+    return token.accessToken, token.tokenType or 'Bearer', time.time() + expires_in
+
+def cached_token_provider(site_url, client_credentials, cache_path):
+    """Build a token callback for ClientContext.with_access_token.
+
+    The callback serves a cached token when one is still fresh and acquires
+    (and caches) a new one otherwise. The lifetime it reports is cut short by
+    TOKEN_REFRESH_MARGIN, so long runs fetch a new token before the current
+    one expires.
+    """
+    cache = TokenCache(cache_path, client_credentials)
+
+    def get_token():
+        metrics = get_metrics()
+        with metrics.timed('auth'):
+            cached = cache.get(site_url)
+            if cached:
+                metrics.increment('token_cache_hits')
+                access_token, token_type, expires_at = cached
+            else:
+                metrics.increment('token_acquisitions')
+                access_token, token_type, expires_at = acquire_app_only_token(site_url, client_credentials)
+                cache.put(site_url, access_token, token_type, expires_at)
+        return {
+            'access_token': access_token,
+            'token_type': token_type,
+            'expires_in': max(0, int(expires_at - time.time() - TOKEN_REFRESH_MARGIN)),
+        }
+
+    return get_token
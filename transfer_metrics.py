@@ -0,0 +1,232 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from run_trace import get_trace
+
+PROMETHEUS_PREFIX = 'sharepoint_upload'
+# Latency samples kept for percentiles and per-file detail; totals are exact regardless
+MAX_SAMPLES = 100000
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def _describe(values):
+    """count/total/min/max/p50/p95 of a list of durations."""
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'total': round(sum(ordered), 6),
+        'min': round(ordered[0], 6) if ordered else 0.0,
+        'max': round(ordered[-1], 6) if ordered else 0.0,
+        'p50': round(_percentile(ordered, 0.5), 6),
+        'p95': round(_percentile(ordered, 0.95), 6),
+    }
+
+class TransferMetrics:
+    """Counters and timings for one run, shared by every upload thread.
+
+    Files and chunks are recorded with their size and duration, named
+    phases (auth, scan, disk_read, verification, log_write, ...) accumulate
+    wall time, and plain counters track retries and throttling. Each of
+    these is also passed to the run trace, which ignores it unless tracing
+    is on. summary() turns it all
+    into a dict for the JSON summary and the Prometheus textfile. Only the
+    last MAX_SAMPLES files and chunks are kept for latency percentiles, so
+    a long-running watch does not grow without bound.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self._files = deque(maxlen=MAX_SAMPLES)
+        self._file_totals = {'succeeded': 0, 'failed': 0, 'bytes': 0}
+        self._chunk_seconds = deque(maxlen=MAX_SAMPLES)
+        self._chunk_bytes = 0
+        self._chunk_total_seconds = 0.0
+        self._counters = {}
+        self._phases = {}
+
+    def record_file(self, file_name, file_size, seconds, ok=True):
+        get_trace().complete(file_name, 'file', time.monotonic() - seconds, seconds, bytes=file_size, ok=ok)
+        with self._lock:
+            self._files.append((file_name, file_size, seconds, ok))
+            if ok:
+                self._file_totals['succeeded'] += 1
+                self._file_totals['bytes'] += file_size
+            else:
+                self._file_totals['failed'] += 1
+
+    @contextmanager
+    def track_file(self, file_name, file_size):
+        """Time the enclosed upload of one file; an exception marks it failed."""
+        started_at = time.monotonic()
+        try:
+            with get_trace().profiled():
+                yield
+        except Exception:
+            self.record_file(file_name, file_size, time.monotonic() - started_at, ok=False)
+            raise
+        self.record_file(file_name, file_size, time.monotonic() - started_at)
+
+    def record_chunk(self, chunk_size, seconds):
+        get_trace().complete('chunk', 'chunk', time.monotonic() - seconds, seconds, bytes=chunk_size)
+        with self._lock:
+            self._chunk_seconds.append(seconds)
+            self._chunk_bytes += chunk_size
+            self._chunk_total_seconds += seconds
+
+    def increment(self, name, amount=1):
+        get_trace().instant(name, 'event')
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def add_time(self, phase, seconds, started_at=None):
+        get_trace().complete(phase, 'phase', time.monotonic() - seconds if started_at is None else started_at, seconds)
+        with self._lock:
+            self._phases[phase] = self._phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def timed(self, phase):
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.monotonic() - started_at, started_at)
+
+    def summary(self):
+        with self._lock:
+            files = list(self._files)
+            file_totals = dict(self._file_totals)
+            chunk_seconds = list(self._chunk_seconds)
+            chunk_bytes = self._chunk_bytes
+            chunk_total_seconds = self._chunk_total_seconds
+            counters = dict(self._counters)
+            phases = dict(self._phases)
+        elapsed = time.monotonic() - self._started
+        uploaded_bytes = file_totals['bytes']
+        return {
+            'started_at': self.started_at,
+            'duration_seconds': round(elapsed, 3),
+            'files': {
+                'succeeded': file_totals['succeeded'],
+                'failed': file_totals['failed'],
+                'bytes': uploaded_bytes,
+                'bytes_per_second': round(uploaded_bytes / elapsed, 1) if elapsed else 0.0,
+                'seconds': _describe([seconds for _, _, seconds, _ in files]),
+            },
+            'chunks': {
+                'bytes': chunk_bytes,
+                'bytes_per_second': round(chunk_bytes / chunk_total_seconds, 1) if chunk_total_seconds else 0.0,
+                'seconds': _describe(chunk_seconds),
+            },
+            'counters': counters,
+            'phases': {phase: round(seconds, 6) for phase, seconds in phases.items()},
+            'per_file': [
+                {
+                    'file': file_name,
+                    'bytes': size,
+                    'seconds': round(seconds, 6),
+                    'bytes_per_second': round(size / seconds, 1) if seconds else 0.0,
+                    'ok': ok,
+                }
+                for file_name, size, seconds, ok in files
+            ],
+        }
+
+def format_prometheus(summary, job):
+    """Render a summary in the Prometheus text exposition format."""
+    labels = f'job="{job}"'
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+        for extra, value in samples:
+            label_text = labels + (f",{extra}" if extra else '')
+            lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}")
+
+    def latency(name, help_text, stats):
+        metric(name, 'summary', help_text, [('quantile="0.5"', stats['p50']), ('quantile="0.95"', stats['p95'])])
+        lines.append(f"{PROMETHEUS_PREFIX}_{name}_sum{{{labels}}} {stats['total']}")
+        lines.append(f"{PROMETHEUS_PREFIX}_{name}_count{{{labels}}} {stats['count']}")
+
+    files = summary['files']
+    metric('last_run_timestamp_seconds', 'gauge', "Start time of the last run.", [('', summary['started_at'])])
+    metric('run_duration_seconds', 'gauge', "Wall time of the last run.", [('', summary['duration_seconds'])])
+    metric('files', 'gauge', "Files uploaded in the last run by outcome.",
+           [('status="success"', files['succeeded']), ('status="failed"', files['failed'])])
+    metric('bytes', 'gauge', "Bytes uploaded in the last run.", [('', files['bytes'])])
+    metric('throughput_bytes_per_second', 'gauge', "Uploaded bytes over run wall time.",
+           [('', files['bytes_per_second'])])
+    metric('chunk_throughput_bytes_per_second', 'gauge', "Chunk bytes over time spent sending chunks.",
+           [('', summary['chunks']['bytes_per_second'])])
+    latency('file_seconds', "Per-file upload latency.", files['seconds'])
+    latency('chunk_seconds', "Per-chunk upload latency.", summary['chunks']['seconds'])
+    if summary['counters']:
+        metric('events', 'gauge', "Retries, throttling responses and other counted events in the last run.",
+               [(f'event="{name}"', value) for name, value in sorted(summary['counters'].items())])
+    if summary['phases']:
+        metric('phase_seconds', 'gauge', "Time spent per phase (auth, verification, log writes, ...).",
+               [(f'phase="{name}"', value) for name, value in sorted(summary['phases'].items())])
+    return "\n".join(lines) + "\n"
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def get_metrics_path(config_values):
+    """JSON summary path (MetricsPath); nothing is written unless it is set.
+
+    MetricsPath=true writes run_metrics.json next to the script.
+    """
+    metrics_path = (config_values.get('MetricsPath') or '').strip()
+    if metrics_path.lower() in ('', 'none', '0', 'false', 'no', 'off'):
+        return None
+    if metrics_path.lower() in ('1', 'true', 'yes', 'on'):
+        script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+        return os.path.join(script_dir, "run_metrics.json")
+    return metrics_path
+
+def write_run_metrics(config_values, metrics=None):
+    """Write the JSON summary (with MetricsPath) and a Prometheus textfile (with MetricsTextfilePath).
+
+    The textfile is meant for node_exporter's textfile collector, so point
+    MetricsTextfilePath at a *.prom file in its directory. When tracing is
+    on, the trace and profile are written too and the summary carries
+    their run_id.
+    """
+    metrics = metrics or get_metrics()
+    summary = metrics.summary()
+    trace = get_trace()
+    if trace.enabled:
+        summary['run_id'] = trace.run_id
+        trace_path = trace.write()
+        if trace_path:
+            print(f"Run trace written to {trace_path}")
+    job = os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'upload'
+    json_path = get_metrics_path(config_values)
+    textfile_path = config_values.get('MetricsTextfilePath')
+    try:
+        if json_path:
+            _write_atomic(json_path, json.dumps(dict(summary, job=job), indent=2))
+        if textfile_path:
+            _write_atomic(textfile_path, format_prometheus(summary, job))
+    except OSError as e:
+        print(f"Could not write run metrics: {str(e)}")
+    return summary
+
+_metrics = TransferMetrics()
+
+def get_metrics():
+    """Return the process-wide metrics shared by all upload paths."""
+    return _metrics
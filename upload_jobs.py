@@ -0,0 +1,176 @@
+import os
+import sys
+from functools import partial
+from headless import add_file, finish, new_summary, parse_args, show_popup
+from job_scheduler import JobScheduler, UploadJob, read_jobs_file
+from run_log import close_run_logs, open_run_log
+from transfer_metrics import write_run_metrics
+from run_trace import configure_tracing
+from remote_verify import is_verification_enabled, reconcile_uploads
+from sync_manifest import open_sync_manifest
+from throttling import get_throttle_controller
+from upload_pool import get_large_file_threshold_mb, get_max_workers, shortest_first_windows
+from source_scan import get_source_filter, is_recursive, scan_source_files
+from upload_run import get_sharepoint_context_using_app
+from sharepoint_upload import upload_single_file
+from content_hash import pop_hash
+
+def get_jobs_file_path(file_path=None):
+    """jobs.txt next to the executable, unless a path is given on the command line."""
+    if file_path:
+        return file_path
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    return os.path.join(script_dir, "jobs.txt")
+
+class JobRun:
+    """Counters, manifest and log of one job while the scheduler runs it."""
+
+    def __init__(self, job, summary):
+        self.job = job
+        self.summary = summary
+        self.source_folder_path = job.config_values.get('SourceFolderPath')
+        self.manifest = open_sync_manifest(job.config_values)
+        self.run_log = open_run_log(job.config_values)
+        self.success_count = 0
+        self.failure_count = 0
+        self.skipped_files = []
+        self.file_sizes = {}
+        self.file_entries = {}
+
+    def pending_files(self):
+        """The job's lazy scan, sized and filtered like a single-job run."""
+        config_values = self.job.config_values
+        source_filter = get_source_filter(config_values, config_values.get('FileName'))
+        candidates = scan_source_files(self.source_folder_path, source_filter, is_recursive(config_values),
+                                       lambda file_name: self.record_result(file_name, FileNotFoundError(file_name)))
+        pending_files = shortest_first_windows(candidates)
+        if self.manifest:
+            pending_files = self.manifest.iter_changed(pending_files, self.skipped_files)
+        for item in pending_files:
+            self.file_sizes[item[0]] = item[2]
+            yield item
+
+    def record_result(self, file_name, error):
+        hashes = pop_hash(os.path.join(self.source_folder_path, file_name))
+        if error is None:
+            self.success_count += 1
+            status = 'Successful'
+            if self.manifest:
+                self.manifest.record(os.path.join(self.source_folder_path, file_name), hashes)
+        else:
+            print(f"[{self.job.name}] Failed to upload {file_name}: {str(error)}")
+            self.failure_count += 1
+            status = 'Failed'
+        entry = add_file(self.summary, file_name, status, None if error is None else str(error))
+        entry['job'] = self.job.name
+        entry.update(hashes)
+        self.file_entries[file_name] = entry
+        if self.run_log:
+            self.run_log.append(file_name, status, job=self.job.name, **hashes)
+
+    def verify(self):
+        uploaded = [entry['file'] for entry in self.file_entries.values() if entry['status'] == 'Successful']
+        if not uploaded or not is_verification_enabled(self.job.config_values):
+            return
+        expected_sizes = {file_name: self.file_sizes[file_name] for file_name in uploaded}
+        try:
+            problems = reconcile_uploads(self.job.ctx, self.job.target_folder_url, expected_sizes)
+        except Exception as e:
+            print(f"[{self.job.name}] Bulk verification skipped: {str(e)}")
+            return
+        for file_name, reason in problems.items():
+            print(f"[{self.job.name}] Verification failed for {file_name}: {reason}")
+            self.success_count -= 1
+            self.failure_count += 1
+            if self.manifest:
+                self.manifest.forget(os.path.join(self.source_folder_path, file_name))
+            self.file_entries[file_name].update(status='Verification Failed', reason=reason)
+            if self.run_log:
+                self.run_log.append(file_name, 'Verification Failed', job=self.job.name)
+
+def upload_jobs(file_path=None):
+    """Run every job of a multi-job config in this one process.
+
+    Keys before the first [Job Name] section are shared by all jobs (Client
+    Id, Client Secret, MaxConcurrentUploads, ...). Each section names its own
+    SourceFolderPath, FileName and DestinationFolderURL, and may override
+    DestinationSiteURL or any other key, and set Priority and Deadline.
+    Jobs on the same site share one signed-in context, and every file of
+    every job draws from the one MaxConcurrentUploads budget.
+    """
+    jobs_file_path = get_jobs_file_path(file_path)
+    summary = new_summary()
+    summary['jobs'] = {}
+    if not os.path.exists(jobs_file_path):
+        summary['error'] = f"Jobs file not found at {jobs_file_path}"
+        print(summary['error'])
+        show_popup("Error", summary['error'])
+        return summary
+
+    shared_values, sections = read_jobs_file(jobs_file_path)
+    configure_tracing(shared_values)
+    if not sections:
+        summary['error'] = f"No [Job] sections in {jobs_file_path}"
+        print(summary['error'])
+        show_popup("Error", summary['error'])
+        return summary
+
+    contexts = {}
+    runs = []
+    try:
+        for job_name, job_values in sections:
+            job = UploadJob(job_name, dict(shared_values, **job_values))
+            site_key = (job.config_values.get('DestinationSiteURL'), job.config_values.get('Client Id'))
+            if site_key not in contexts:
+                contexts[site_key] = get_sharepoint_context_using_app(job.config_values)
+            job.ctx = contexts[site_key]
+            run = JobRun(job, summary)
+            job.pending_files = run.pending_files()
+            job.upload_one = partial(upload_single_file, config_values=job.config_values)
+            job.on_result = run.record_result
+            runs.append(run)
+
+        max_workers = get_max_workers(shared_values)
+        large_file_size = get_large_file_threshold_mb(shared_values) * 1024 * 1024
+        print(f"Running {len(runs)} job(s) on {len(contexts)} site context(s) with {max_workers} worker(s)")
+        JobScheduler([run.job for run in runs], max_workers, large_file_size).run()
+        print(f"Throttling: {get_throttle_controller().describe()}")
+
+        lines = []
+        for run in runs:
+            run.verify()
+            if run.manifest:
+                run.manifest.save()
+            job = run.job
+            if job.is_late:
+                print(f"Job {job.name} finished after its deadline")
+            summary['jobs'][job.name] = {
+                'success': run.success_count,
+                'failed': run.failure_count,
+                'skipped': len(run.skipped_files),
+                'late': job.is_late,
+            }
+            lines.append(f"{job.name}: {run.success_count} ok, {run.failure_count} failed, "
+                         f"{len(run.skipped_files)} unchanged" + (" (late)" if job.is_late else ""))
+        close_run_logs()
+        write_run_metrics(shared_values)
+
+        summary.update(success=sum(run.success_count for run in runs),
+                       failed=sum(run.failure_count for run in runs),
+                       skipped=sum(len(run.skipped_files) for run in runs))
+        show_popup("Upload Summary", "Jobs complete\n\n" + "\n".join(lines))
+        return summary
+
+    except Exception as e:
+        error_msg = f"Critical error: {str(e)}"
+        print(error_msg)
+        close_run_logs()
+        write_run_metrics(shared_values)
+        show_popup("Error", error_msg)
+        summary.update(success=sum(run.success_count for run in runs),
+                       failed=sum(run.failure_count for run in runs), error=error_msg)
+        return summary
+
+if __name__ == "__main__":
+    args = parse_args("Run every job in jobs.txt (or the given jobs file) in one process.")
+    finish(upload_jobs(args.file_path))
@@ -0,0 +1,276 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+DEFAULT_SESSION_MAX_AGE_HOURS = 24
+# A resume asks the server for the committed offset, so the journal's copy may lag behind
+DEFAULT_SAVE_INTERVAL_SECONDS = 30
+
+# Shared by every UploadJournal so worker threads never interleave rewrites
+_journal_lock = threading.Lock()
+
+def get_journal_path(config_values):
+    journal_path = config_values.get('UploadJournalPath') if config_values else None
+    if journal_path:
+        return journal_path
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    return os.path.join(script_dir, "upload_journal.json")
+
+def get_file_fingerprint(file_path):
+    """Identify a source file's content version by size and modification time."""
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def get_staging_url(file_url, upload_id):
+    """Where a session on file_url writes until it is finished: a sibling named after the session.
+
+    An existing file at file_url is left alone until the whole new version
+    has been uploaded, and a failed session never leaves it truncated.
+    """
+    return f"{file_url}.{upload_id[:8]}.uploading"
+
+def queue_move_over(file, file_url):
+    """Queue a move of file onto file_url, replacing what is there (run with execute_query)."""
+    from office365.runtime.queries.service_operation import ServiceOperationQuery
+
+    # flags=1 is MoveOperations.Overwrite
+    file.context.add_query(ServiceOperationQuery(file, "moveto", {"newurl": file_url, "flags": 1}))
+
+def get_committed_offset(ctx, file_url, upload_id):
+    """Ask SharePoint how many bytes of an upload session it has committed.
+
+    Returns None when the session no longer exists or cannot be queried, in
+    which case the caller should start a new session.
+    """
+    try:
+        status = ctx.web.get_file_by_server_relative_url(get_staging_url(file_url, upload_id)).get_upload_status(upload_id)
+        ctx.execute_query()
+    except Exception as e:
+        print(f"Upload session {upload_id} is not resumable: {str(e)}")
+        return None
+    # ExpectedContentRange looks like "10485760-" (next byte the server expects)
+    match = re.search(r'\d+', str(status.expected_content_range or ''))
+    return int(match.group(0)) if match else None
+
+class ResumedUploadSession:
+    """Drive an existing upload session by id with the same calls as a new one.
+
+    The session writes to its staging file (get_staging_url); finishing it
+    moves the staging file over file_url in the same execute_query.
+    """
+
+    def __init__(self, ctx, file_url, upload_id):
+        self.upload_id = upload_id
+        self.file_url = file_url
+        self._file = ctx.web.get_file_by_server_relative_url(get_staging_url(file_url, upload_id))
+        self._started = True
+
+    def upload_chunk(self, offset, chunk):
+        return self._file.continue_upload(self.upload_id, offset, chunk)
+
+    def finish_upload(self, offset, chunk):
+        uploaded_file = self._file.finish_upload(self.upload_id, offset, chunk)
+        queue_move_over(self._file, self.file_url)
+        return uploaded_file
+
+    def delete_object(self):
+        """Cancel the session and remove its staging file; file_url is never touched."""
+        if self._started:
+            self._file.cancel_upload(self.upload_id)
+        return self._file.delete_object()
+
+class NewUploadSession(ResumedUploadSession):
+    """Session on the staging file that create_upload_session has just added empty.
+
+    The first chunk starts the session with StartUpload. A file that fits
+    in one chunk is added to the folder with its content instead, since a
+    session cannot be started and finished by the same fragment, and the
+    staging file is removed.
+    """
+
+    def __init__(self, ctx, file_url, folder, file_name, upload_id=None):
+        super().__init__(ctx, file_url, upload_id or str(uuid.uuid4()))
+        self._folder = folder
+        self._file_name = file_name
+        self._started = False
+
+    def upload_chunk(self, offset, chunk):
+        if offset == 0:
+            self._started = True
+            return self._file.start_upload(self.upload_id, chunk)
+        return super().upload_chunk(offset, chunk)
+
+    def finish_upload(self, offset, chunk):
+        if offset == 0:
+            uploaded_file = self._folder.files.add(self._file_name, chunk, True)
+            self._file.delete_object()
+            return uploaded_file
+        return super().finish_upload(offset, chunk)
+
+def create_upload_session(ctx, folder, file_url, file_name):
+    """Add an empty staging file for file_url to folder and return a NewUploadSession on it."""
+    upload_id = str(uuid.uuid4())
+    staging_name = get_staging_url(file_url, upload_id).rsplit('/', 1)[1]
+    folder.files.add(staging_name, b'', True).execute_query()
+    return NewUploadSession(ctx, file_url, folder, file_name, upload_id)
+
+class UploadJournal:
+    """Local record of in-progress upload sessions so a later run can resume them.
+
+    Each entry is keyed by destination and source path and stores the session
+    id, the source fingerprint, the last offset the server confirmed and the
+    chunk size in use. The journal is rewritten atomically when a session
+    starts or ends, and at most every save_interval_seconds per session
+    while its chunks are confirmed.
+    """
+
+    def __init__(self, journal_path, max_age_hours=DEFAULT_SESSION_MAX_AGE_HOURS,
+                 save_interval_seconds=DEFAULT_SAVE_INTERVAL_SECONDS):
+        self.journal_path = journal_path
+        self.max_age_seconds = max_age_hours * 3600
+        self.save_interval_seconds = save_interval_seconds
+        self._lock = _journal_lock
+        self._saved_at = {}
+
+    @staticmethod
+    def make_key(site_url, file_url, file_path):
+        return f"{site_url}|{file_url}|{os.path.abspath(file_path)}"
+
+    def _load(self):
+        try:
+            with open(self.journal_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        tmp_path = f"{self.journal_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp_path, self.journal_path)
+
+    def find(self, key, fingerprint):
+        """Return the journaled session for key if the source file is unchanged."""
+        with self._lock:
+            entry = self._load().get(key)
+        if not entry:
+            return None
+        if entry.get('fingerprint') != fingerprint:
+            print(f"Source changed since session {entry.get('upload_id')} started, not resuming")
+            return None
+        if time.time() - entry.get('updated_at', 0) > self.max_age_seconds:
+            print(f"Session {entry.get('upload_id')} is older than the session lifetime, not resuming")
+            return None
+        return entry
+
+    def start(self, key, upload_id, fingerprint, file_url, chunk_size):
+        with self._lock:
+            entries = self._load()
+            entries[key] = {
+                'upload_id': upload_id,
+                'file_url': file_url,
+                'fingerprint': fingerprint,
+                'offset': 0,
+                'chunk_size': chunk_size,
+                'created_at': time.time(),
+                'updated_at': time.time(),
+            }
+            self._save(entries)
+            self._saved_at[key] = time.monotonic()
+
+    def update(self, key, offset, chunk_size=None):
+        """Record the offset the server has confirmed for a session.
+
+        Skipped when the session was written less than save_interval_seconds
+        ago, so a large file does not rewrite the journal after every chunk.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if key in self._saved_at and now - self._saved_at[key] < self.save_interval_seconds:
+                return
+            self._saved_at[key] = now
+            entries = self._load()
+            entry = entries.get(key)
+            if entry is None:
+                return
+            entry['offset'] = offset
+            if chunk_size:
+                entry['chunk_size'] = chunk_size
+            entry['updated_at'] = time.time()
+            self._save(entries)
+
+    def remove(self, key):
+        with self._lock:
+            self._saved_at.pop(key, None)
+            entries = self._load()
+            if entries.pop(key, None) is not None:
+                self._save(entries)
+
+    def cleanup(self, ctx=None):
+        """Drop expired entries, cancelling their server sessions when ctx is given.
+
+        Returns the number of entries removed.
+        """
+        with self._lock:
+            entries = self._load()
+            expired = {
+                key: entry for key, entry in entries.items()
+                if time.time() - entry.get('updated_at', 0) > self.max_age_seconds
+            }
+            if not expired:
+                return 0
+            for key in expired:
+                del entries[key]
+            self._save(entries)
+
+        if ctx is not None:
+            for entry in expired.values():
+                try:
+                    ResumedUploadSession(ctx, entry['file_url'], entry['upload_id']).delete_object()
+                    ctx.execute_query()
+                except Exception:
+                    pass  # The server has usually expired the session already
+        print(f"Removed {len(expired)} expired upload session(s) from the journal")
+        return len(expired)
+
+def open_upload_session(ctx, journal, file_path, file_url, create_session, chunk_size):
+    """Resume the journaled session for file_path or start a new one.
+
+    create_session() is called when there is nothing to resume. Returns
+    (upload_session, start_offset, journal_key); journal_key is None when the
+    session is not journaled (no journal, or no upload id to record).
+    """
+    if journal is None:
+        return create_session(), 0, None
+
+    fingerprint = get_file_fingerprint(file_path)
+    key = UploadJournal.make_key(ctx.base_url, file_url, file_path)
+    entry = journal.find(key, fingerprint)
+    if entry:
+        offset = get_committed_offset(ctx, file_url, entry['upload_id'])
+        if offset is not None and offset < fingerprint['size']:
+            print(f"Resuming upload session {entry['upload_id']} at {offset/1024/1024:.2f}MB")
+            journal.update(key, offset)
+            return ResumedUploadSession(ctx, file_url, entry['upload_id']), offset, key
+
+    upload_session = create_session()
+    upload_id = getattr(upload_session, 'upload_id', None)
+    if not upload_id:
+        return upload_session, 0, None
+    journal.start(key, upload_id, fingerprint, file_url, chunk_size)
+    return upload_session, 0, key
+
+def open_upload_journal(config_values):
+    """Return the journal configured by UploadJournalPath/UploadSessionMaxAgeHours."""
+    max_age_hours = DEFAULT_SESSION_MAX_AGE_HOURS
+    value = config_values.get('UploadSessionMaxAgeHours') if config_values else None
+    if value:
+        try:
+            max_age_hours = float(value)
+        except ValueError:
+            print(f"Invalid UploadSessionMaxAgeHours '{value}', using {DEFAULT_SESSION_MAX_AGE_HOURS}")
+    return UploadJournal(get_journal_path(config_values), max_age_hours)
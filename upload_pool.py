@@ -0,0 +1,155 @@
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from transfer_metrics import get_metrics
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_LARGE_FILE_THRESHOLD_MB = 250
+SCAN_WINDOW = 1000
+
+_worker_state = threading.local()
+_ensured_folders = set()
+_ensured_folders_lock = threading.Lock()
+
+def get_max_workers(config_values):
+    """Read the upload concurrency from config, falling back to the default."""
+    value = config_values.get('MaxConcurrentUploads')
+    if not value:
+        return DEFAULT_MAX_WORKERS
+    try:
+        return max(1, int(value))
+    except ValueError:
+        print(f"Invalid MaxConcurrentUploads '{value}', using {DEFAULT_MAX_WORKERS}")
+        return DEFAULT_MAX_WORKERS
+
+def use_async_engine(config_values):
+    """UploadEngine=async switches from this pool to async_upload.run_async_uploads."""
+    return (config_values.get('UploadEngine') or 'threads').strip().lower() == 'async'
+
+def get_large_file_threshold_mb(config_values):
+    """Size in MB above which files are scheduled and chunked as large files (LargeFileThresholdMB)."""
+    value = config_values.get('LargeFileThresholdMB') if config_values else None
+    if not value:
+        return DEFAULT_LARGE_FILE_THRESHOLD_MB
+    try:
+        return float(value)
+    except ValueError:
+        print(f"Invalid LargeFileThresholdMB '{value}', using {DEFAULT_LARGE_FILE_THRESHOLD_MB}")
+        return DEFAULT_LARGE_FILE_THRESHOLD_MB
+
+def order_shortest_first(source_folder_path, file_names):
+    """Stat each matched file once and return them smallest first.
+
+    Returns a tuple of ([(file_name, full_path, file_size), ...], missing_names)
+    so callers can account for files that disappeared between listing and upload.
+    """
+    pending_files = []
+    missing_files = []
+    for file_name in file_names:
+        full_path = os.path.join(source_folder_path, file_name)
+        try:
+            file_size = os.path.getsize(full_path)
+        except OSError:
+            missing_files.append(file_name)
+            continue
+        pending_files.append((file_name, full_path, file_size))
+    pending_files.sort(key=lambda item: item[2])
+    return pending_files, missing_files
+
+def shortest_first_windows(pending_files, window=SCAN_WINDOW):
+    """Reorder a stream of (file_name, full_path, file_size) smallest first, window by window.
+
+    Sorting a whole scan would mean waiting for it to finish; sorting each
+    run of window files keeps most of the shortest-job-first benefit while
+    uploads start as soon as the first window has been scanned.
+    """
+    batch = []
+    for item in pending_files:
+        batch.append(item)
+        if len(batch) >= window:
+            batch.sort(key=lambda item: item[2])
+            yield from batch
+            batch = []
+    batch.sort(key=lambda item: item[2])
+    yield from batch
+
+def ensure_folder(ctx, folder_url):
+    """Create folder_url (and its parents) once per process."""
+    with _ensured_folders_lock:
+        if folder_url in _ensured_folders:
+            return
+    ctx.web.ensure_folder_path(folder_url).execute_query()
+    with _ensured_folders_lock:
+        _ensured_folders.add(folder_url)
+
+def get_worker_folder(ctx, target_folder_url):
+    """Return this thread's (context, folder) pair bound to ctx's authentication.
+
+    ClientContext keeps its pending queries on the instance, so a single context
+    cannot be executed from several threads at once. Each worker gets a clone
+    that shares the authentication context and HTTP transport of ctx.
+    """
+    cache = getattr(_worker_state, 'folders', None)
+    if cache is None:
+        cache = _worker_state.folders = {}
+    key = (id(ctx), target_folder_url)
+    if key not in cache:
+        contexts = getattr(_worker_state, 'contexts', None)
+        if contexts is None:
+            contexts = _worker_state.contexts = {}
+        worker_ctx = contexts.get(id(ctx))
+        if worker_ctx is None:
+            worker_ctx = contexts[id(ctx)] = ctx.clone(ctx.base_url)
+        cache[key] = (worker_ctx, worker_ctx.web.get_folder_by_server_relative_url(target_folder_url))
+    return cache[key]
+
+def upload_in_worker(ctx, target_folder_url, upload_one, file_name, full_path, file_size):
+    # Files found in sub-folders of the source go to the same sub-folders of the target
+    sub_folder, _, base_name = file_name.rpartition('/')
+    folder_url = f"{target_folder_url}/{sub_folder}" if sub_folder else target_folder_url
+    worker_ctx, worker_folder = get_worker_folder(ctx, folder_url)
+    if sub_folder:
+        ensure_folder(worker_ctx, folder_url)
+    with get_metrics().track_file(file_name, file_size):
+        return upload_one(worker_ctx, worker_folder, full_path, base_name, file_size)
+
+def run_upload_pool(ctx, target_folder_url, pending_files, upload_one, max_workers, on_result):
+    """Upload pending_files on a bounded worker pool.
+
+    pending_files is submitted in order, so passing the output of
+    order_shortest_first gives shortest-job-first scheduling. It may be a
+    lazy iterable: it is consumed only as workers free up, so uploads start
+    while a scan is still producing files. A file_name containing / is
+    uploaded to that sub-folder of the target, which is created if needed.
+    upload_one is called as upload_one(ctx, target_folder, full_path,
+    file_name, file_size) on a worker thread. on_result(file_name, error) is
+    called on the calling thread as each file finishes, with error set to
+    None on success, so the caller's counters and log sheet are never
+    touched concurrently.
+    """
+    def report(done):
+        for future in done:
+            file_name = futures.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                on_result(file_name, e)
+            else:
+                on_result(file_name, None)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for file_name, full_path, file_size in pending_files:
+            # Keep the queue short so a huge scan is not turned into futures all at once
+            if len(futures) >= max_workers * 2:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                report(done)
+            future = executor.submit(
+                upload_in_worker, ctx, target_folder_url, upload_one,
+                file_name, full_path, file_size
+            )
+            futures[future] = file_name
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            report(done)
@@ -0,0 +1,324 @@
+"""The upload run shared by upload.py and adjustment_upload.py.
+
+Both scripts read config.txt from their own folder and push the matching
+source files through the same pipeline; they differ only in their name
+(for the resident service) and the status written for a successful file.
+"""
+import os
+import sys
+from functools import partial
+from headless import add_file, finish, is_headless, new_summary, parse_args, show_popup
+from token_cache import cached_token_provider, get_token_cache_path, is_token_cache_enabled
+from throttling import get_throttle_controller
+from upload_journal import open_upload_journal
+from run_log import open_run_log
+from transfer_metrics import write_run_metrics
+from run_trace import configure_tracing
+from remote_verify import is_verification_enabled, reconcile_uploads
+from sync_manifest import open_sync_manifest
+from remote_index import open_remote_index
+from upload_pool import get_max_workers, run_upload_pool, shortest_first_windows, use_async_engine
+from file_bundles import open_file_bundler
+from fan_out import open_fan_out
+from content_hash import pop_hash
+from sharepoint_upload import open_batch_uploader, upload_single_file
+from source_scan import get_source_filter, is_recursive, scan_source_files
+from folder_watch import watch_and_upload
+from upload_service import hand_off, serve_uploads
+
+def read_config_file(file_path):
+    config_values = {}
+    try:
+        with open(file_path, 'r') as file:
+            lines = file.readlines()
+            for line in lines:
+                parts = line.strip().split("=")
+                if len(parts) >= 2:
+                    key = parts[0].strip()
+                    value = "=".join(parts[1:]).strip().strip('"')
+                    config_values[key] = value
+                else:
+                    print(f"Skipping malformed line: {line.strip()}")
+    except FileNotFoundError:
+        error_msg = f"Config file '{file_path}' not found."
+        print(error_msg)
+        show_popup("Error", error_msg)
+    except Exception as e:
+        error_msg = f"Error reading config file: {str(e)}"
+        print(error_msg)
+        show_popup("Error", error_msg)
+    return config_values
+
+def get_sharepoint_context_using_app(config_values):
+    # office365 is slow to import, so it is only loaded once a run actually connects
+    from office365.runtime.auth.client_credential import ClientCredential
+    from office365.sharepoint.client_context import ClientContext
+
+    sharepoint_url = config_values.get('DestinationSiteURL')
+    client_credentials = ClientCredential(
+        config_values.get('Client Id'), 
+        config_values.get('Client Secret')
+    )
+    if not is_token_cache_enabled(config_values):
+        return ClientContext(sharepoint_url).with_credentials(client_credentials)
+    # Reuse the token from earlier runs while it is fresh instead of a cold credential exchange
+    token_provider = cached_token_provider(sharepoint_url, client_credentials, get_token_cache_path(config_values))
+    ctx = ClientContext(sharepoint_url).with_access_token(token_provider)
+    return ctx
+
+def load_script_config(summary, popup=True):
+    """Read config.txt from the running script's folder (upload.exe sits next to it).
+
+    Returns None, with the error in summary, when there is no config file.
+    """
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    config_file_path = os.path.join(script_dir, "config.txt")
+    if not os.path.exists(config_file_path):
+        summary['error'] = f"ERROR: Config file not found at {config_file_path}"
+        print(summary['error'])
+        if popup:
+            show_popup("Config File Error", summary['error'])
+        return None
+    config_values = read_config_file(config_file_path)
+    configure_tracing(config_values)
+    return config_values
+
+def get_source(config_values, file_path=None):
+    """Return (source folder, file pattern): the given file, else the config.txt source."""
+    if file_path:
+        return os.path.dirname(file_path), os.path.basename(file_path)
+    return config_values.get('SourceFolderPath'), config_values.get('FileName')
+
+def upload_files_with_wildcard(file_path=None, success_status='Successful'):
+    summary = new_summary()
+    config_values = load_script_config(summary)
+    if config_values is None:
+        return summary
+    source_folder_path, wildcard_pattern = get_source(config_values, file_path)
+
+    if not source_folder_path or not os.path.isdir(source_folder_path):
+        error_msg = f"Source folder not found: {source_folder_path}"
+        print(error_msg)
+        show_popup("Error", error_msg)
+        summary['error'] = error_msg
+        return summary
+
+    ctx = get_sharepoint_context_using_app(config_values)
+    target_folder_url = config_values.get('DestinationFolderURL')
+    target_folder = ctx.web.get_folder_by_server_relative_url(target_folder_url)
+    # Extra DestinationFolderURL2, 3, ... get every file too, each read from disk once
+    fan_out = open_fan_out(config_values,
+                           ctx,
+                           lambda site_url: get_sharepoint_context_using_app(dict(config_values, DestinationSiteURL=site_url)),
+                           source_folder_path)
+
+    # Forget sessions SharePoint will already have expired
+    open_upload_journal(config_values).cleanup(ctx)
+
+    run_log = open_run_log(config_values)
+
+    print(f"Target folder URL: {target_folder_url}")
+
+    success_count = 0
+    failure_count = 0
+    processed_files = []
+    skipped_files = []
+    uploaded_files = set()
+    file_sizes = {}
+    file_entries = {}
+
+    max_workers = get_max_workers(config_values)
+    manifest = open_sync_manifest(config_values)
+    remote_index = open_remote_index(config_values)
+
+    def record_result(file_name, error):
+        nonlocal success_count, failure_count
+        hashes = pop_hash(os.path.join(source_folder_path, file_name))
+        if error is None:
+            processed_files.append(f"✓ {file_name}")
+            success_count += 1
+            status = success_status
+            uploaded_files.add(file_name)
+            if manifest:
+                manifest.record(os.path.join(source_folder_path, file_name), hashes)
+            if remote_index:
+                remote_index.record_upload(target_folder_url, file_name)
+        else:
+            print(f"Failed to upload {file_name}: {str(error)}")
+            processed_files.append(f"✗ {file_name}")
+            failure_count += 1
+            status = 'Failed'
+        entry = file_entries[file_name] = add_file(summary, file_name, status, None if error is None else str(error))
+        entry.update(hashes)
+        destinations = fan_out.pop_results(os.path.join(source_folder_path, file_name)) if fan_out else None
+        if destinations:
+            entry['destinations'] = {label: success_status if dest_error is None else 'Failed'
+                                     for label, dest_error in destinations.items()}
+        if run_log and destinations:
+            for label, destination_status in entry['destinations'].items():
+                run_log.append(file_name, destination_status, destination=label, **hashes)
+        elif run_log:
+            run_log.append(file_name, status, **hashes)
+
+    def record_verification_failure(file_name, reason):
+        nonlocal success_count, failure_count
+        print(f"Verification failed for {file_name}: {reason}")
+        processed_files[processed_files.index(f"✓ {file_name}")] = f"✗ {file_name} ({reason})"
+        success_count -= 1
+        failure_count += 1
+        if manifest:
+            manifest.forget(os.path.join(source_folder_path, file_name))
+        if remote_index:
+            remote_index.forget_upload(target_folder_url, file_name)
+        file_entries[file_name].update(status='Verification Failed', reason=reason)
+        if run_log:
+            run_log.append(file_name, 'Verification Failed')
+
+    try:
+        # The scan may run on a helper thread (asyncio engine), so these are reported after the uploads
+        missing_files = []
+
+        def track_sizes(items):
+            for item in items:
+                file_sizes[item[0]] = item[2]
+                yield item
+
+        # A lazy scan: the first files upload while the rest of the tree is still being listed
+        source_filter = get_source_filter(config_values, wildcard_pattern, single_file=bool(file_path))
+        candidates = scan_source_files(source_folder_path, source_filter, is_recursive(config_values), missing_files.append)
+        pending_files = track_sizes(shortest_first_windows(candidates))
+        if manifest:
+            pending_files = manifest.iter_changed(pending_files, skipped_files)
+        # Skip what the destination already has, asking a local index of the library instead of SharePoint
+        if remote_index and not fan_out and remote_index.refresh(ctx, target_folder_url):
+            pending_files = remote_index.iter_changed(pending_files, target_folder_url, skipped_files)
+
+        print(f"Uploading matching files with {max_workers} worker(s)")
+        upload_one = fan_out.upload_one if fan_out else partial(upload_single_file, config_values=config_values)
+        on_result = record_result
+        # Optionally pack small files into streamed zip bundles, one upload per bundle
+        bundler = open_file_bundler(config_values)
+        if bundler and fan_out:
+            print("BundleSmallFiles is not used with multiple destinations")
+            bundler = None
+        if bundler:
+            pending_files = bundler.bundle(pending_files)
+            upload_one = bundler.wrap_upload(upload_one, config_values)
+            on_result = bundler.wrap_result(record_result)
+        use_async = use_async_engine(config_values) and not (fan_out or bundler)
+        # Tiny files share multipart $batch requests, except with bundles, fan-out or asyncio
+        batcher = None if (fan_out or bundler or use_async) else open_batch_uploader(config_values, target_folder_url)
+        if batcher:
+            pending_files = batcher.batch(pending_files)
+            upload_one = batcher.wrap_upload(upload_one, config_values)
+            on_result = batcher.wrap_result(on_result)
+        if use_async:
+            # Every upload on one event loop thread over a small pool of keep-alive connections
+            from async_upload import run_async_uploads  # asyncio is slow to import
+
+            print("Using the asyncio upload engine")
+            run_async_uploads(ctx, config_values, target_folder_url, pending_files, on_result)
+        else:
+            run_upload_pool(ctx, target_folder_url, pending_files, upload_one, max_workers, on_result)
+        for file_name in missing_files:
+            record_result(file_name, FileNotFoundError(os.path.join(source_folder_path, file_name)))
+        if batcher and batcher.batch_count:
+            print(f"Sent tiny files in {batcher.batch_count} $batch request(s)")
+        if bundler and bundler.bundles:
+            print(f"Bundled small files into {len(bundler.bundles)} archive(s)")
+        if manifest or remote_index:
+            print(f"Incremental sync: {len(skipped_files)} unchanged file(s) skipped")
+        print(f"Throttling: {get_throttle_controller().describe()}")
+
+        # One paged listing of the destination instead of a lookup per file
+        if uploaded_files and is_verification_enabled(config_values):
+            print(f"Verifying {len(uploaded_files)} upload(s) against "
+                  + (f"{len(fan_out.destinations)} destinations" if fan_out else target_folder_url))
+            expected_sizes = {name: file_sizes[name] for name in uploaded_files}
+            if bundler:
+                expected_sizes = bundler.expected_sizes(expected_sizes)
+            try:
+                if fan_out:
+                    problems = fan_out.reconcile_uploads(expected_sizes)
+                else:
+                    problems = reconcile_uploads(ctx, target_folder_url, expected_sizes)
+            except Exception as e:
+                print(f"Bulk verification skipped: {str(e)}")
+                problems = {}
+            if bundler:
+                problems = bundler.expand_problems(problems)
+            for file_name, reason in problems.items():
+                record_verification_failure(file_name, reason)
+
+        if manifest:
+            manifest.save()
+        if remote_index:
+            remote_index.close()
+        if run_log:
+            run_log.close()
+        write_run_metrics(config_values)
+        
+        # Show summary
+        summary_msg = f"Upload completed!\n\nSuccess: {success_count}\nFailed: {failure_count}"
+        if skipped_files:
+            summary_msg += f"\nSkipped (unchanged): {len(skipped_files)}"
+        if processed_files:
+            summary_msg += "\n\nFiles processed:\n" + "\n".join(processed_files)
+        elif not skipped_files:
+            summary_msg = "No files matching the pattern were found to upload."
+        
+        show_popup("Upload Summary", summary_msg)
+        summary.update(success=success_count, failed=failure_count, skipped=len(skipped_files))
+        return summary
+
+    except Exception as e:
+        error_msg = f"Critical error: {str(e)}"
+        print(error_msg)
+        if run_log:
+            run_log.close()
+        write_run_metrics(config_values)
+        show_popup("Error", error_msg)
+        summary.update(success=success_count, failed=failure_count, skipped=len(skipped_files), error=error_msg)
+        return summary
+
+def watch_source_folder(file_path=None, success_status='Successful'):
+    """Keep running and upload matching files as they appear (--watch)."""
+    summary = new_summary()
+    config_values = load_script_config(summary, popup=False)
+    if config_values is None:
+        return summary
+    source_folder_path, wildcard_pattern = get_source(config_values, file_path)
+
+    # Signed in once; the cached token provider refreshes it for the life of the watch
+    ctx = get_sharepoint_context_using_app(config_values)
+    upload_one = partial(upload_single_file, config_values=config_values)
+    watch_and_upload(ctx, config_values, source_folder_path, wildcard_pattern, upload_one,
+                     success_status=success_status, single_file=bool(file_path))
+    return summary
+
+def serve_upload_requests(script_name, success_status='Successful'):
+    """Stay resident and upload the files later invocations hand over (--serve)."""
+    summary = new_summary()
+    config_values = load_script_config(summary, popup=False)
+    if config_values is None:
+        return summary
+    # Signed in once; every queued file reuses this context
+    ctx = get_sharepoint_context_using_app(config_values)
+    upload_one = partial(upload_single_file, config_values=config_values)
+    if not serve_uploads(ctx, config_values, script_name, upload_one, success_status=success_status):
+        summary['error'] = "An upload service is already running"
+    return summary
+
+def main(script_name, description, success_status='Successful'):
+    """Command line of the upload scripts: one run, --watch or --serve."""
+    args = parse_args(description, watch=True, serve=True)
+    if args.serve:
+        finish(serve_upload_requests(script_name, success_status))
+    if args.watch:
+        finish(watch_source_folder(args.file_path, success_status))
+    # A single file (e.g. from "Send to") goes to the resident service when one is running
+    if args.file_path and not is_headless() and os.path.isfile(args.file_path) \
+            and hand_off(script_name, [args.file_path]):
+        print(f"Queued {args.file_path} with the running {script_name} service")
+        finish(new_summary())
+    finish(upload_files_with_wildcard(args.file_path, success_status))
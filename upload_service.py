@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import secrets
+import socket
+import sys
+import threading
+import time
+
+from content_hash import pop_hash
+from remote_verify import is_verification_enabled, reconcile_uploads
+from run_log import open_run_log
+from transfer_metrics import write_run_metrics
+from upload_pool import get_max_workers, order_shortest_first, run_upload_pool
+
+DEFAULT_BATCH_SECONDS = 1.0
+# A hand-off that takes longer than this falls back to uploading in-process
+HANDOFF_TIMEOUT_SECONDS = 2.0
+
+def get_batch_seconds(config_values):
+    """How long the service waits for more files after one arrives (ServiceBatchSeconds)."""
+    value = config_values.get('ServiceBatchSeconds')
+    if not value:
+        return DEFAULT_BATCH_SECONDS
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        print(f"Invalid ServiceBatchSeconds '{value}', using {DEFAULT_BATCH_SECONDS}")
+        return DEFAULT_BATCH_SECONDS
+
+def get_service_dir():
+    """A folder only the current user can read: %LOCALAPPDATA% on Windows, else $XDG_RUNTIME_DIR or ~/.cache."""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), 'AppData', 'Local')
+    else:
+        base = os.environ.get('XDG_RUNTIME_DIR') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'sharepoint_upload')
+
+def get_service_file_path(script_name):
+    """Where a running service of script_name leaves its port and token.
+
+    One file per user and per install folder, so copies of the scripts
+    with different config.txt files never hand files to each other.
+    """
+    script_dir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    install_id = hashlib.sha1(os.path.normcase(script_dir).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(get_service_dir(), f"{script_name}_{install_id}_service.json")
+
+def _send(service_file_path, message):
+    """Send one request to the service described by service_file_path; its reply, or None."""
+    try:
+        with open(service_file_path, 'r') as f:
+            service = json.load(f)
+        with socket.create_connection(('127.0.0.1', service['port']), timeout=HANDOFF_TIMEOUT_SECONDS) as sock:
+            sock.sendall(json.dumps(dict(message, token=service['token'])).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as reply:
+                return json.loads(reply.readline())
+    except (OSError, ValueError, KeyError):
+        return None
+
+def hand_off(script_name, file_paths):
+    """Queue file_paths with the running service of script_name.
+
+    Returns True once the service has accepted them, and False when no
+    service is running (or it did not answer), so the caller uploads them
+    itself.
+    """
+    reply = _send(get_service_file_path(script_name), {'paths': [os.path.abspath(path) for path in file_paths]})
+    return bool(reply and reply.get('queued') is not None)
+
+class UploadService:
+    """Accepts file paths from per-file invocations on a local socket.
+
+    The socket listens on 127.0.0.1 on a free port. The port and a random
+    token go into a service file in the user's own profile (see
+    get_service_dir; the 0600 mode only matters outside Windows, where the
+    profile's ACL does the same job), and requests without the token are
+    refused.
+    Paths are deduplicated while they wait, and take_batch() returns them
+    once no new path has arrived for batch_seconds, so a "Send to" on
+    dozens of files becomes one upload run.
+    """
+
+    def __init__(self, script_name, batch_seconds=DEFAULT_BATCH_SECONDS):
+        self.service_file_path = get_service_file_path(script_name)
+        self.batch_seconds = batch_seconds
+        self._token = secrets.token_hex(16)
+        self._lock = threading.Lock()
+        self._arrived = threading.Event()
+        self._paths = {}  # normalized path -> path as given, in arrival order
+        self._last_arrival = 0.0
+        self._server = None
+
+    def start(self):
+        """Listen and publish the service file; False if another service is already running."""
+        if _send(self.service_file_path, {'paths': []}) is not None:
+            return False
+        self._server = socket.create_server(('127.0.0.1', 0))
+        port = self._server.getsockname()[1]
+        os.makedirs(os.path.dirname(self.service_file_path), mode=0o700, exist_ok=True)
+        tmp_path = f"{self.service_file_path}.tmp"
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump({'port': port, 'token': self._token, 'pid': os.getpid()}, f)
+        os.replace(tmp_path, self.service_file_path)
+        threading.Thread(target=self._accept, name='service', daemon=True).start()
+        return True
+
+    def stop(self):
+        try:
+            os.remove(self.service_file_path)
+        except OSError:
+            pass
+        if self._server:
+            self._server.close()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return  # Closed by stop()
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def _handle(self, connection):
+        with connection:
+            connection.settimeout(HANDOFF_TIMEOUT_SECONDS)
+            try:
+                with connection.makefile('rb') as request_file:
+                    request = json.loads(request_file.readline())
+                if not secrets.compare_digest(str(request.get('token')), self._token):
+                    reply = {'error': 'bad token'}
+                else:
+                    reply = {'queued': self.add(request.get('paths') or [])}
+                connection.sendall(json.dumps(reply).encode('utf-8') + b'\n')
+            except (OSError, ValueError, AttributeError):
+                pass
+
+    def add(self, paths):
+        """Queue paths, ignoring ones already waiting; returns how many are waiting."""
+        with self._lock:
+            for path in paths:
+                self._paths.setdefault(os.path.normcase(os.path.normpath(path)), path)
+            if paths:
+                self._last_arrival = time.monotonic()
+                self._arrived.set()
+            return len(self._paths)
+
+    def take_batch(self):
+        """Block until paths have arrived and gone quiet for batch_seconds, then return them all."""
+        while True:
+            self._arrived.wait()
+            with self._lock:
+                quiet_for = time.monotonic() - self._last_arrival
+                if quiet_for >= self.batch_seconds:
+                    paths = list(self._paths.values())
+                    self._paths.clear()
+                    self._arrived.clear()
+                    return paths
+            time.sleep(self.batch_seconds - quiet_for)
+
+def serve_uploads(ctx, config_values, script_name, upload_one, success_status='Successful'):
+    """Run the resident service of script_name, uploading queued files until interrupted.
+
+    Every batch goes through the worker pool with the same signed-in ctx,
+    one pool run per source folder, into DestinationFolderURL.
+    """
+    target_folder_url = config_values.get('DestinationFolderURL')
+    max_workers = get_max_workers(config_values)
+    run_log = open_run_log(config_values)
+    service = UploadService(script_name, get_batch_seconds(config_values))
+    if not service.start():
+        print(f"The {script_name} service is already running")
+        return False
+    print(f"Upload service ready; {script_name} <file> now queues files here (Ctrl+C to stop)")
+
+    try:
+        while True:
+            by_folder = {}
+            for path in service.take_batch():
+                by_folder.setdefault(os.path.dirname(path), []).append(os.path.basename(path))
+            for source_folder_path, file_names in by_folder.items():
+                pending_files, missing_files = order_shortest_first(source_folder_path, file_names)
+                for file_name in missing_files:
+                    print(f"✗ {file_name}: not found in {source_folder_path}")
+                if not pending_files:
+                    continue
+                print(f"Uploading {len(pending_files)} queued file(s) from {source_folder_path}")
+                uploaded_files = set()
+
+                def on_result(file_name, error):
+                    hashes = pop_hash(os.path.join(source_folder_path, file_name))
+                    if error is None:
+                        print(f"✓ {file_name}")
+                        uploaded_files.add(file_name)
+                    else:
+                        print(f"✗ {file_name}: {str(error)}")
+                    if run_log:
+                        run_log.append(file_name, success_status if error is None else 'Failed', **hashes)
+
+                run_upload_pool(ctx, target_folder_url, pending_files, upload_one, max_workers, on_result)
+
+                if uploaded_files and is_verification_enabled(config_values):
+                    expected_sizes = {name: size for name, _, size in pending_files if name in uploaded_files}
+                    try:
+                        problems = reconcile_uploads(ctx, target_folder_url, expected_sizes)
+                    except Exception as e:
+                        print(f"Bulk verification skipped: {str(e)}")
+                        problems = {}
+                    for file_name, reason in problems.items():
+                        print(f"Verification failed for {file_name}: {reason}")
+                        if run_log:
+                            run_log.append(file_name, 'Verification Failed')
+            if run_log:
+                run_log.flush()
+            write_run_metrics(config_values)
+    except KeyboardInterrupt:
+        print("Stopping upload service")
+    finally:
+        service.stop()
+        if run_log:
+            run_log.close()
+    return True